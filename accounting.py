@@ -0,0 +1,273 @@
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Resource and I/O accounting for cli.py commands (see the global --resource-report argument).
+
+HTTP requests are recorded at the urllib3 connection pool level, which is shared by
+`requests` (and thus `http_requests.AuthenticatedRequestBuilder` and github3 sessions) and the
+kubernetes client. Subprocesses are recorded when they are waited for (which `subprocess.run`
+and friends do). Opened files are recorded using an audit hook.
+'''
+
+import math
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+
+def _percentile(values, percent):
+    # nearest-rank method
+    ordered = sorted(values)
+    index = max(0, math.ceil(percent / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def _body_length(body):
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    if isinstance(body, str):
+        return len(body.encode('utf-8'))
+    return 0
+
+
+class HostStats(object):
+    def __init__(self):
+        self.latencies = []
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+
+class ResourceAccounting(object):
+    '''
+    Collects resource usage of the current process from the time `install` is called.
+    There is at most one installed instance per process (see `install`).
+    '''
+    _installed = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hosts = {}
+        self.subprocesses = []
+        self.files = {}
+        self._local = threading.local()
+        self._start = None
+        self._restore = []
+
+    @staticmethod
+    def installed():
+        return ResourceAccounting._installed
+
+    def install(self):
+        if ResourceAccounting._installed:
+            raise RuntimeError('resource accounting is already installed')
+        ResourceAccounting._installed = self
+        self._start = time.perf_counter()
+        self._install_http_hook()
+        self._install_subprocess_hook()
+        _add_audit_hook()
+
+    def uninstall(self):
+        for owner, name, original in reversed(self._restore):
+            setattr(owner, name, original)
+        self._restore = []
+        ResourceAccounting._installed = None
+
+    def _patch(self, owner, name, replacement):
+        self._restore.append((owner, name, getattr(owner, name)))
+        setattr(owner, name, replacement)
+
+    def _install_http_hook(self):
+        try:
+            from urllib3.connectionpool import HTTPConnectionPool
+            from urllib3.response import HTTPResponse
+        except ImportError:
+            return
+        original_urlopen = HTTPConnectionPool.urlopen
+        original_read = HTTPResponse.read
+        original_read_chunked = HTTPResponse.read_chunked
+        accounting = self
+
+        def urlopen(pool, method, url, body=None, *args, **kwargs):
+            # urlopen calls itself for retries - only record the outermost call
+            depth = getattr(accounting._local, 'urlopen_depth', 0)
+            accounting._local.urlopen_depth = depth + 1
+            start = time.perf_counter()
+            try:
+                response = original_urlopen(pool, method, url, body, *args, **kwargs)
+            finally:
+                accounting._local.urlopen_depth = depth
+            if depth == 0:
+                accounting.record_http_request(
+                    host=pool.host,
+                    latency=time.perf_counter() - start,
+                    bytes_sent=_body_length(body),
+                )
+            return response
+
+        # count the body bytes actually read (after content decoding) rather than trusting
+        # Content-Length, which is absent for chunked and may be unset for streamed responses
+        def read(response, *args, **kwargs):
+            data = original_read(response, *args, **kwargs)
+            if data:
+                accounting._record_bytes_received(response, len(data))
+            return data
+
+        def read_chunked(response, *args, **kwargs):
+            for chunk in original_read_chunked(response, *args, **kwargs):
+                accounting._record_bytes_received(response, len(chunk))
+                yield chunk
+
+        self._patch(HTTPConnectionPool, 'urlopen', urlopen)
+        self._patch(HTTPResponse, 'read', read)
+        self._patch(HTTPResponse, 'read_chunked', read_chunked)
+
+    def _record_bytes_received(self, response, count):
+        pool = getattr(response, '_pool', None)
+        if pool is None:
+            return
+        with self.lock:
+            self.hosts.setdefault(pool.host, HostStats()).bytes_received += count
+
+    def _install_subprocess_hook(self):
+        original_init = subprocess.Popen.__init__
+        original_wait = subprocess.Popen.wait
+        accounting = self
+
+        def init(popen, args, *posargs, **kwargs):
+            popen._accounting_start = time.perf_counter()
+            popen._accounting_args = args
+            original_init(popen, args, *posargs, **kwargs)
+
+        def wait(popen, *args, **kwargs):
+            result = original_wait(popen, *args, **kwargs)
+            start = getattr(popen, '_accounting_start', None)
+            if start is not None:
+                popen._accounting_start = None
+                accounting.record_subprocess(
+                    args=popen._accounting_args,
+                    duration=time.perf_counter() - start,
+                    returncode=popen.returncode,
+                )
+            return result
+
+        self._patch(subprocess.Popen, '__init__', init)
+        self._patch(subprocess.Popen, 'wait', wait)
+
+    def record_http_request(self, host, latency, bytes_sent=0, bytes_received=0):
+        with self.lock:
+            stats = self.hosts.setdefault(host, HostStats())
+            stats.latencies.append(latency)
+            stats.bytes_sent += bytes_sent
+            stats.bytes_received += bytes_received
+
+    def record_subprocess(self, args, duration, returncode):
+        if not isinstance(args, str):
+            args = ' '.join(map(str, args))
+        with self.lock:
+            self.subprocesses.append((args, duration, returncode))
+
+    def record_file(self, path, written: bool):
+        with self.lock:
+            self.files[path] = self.files.get(path, False) or written
+
+    def write_report(self, stream=None):
+        stream = stream or sys.stderr
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+        def out(line=''):
+            stream.write(line + '\n')
+
+        with self.lock:
+            out('resource report')
+            out('  wall time: {t:.3f}s'.format(t=time.perf_counter() - self._start))
+            out('  cpu time:  {t:.3f}s (user: {u:.3f}s, system: {s:.3f}s, subprocesses: {c:.3f}s)'.format(
+                t=own.ru_utime + own.ru_stime,
+                u=own.ru_utime,
+                s=own.ru_stime,
+                c=children.ru_utime + children.ru_stime,
+                )
+            )
+            # ru_maxrss is reported in KiB on linux
+            out('  peak rss:  {r:.1f} MiB'.format(r=own.ru_maxrss / 1024))
+
+            out('  http requests: {n}'.format(n=sum(len(s.latencies) for s in self.hosts.values())))
+            if self.hosts:
+                out('    {h:<40} {n:>6} {s:>10} {r:>10} {p50:>8} {p90:>8} {p99:>8}'.format(
+                    h='host', n='count', s='sent [B]', r='recv [B]', p50='p50', p90='p90', p99='p99'
+                    )
+                )
+            ordered_hosts = sorted(self.hosts.items(), key=lambda i: -sum(i[1].latencies))
+            for host, stats in ordered_hosts:
+                if not stats.latencies:
+                    # body already being read while the request is not yet recorded
+                    continue
+                out('    {h:<40} {n:>6} {s:>10} {r:>10} {p50:>7.3f}s {p90:>7.3f}s {p99:>7.3f}s'.format(
+                    h=host,
+                    n=len(stats.latencies),
+                    s=stats.bytes_sent,
+                    r=stats.bytes_received,
+                    p50=_percentile(stats.latencies, 50),
+                    p90=_percentile(stats.latencies, 90),
+                    p99=_percentile(stats.latencies, 99),
+                    )
+                )
+
+            out('  subprocesses: {n}'.format(n=len(self.subprocesses)))
+            for args, duration, returncode in self.subprocesses:
+                out('    {d:>8.3f}s (exit code {r}): {a}'.format(d=duration, r=returncode, a=args))
+
+            read = sorted(p for p, written in self.files.items() if not written)
+            written = sorted(p for p, written in self.files.items() if written)
+            out('  files read: {n}'.format(n=len(read)))
+            for path in read:
+                out('    ' + path)
+            out('  files written: {n}'.format(n=len(written)))
+            for path in written:
+                out('    ' + path)
+        stream.flush()
+
+
+_audit_hook_added = False
+
+def _add_audit_hook():
+    global _audit_hook_added
+    if not _audit_hook_added:
+        sys.addaudithook(_audit_hook)
+        _audit_hook_added = True
+
+
+def _audit_hook(event, args):
+    # audit hooks cannot be removed - thus check whether accounting is still installed
+    if event != 'open':
+        return
+    accounting = ResourceAccounting._installed
+    if not accounting:
+        return
+    path, mode, flags = args
+    if not isinstance(path, str):
+        return # file descriptors
+    if path.endswith(('.py', '.pyc', '.so')):
+        return # imports
+    if not mode and os.path.isdir(path):
+        return # directories opened via os.open (e.g. by shutil.rmtree)
+    if mode:
+        written = any(c in mode for c in 'wax+')
+    else:
+        written = bool(flags & (os.O_WRONLY | os.O_RDWR | os.O_CREAT))
+    accounting.record_file(path, written=written)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Measures model.ConfigFactory element lookups (as done by e.g. `ConfigurationSet.github()` in
+loops) for a configuration with thousands of elements, with and without cached elements.
+
+usage: benchmark/cfg_factory.py [<element_count>]
+'''
+
+import os
+import sys
+import timeit
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, SRC_DIR)
+
+from model import ConfigFactory # noqa
+
+
+def github_cfg(i):
+    return {
+        'sshUrl': 'ssh://git@github{i}.example.org'.format(i=i),
+        'httpUrl': 'https://github{i}.example.org'.format(i=i),
+        'apiUrl': 'https://github{i}.example.org/api/v3'.format(i=i),
+        'disable_tls_validation': False,
+        'webhook_token': 'token',
+        'technicalUser': {
+            'username': 'user',
+            'password': 'passwd',
+            'authToken': 'token',
+            'privateKey': 'key',
+        },
+    }
+
+
+def cfg_dict(element_count):
+    cfg_types = {
+        'github': {'model': {'cfg_type_name': 'github', 'type': 'GithubConfig'}},
+        'cfg_set': {'model': {'cfg_type_name': 'cfg_set', 'type': 'ConfigurationSet'}},
+    }
+    # add some more types, as the type index used to be recomputed for each lookup
+    for i in range(20):
+        name = 'type{i}'.format(i=i)
+        cfg_types[name] = {'model': {'cfg_type_name': name, 'type': 'NamedModelElement'}}
+
+    return {
+        'cfg_types': cfg_types,
+        'github': {'github{i}'.format(i=i): github_cfg(i) for i in range(element_count)},
+        'cfg_set': {
+            'set{i}'.format(i=i): {'github': 'github{i}'.format(i=i)}
+            for i in range(element_count)
+        },
+    }
+
+
+def lookup_all(factory, element_count, invalidate):
+    for i in range(element_count):
+        if invalidate:
+            # drop all caches (i.e. behave like a factory without caches)
+            factory.invalidate()
+        factory.cfg_set('set{i}'.format(i=i)).github().api_url()
+
+
+def main():
+    element_count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    factory = ConfigFactory.from_dict(cfg_dict(element_count))
+
+    uncached = timeit.timeit(lambda: lookup_all(factory, element_count, True), number=3)
+    # first run populates the caches
+    lookup_all(factory, element_count, False)
+    cached = timeit.timeit(lambda: lookup_all(factory, element_count, False), number=3)
+
+    print('{n} elements, 3 x lookup of each element'.format(n=element_count))
+    print('uncached: {t:.3f}s'.format(t=uncached))
+    print('cached:   {t:.3f}s'.format(t=cached))
+
+
+if __name__ == '__main__':
+    main()
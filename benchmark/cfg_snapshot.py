@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Compares the time to create a model.ConfigFactory and look up a single element from a
+serialised configuration (with many elements spread across cfg types), using the json and
+the snapshot format.
+
+usage: benchmark/cfg_snapshot.py [<element_count>]
+'''
+
+import json
+import os
+import sys
+import tempfile
+import timeit
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, SRC_DIR)
+
+from cfg_factory import github_cfg # noqa
+from model import ConfigFactory, ConfigSetSerialiser # noqa
+
+
+TYPE_COUNT = 20
+
+
+def cfg_dict(element_count):
+    # elements are evenly spread across cfg types
+    cfg_types = {'cfg_set': {'model': {'cfg_type_name': 'cfg_set', 'type': 'ConfigurationSet'}}}
+    raw = {}
+    for i in range(TYPE_COUNT):
+        name = 'github{i}'.format(i=i)
+        cfg_types[name] = {'model': {'cfg_type_name': name, 'type': 'GithubConfig'}}
+        raw[name] = {
+            'element{j}'.format(j=j): github_cfg(j) for j in range(element_count // TYPE_COUNT)
+        }
+    all_elements = {
+        name: {'config_names': list(elements.keys()), 'default': 'element0'}
+        for name, elements in raw.items()
+    }
+    raw['cfg_set'] = {'set0': all_elements}
+    raw['cfg_types'] = cfg_types
+    return raw
+
+
+def load_json(path):
+    with open(path) as f:
+        factory = ConfigFactory.from_dict(json.load(f))
+    factory.cfg_set('set0')._cfg_element('github0').api_url()
+
+
+def load_snapshot(path):
+    factory = ConfigFactory.from_snapshot(path)
+    factory.cfg_set('set0')._cfg_element('github0').api_url()
+
+
+def main():
+    element_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    factory = ConfigFactory.from_dict(cfg_dict(element_count))
+    serialiser = ConfigSetSerialiser(
+        cfg_sets=[factory.cfg_set('set0')],
+        cfg_factory=factory,
+    )
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        json_file = os.path.join(tmpdir, 'cfg.json')
+        with open(json_file, 'w') as f:
+            f.write(serialiser.serialise(output_format='json'))
+        snapshot_file = os.path.join(tmpdir, 'cfg.snapshot')
+        with open(snapshot_file, 'wb') as f:
+            f.write(serialiser.serialise(output_format='snapshot'))
+
+        print('{n} elements, create factory and look up one element (mean of 10 runs)'.format(
+            n=element_count,
+            )
+        )
+        for name, path, load in (
+            ('json', json_file, load_json),
+            ('snapshot', snapshot_file, load_snapshot),
+        ):
+            duration = timeit.timeit(lambda: load(path), number=10) / 10
+            print('{f:<9} {s:>10} bytes {t:8.4f}s'.format(
+                f=name,
+                s=os.path.getsize(path),
+                t=duration,
+                )
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Measures the cold start time of cli.py for a handful of representative commands.
+
+usage: benchmark/cli_startup.py [<repetitions>]
+'''
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+CLI_PY = os.path.join(SRC_DIR, 'cli.py')
+
+COMMANDS = (
+    ['util', 'info', '--msg', 'benchmark'],
+    ['versionutil', 'process_version', '--help'],
+    ['config', '--help'],
+    ['concourseutil', '--help'],
+    ['--help'],
+)
+
+
+def measure(argv, repetitions):
+    timings = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, CLI_PY] + argv,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    # warm-up (also ensures the subcommand manifest exists)
+    measure(['--help'], 1)
+
+    print('{c:<45} {mi:>9} {me:>9} {ma:>9}'.format(c='command', mi='min', me='median', ma='max'))
+    for argv in COMMANDS:
+        timings = measure(argv, repetitions)
+        print('{c:<45} {mi:>8.3f}s {me:>8.3f}s {ma:>8.3f}s'.format(
+            c=' '.join(argv),
+            mi=min(timings),
+            me=statistics.median(timings),
+            ma=max(timings),
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Compares API calls issued via http_requests.AuthenticatedRequestBuilder against a local HTTPS
+server (standing in for concourse / protecode) using a new connection per call (as done
+before, using the module-level `requests` functions) and the pooled, kept-alive sessions.
+Requires `openssl` (to create a self-signed certificate).
+
+usage: benchmark/http_session.py [<call_count>]
+'''
+
+import http.server
+import json
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+import urllib3
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, SRC_DIR)
+
+import http_requests # noqa
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately - avoid delayed ACKs on kept-alive connections
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        body = json.dumps({'path': self.path}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def https_server(tmpdir):
+    cert_file = os.path.join(tmpdir, 'cert.pem')
+    key_file = os.path.join(tmpdir, 'key.pem')
+    subprocess.run(
+        [
+            'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+            '-subj', '/CN=localhost', '-keyout', key_file, '-out', cert_file,
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_file, key_file)
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.daemon_threads = True
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    server.connections = set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class _UnpooledRequestBuilder(http_requests.AuthenticatedRequestBuilder):
+    # behaves like the builder did before (a new session, i.e. connection, per request)
+    def get(self, url, return_type='json', **kwargs):
+        self.session = requests.Session()
+        try:
+            return super().get(url, return_type=return_type, **kwargs)
+        finally:
+            self.session.close()
+
+
+def main():
+    call_count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    urllib3.disable_warnings() # self-signed certificate
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        server = https_server(tmpdir)
+        url = 'https://127.0.0.1:{p}/api/v1/'.format(p=server.server_port)
+
+        print('{n} calls against a local https server'.format(n=call_count))
+        for name, builder in (
+            ('connection per call', _UnpooledRequestBuilder(auth_token='token', verify_ssl=False)),
+            ('pooled session', http_requests.AuthenticatedRequestBuilder(
+                auth_token='token',
+                verify_ssl=False,
+            )),
+        ):
+            server.connections = set()
+            start = time.perf_counter()
+            for i in range(call_count):
+                builder.get(url + str(i))
+            duration = time.perf_counter() - start
+            print('{n:<20} {t:8.3f}s {c:5d} connections'.format(
+                n=name,
+                t=duration,
+                c=len(server.connections),
+                )
+            )
+
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
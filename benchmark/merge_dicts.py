@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Compares util.merge_dicts with the previous (deepmerge-based) implementation by merging a
+base definition with each variant of pipeline definitions with hundreds of variants (as done
+by concourse.pipelines.factory.DefinitionFactory).
+
+usage: benchmark/merge_dicts.py [<variant count>]
+
+requires deepmerge (see benchmark/requirements.txt)
+'''
+
+import os
+import sys
+import time
+
+from copy import deepcopy
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, SRC_DIR)
+
+from util import merge_dicts # noqa
+
+
+def legacy_merge_dicts(base: dict, other: dict):
+    # previous implementation of util.merge_dicts (with list_semantics='set_merge')
+    from deepmerge import Merger
+
+    list_merge_strategy = Merger.PROVIDED_TYPE_STRATEGIES[list]
+    list_merge_strategy.strategy_merge = lambda c, p, base, other: list(set(base) | set(other))
+
+    strategy_cfg = [(list, ['merge']), (dict, ['merge'])]
+    merger = Merger(strategy_cfg, ['override'], ['override'])
+    return merger.merge(deepcopy(base), deepcopy(other))
+
+
+def pipeline_definition(variant_count):
+    base_definition = {
+        'repo': {'path': 'org/repo', 'branch': 'master', 'trigger': True},
+        'steps': {
+            'step{i}'.format(i=i): {
+                'image': 'eu.gcr.io/org/image:1.0.{i}'.format(i=i),
+                'depends': ['step{j}'.format(j=j) for j in range(i)],
+                'output_dir': 'out{i}'.format(i=i),
+            }
+            for i in range(10)
+        },
+        'traits': {
+            'version': {'preprocess': 'finalise'},
+            'publish': {'dockerimages': {'image': {'registry': 'gcr', 'image': 'eu.gcr.io/org/img'}}},
+        },
+    }
+    variants = {
+        'variant{i}'.format(i=i): {
+            'traits': {'version': {'preprocess': 'inject-commit-hash'}},
+            'steps': {'step0': {'depends': ['extra{i}'.format(i=i)]}},
+        }
+        for i in range(variant_count)
+    }
+    return base_definition, variants
+
+
+def measure(description, merge, base_definition, variants):
+    start = time.perf_counter()
+    for variant in variants.values():
+        merge(base_definition, variant)
+    print('{d:<35} {t:>8.3f}s'.format(d=description, t=time.perf_counter() - start))
+
+
+def main():
+    variant_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    base_definition, variants = pipeline_definition(variant_count)
+
+    print('merging {n} variants'.format(n=variant_count))
+    measure('deepmerge (previous)', legacy_merge_dicts, base_definition, variants)
+    measure('merge_dicts', merge_dicts, base_definition, variants)
+    measure(
+        'merge_dicts (copy=False)',
+        lambda base, other: merge_dicts(base, other, copy=False),
+        base_definition,
+        variants,
+    )
+
+
+if __name__ == '__main__':
+    main()
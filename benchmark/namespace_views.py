@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Compares util.SimpleNamespaceDict and util.NamespaceView (as used by model.base.ModelBase
+and the concourse client models) with respect to time and allocated memory of repeated
+getter calls.
+
+usage: benchmark/namespace_views.py [<iterations>]
+'''
+
+import os
+import sys
+import timeit
+import tracemalloc
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, SRC_DIR)
+
+from util import NamespaceView, SimpleNamespaceDict # noqa
+
+
+def concourse_cfg_dict(team_count=20):
+    teams = {
+        'team{i}'.format(i=i): {
+            'teamname': 'team{i}'.format(i=i),
+            'username': 'user',
+            'password': 'passwd',
+            'gitAuthTeam': 'org/team',
+        }
+        for i in range(team_count)
+    }
+    teams['main'] = dict(teams['team0'], teamname='main')
+    return {
+        'externalUrl': 'https://concourse.example.org',
+        'proxyUrl': 'https://proxy.example.org',
+        'helm_chart_default_values_config': 'default',
+        'teams': teams,
+    }
+
+
+def build_dict():
+    return {
+        'id': 42,
+        'start_time': 1500000000,
+        'end_time': 1500000100,
+        'status': 'succeeded',
+        'inputs': [{'name': 'source', 'version': {'ref': 'abc'}} for _ in range(10)],
+    }
+
+
+def config_model_access(view):
+    # mimics model.ConcourseConfig getters (team_credentials, external_url, ..)
+    view.teams['main'].teamname
+    view.teams['main'].gitAuthTeam
+    view.externalUrl
+    view.proxyUrl
+
+
+def pipeline_model_access(view):
+    # mimics concourse.client.Build getters and iterating nested lists twice
+    view.id
+    view.status
+    for _ in range(2):
+        for build_input in view.inputs:
+            build_input.version
+
+
+SCENARIOS = (
+    ('config model', concourse_cfg_dict, config_model_access),
+    ('pipeline model', build_dict, pipeline_model_access),
+)
+
+
+def allocated_bytes(function, iterations):
+    # peak of traced memory - short-lived wrappers (as created by SimpleNamespaceDict for
+    # each access to a nested dict) increase the peak, memoised ones do not
+    tracemalloc.start()
+    try:
+        for _ in range(iterations):
+            function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    print('{s:<16} {w:<20} {t:>10} {a:>14}'.format(
+        s='scenario', w='wrapper', t='time', a='peak alloc [B]')
+    )
+    for scenario, raw_factory, access in SCENARIOS:
+        raw = raw_factory()
+        for wrapper in (SimpleNamespaceDict, NamespaceView):
+            view = wrapper(raw)
+            access_fn = lambda: access(view)
+            duration = timeit.timeit(access_fn, number=iterations)
+            peak = allocated_bytes(access_fn, min(iterations, 1000))
+            print('{s:<16} {w:<20} {t:>9.3f}s {a:>14}'.format(
+                s=scenario,
+                w=wrapper.__name__,
+                t=duration,
+                a=peak,
+                )
+            )
+
+
+if __name__ == '__main__':
+    main()
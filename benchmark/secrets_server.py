@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Measures the throughput of concurrent clients retrieving a serialised configuration from a
+local secrets server (secretsserver.py), compared to `python3 -m http.server` (which was used
+before). Both servers run in separate processes. Clients retrieve the whole configuration
+(uncompressed or gzip-compressed), revalidate it (If-None-Match) or retrieve a single cfg_set.
+
+usage: benchmark/secrets_server.py [<client_count>]
+'''
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, SRC_DIR)
+
+from cfg_snapshot import cfg_dict # noqa
+
+
+ELEMENT_COUNT = 2000
+REQUESTS_PER_CLIENT = 50
+CFG_PATH = 'concourse-secrets/concourse_cfg'
+
+
+def run_clients(url, client_count, headers=None):
+    # returns requests per second
+    barrier = threading.Barrier(client_count + 1)
+
+    def run():
+        session = requests.Session()
+        barrier.wait()
+        for _ in range(REQUESTS_PER_CLIENT):
+            response = session.get(url, headers=headers)
+            if response.status_code not in (200, 304):
+                raise RuntimeError('unexpected status: ' + str(response.status_code))
+
+    threads = [threading.Thread(target=run) for _ in range(client_count)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return client_count * REQUESTS_PER_CLIENT / (time.perf_counter() - start)
+
+
+def start_server(command):
+    # command: may contain '{port}'. Returns the server process and its url
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen(
+        [arg.format(port=port) for arg in command],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = 'http://127.0.0.1:{p}/'.format(p=port)
+    for _ in range(100):
+        try:
+            requests.get(url)
+            return process, url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('server did not start: ' + ' '.join(command))
+
+
+def main():
+    client_count = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+
+    with tempfile.TemporaryDirectory() as secrets_dir:
+        os.makedirs(os.path.join(secrets_dir, os.path.dirname(CFG_PATH)))
+        with open(os.path.join(secrets_dir, CFG_PATH), 'w') as f:
+            json.dump(cfg_dict(ELEMENT_COUNT), f)
+
+        http_server, http_server_url = start_server([
+            sys.executable, '-m', 'http.server', '--bind', '127.0.0.1',
+            '--directory', secrets_dir, '{port}',
+        ])
+        secrets_server, secrets_server_url = start_server([
+            sys.executable, os.path.join(SRC_DIR, 'secretsserver.py'),
+            '--secrets-dir', secrets_dir, '--host', '127.0.0.1', '--port', '{port}',
+        ])
+        try:
+            etag = requests.get(secrets_server_url + CFG_PATH).headers['ETag']
+            identity = {'Accept-Encoding': 'identity'}
+
+            print('{c} clients, {r} requests each, {s} bytes cfg ({n} elements)'.format(
+                c=client_count,
+                r=REQUESTS_PER_CLIENT,
+                s=os.path.getsize(os.path.join(secrets_dir, CFG_PATH)),
+                n=ELEMENT_COUNT,
+                )
+            )
+            for name, url, headers in (
+                ('http.server', http_server_url + CFG_PATH, identity),
+                ('secretsserver', secrets_server_url + CFG_PATH, identity),
+                ('secretsserver (gzip)', secrets_server_url + CFG_PATH, None),
+                ('secretsserver (304)', secrets_server_url + CFG_PATH, {'If-None-Match': etag}),
+                ('secretsserver (cfg_set)', secrets_server_url + CFG_PATH + '/set0', identity),
+            ):
+                print('{n:<24} {r:10.1f} requests/s'.format(
+                    n=name,
+                    r=run_clients(url, client_count, headers=headers),
+                    )
+                )
+        finally:
+            for server in (http_server, secrets_server):
+                server.terminate()
+                server.wait()
+
+
+if __name__ == '__main__':
+    main()
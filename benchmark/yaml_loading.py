@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Measures parsing a (generated) configuration directory with model.ConfigFactory.from_cfg_dir:
+cold (empty caches), warm from the on-disk cache (as for a new process) and warm from the
+in-process cache. The pure-python yaml loader is shown for comparison.
+
+usage: benchmark/yaml_loading.py [<elements per cfg type>]
+'''
+
+import os
+import sys
+import tempfile
+import time
+
+import yaml
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, SRC_DIR)
+
+import util # noqa
+from model import ConfigFactory # noqa
+
+CFG_TYPES = ('github', 'concourse', 'container_registry', 'protecode')
+
+
+def write_cfg_dir(cfg_dir, element_count):
+    cfg_types = {}
+    for cfg_type in CFG_TYPES:
+        cfg_types[cfg_type] = {
+            'model': {'cfg_type_name': cfg_type, 'type': 'NamedModelElement'},
+            'src': [{'file': cfg_type + '.yaml'}],
+        }
+        elements = {
+            '{t}-{i}'.format(t=cfg_type, i=i): {
+                'url': 'https://{t}-{i}.example.org'.format(t=cfg_type, i=i),
+                'credentials': {'username': 'user', 'password': 'passwd'},
+                'teams': {'team{j}'.format(j=j): {'username': 'u', 'password': 'p'} for j in range(5)},
+            }
+            for i in range(element_count)
+        }
+        with open(os.path.join(cfg_dir, cfg_type + '.yaml'), 'w') as f:
+            yaml.dump(elements, f)
+    with open(os.path.join(cfg_dir, 'config_types.yaml'), 'w') as f:
+        yaml.dump(cfg_types, f)
+
+
+def measure(description, cfg_dir):
+    start = time.perf_counter()
+    ConfigFactory.from_cfg_dir(cfg_dir)
+    print('{d:<35} {t:>8.3f}s'.format(d=description, t=time.perf_counter() - start))
+
+
+def main():
+    element_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cfg_dir = os.path.join(tmpdir, 'cfg')
+        os.mkdir(cfg_dir)
+        write_cfg_dir(cfg_dir, element_count)
+
+        util._parsed_yaml_files = util.ParsedFileCache()
+        util._YAML_LOADER = yaml.SafeLoader
+        measure('cold (pure-python loader)', cfg_dir)
+
+        util._parsed_yaml_files = util.ParsedFileCache(cache_dir=os.path.join(tmpdir, 'cache'))
+        util._YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+        measure('cold ({l})'.format(l=util._YAML_LOADER.__name__), cfg_dir)
+
+        util._parsed_yaml_files = util.ParsedFileCache(cache_dir=os.path.join(tmpdir, 'cache'))
+        measure('warm (on-disk cache)', cfg_dir)
+        measure('warm (in-process cache)', cfg_dir)
+
+
+if __name__ == '__main__':
+    main()
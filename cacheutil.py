@@ -0,0 +1,393 @@
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+A persistent key/value cache, shared between processes (e.g. concurrent concourse tasks
+running on the same worker).
+
+Usage:
+------
+
+    import cacheutil
+    cache = cacheutil.DiskCache(namespace='github', default_ttl=600)
+    email = cache.get_or_create(username, lambda: retrieve_email(username))
+
+Entries are stored as one file per key below `<cache_dir>/<namespace>`. Writes are atomic
+(write to a temporary file, then rename); modifications and evictions are serialised using a
+lock file per namespace, the creation of entries (see `DiskCache.get_or_create`) using a lock
+file per key. The total size of a namespace's entries is tracked in a file; least recently
+used entries are evicted once it exceeds the namespace's size limit.
+
+As values are stored pickled, the cache directory must only be writable by the current user:
+directories not owned by the current user, a namespace directory accessible by other users or
+a cache directory writable by other users are refused (raising `UnsafeCacheDirectoryError`).
+'''
+
+import contextlib
+import fcntl
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+from util import CliHints, info, verbose
+
+CACHE_DIR_ENV_VAR = 'CC_CACHE_DIR'
+_LOCK_FILE_NAME = '.lock'
+_SIZE_FILE_NAME = '.size'
+_ENTRY_SUFFIX = '.entry'
+_KEY_LOCK_SUFFIX = '.lock'
+
+
+class UnsafeCacheDirectoryError(PermissionError):
+    pass
+
+
+def default_cache_dir():
+    cache_dir = os.environ.get(CACHE_DIR_ENV_VAR)
+    if cache_dir:
+        return cache_dir
+    xdg_cache_home = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(xdg_cache_home, 'cc-utils')
+
+
+class DiskCache(object):
+    '''
+    Namespaced, size-bounded on-disk cache with optional expiry of entries.
+
+    @param namespace: entries of different namespaces are stored (and evicted) separately
+    @param cache_dir: defaults to $CC_CACHE_DIR (or ~/.cache/cc-utils)
+    @param max_size: max. size of all entries of this namespace in bytes
+    @param default_ttl: time-to-live of entries in seconds (`None`: entries do not expire)
+
+    `hits` and `misses` count the lookups done through this instance (they are not persisted).
+    '''
+    def __init__(
+        self,
+        namespace: str,
+        cache_dir: str=None,
+        max_size: int=64 * 1024 * 1024,
+        default_ttl: float=None,
+    ):
+        if not namespace or os.sep in namespace or namespace.startswith('.'):
+            raise ValueError('invalid namespace: ' + str(namespace))
+        self.namespace = namespace
+        self.directory = os.path.join(cache_dir or default_cache_dir(), namespace)
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        self._verified = False
+
+    def _ensure_directory(self):
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        self._verify_directory()
+
+    def _verify_directory(self):
+        # entries are unpickled - other users must not be able to place (or replace) them
+        if self._verified:
+            return
+        for directory, forbidden_modes in (
+            (os.path.dirname(self.directory), 0o022),
+            (self.directory, 0o077),
+        ):
+            stat = os.stat(directory)
+            if stat.st_uid != os.getuid() or stat.st_mode & forbidden_modes:
+                raise UnsafeCacheDirectoryError(
+                    'refusing to use cache directory not exclusively owned by the current user: '
+                    + directory
+                )
+        self._verified = True
+
+    def _entry_file(self, key: str):
+        return os.path.join(
+            self.directory,
+            hashlib.sha256(key.encode('utf-8')).hexdigest() + _ENTRY_SUFFIX,
+        )
+
+    def _key_lock_file(self, entry_file: str):
+        return entry_file[:-len(_ENTRY_SUFFIX)] + _KEY_LOCK_SUFFIX
+
+    @contextlib.contextmanager
+    def lock(self):
+        '''
+        holds the (inter-process) lock of this namespace, which serialises modifications.
+        The lock is reentrant (i.e. `put` etc. may be called while holding it).
+        '''
+        with self._thread_lock:
+            if self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            self._ensure_directory()
+            with open(os.path.join(self.directory, _LOCK_FILE_NAME), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._lock_depth = 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth = 0
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextlib.contextmanager
+    def _key_lock(self, key: str):
+        # (inter-process) lock held while creating the entry for the given key - flock also
+        # excludes other threads, as each opens the lock file separately
+        self._ensure_directory()
+        with open(self._key_lock_file(self._entry_file(key)), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_entry(self, key: str):
+        try:
+            self._verify_directory()
+        except FileNotFoundError:
+            return None
+        entry = self._load_entry_file(self._entry_file(key))
+        if entry is None or entry.get('key') != key:
+            return None # absent or hash collision
+        if self._is_expired(entry):
+            return None
+        return entry
+
+    def _load_entry_file(self, entry_file: str):
+        try:
+            with open(entry_file, 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            verbose('ignoring unreadable cache entry {f}: {e}'.format(f=entry_file, e=e))
+            return None
+
+    def _is_expired(self, entry):
+        return entry['expires'] is not None and entry['expires'] < time.time()
+
+    def get_entry(self, key: str):
+        '''
+        returns the entry stored for the given key as dict (with keys `value`, `expires`,
+        `stored` and `metadata`), or `None` if there is no (unexpired) entry
+        '''
+        entry = self._read_entry(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            # record the access for LRU eviction
+            os.utime(self._entry_file(key))
+        except OSError:
+            pass
+        return entry
+
+    def get(self, key: str, default=None):
+        entry = self.get_entry(key)
+        if entry is None:
+            return default
+        return entry['value']
+
+    def put(self, key: str, value, ttl: float=None, metadata: dict=None):
+        '''
+        stores the given value (which must be pickleable). `metadata` is stored along with the
+        value (see `get_entry`).
+        '''
+        with self.lock():
+            self._write_entry(key, value, ttl, metadata)
+
+    def _write_entry(self, key, value, ttl, metadata):
+        # must only be called while holding the lock
+        if ttl is None:
+            ttl = self.default_ttl
+        now = time.time()
+        entry = {
+            'key': key,
+            'value': value,
+            'stored': now,
+            'expires': now + ttl if ttl is not None else None,
+            'metadata': metadata or {},
+        }
+        data = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        entry_file = self._entry_file(key)
+        try:
+            replaced_size = os.stat(entry_file).st_size
+        except FileNotFoundError:
+            replaced_size = 0
+        fd, tmp_file = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_file, entry_file)
+        except BaseException:
+            os.unlink(tmp_file)
+            raise
+
+        size = self._read_size()
+        if size is None:
+            size = sum(entry_size for _, entry_size, _ in self._entries())
+        else:
+            size += len(data) - replaced_size
+        if size > self.max_size:
+            # the tracked size may be outdated (e.g. entries removed by other means)
+            size = self._evict()
+        self._write_size(size)
+
+    def _read_size(self):
+        # must only be called while holding the lock. Returns None if unknown.
+        try:
+            with open(os.path.join(self.directory, _SIZE_FILE_NAME)) as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_size(self, size: int):
+        # must only be called while holding the lock
+        with open(os.path.join(self.directory, _SIZE_FILE_NAME), 'w') as f:
+            f.write(str(max(size, 0)))
+
+    def get_or_create(self, key: str, create, ttl: float=None):
+        '''
+        returns the cached value for the given key. If absent (or expired), the value is
+        created by calling `create()` and stored. Concurrent callers (also in other processes)
+        wait for the first one to create the value instead of creating it themselves (only
+        callers for the same key wait; the namespace is only locked while storing the value).
+        '''
+        entry = self.get_entry(key)
+        if entry is not None:
+            return entry['value']
+        with self._key_lock(key):
+            # another process may have created the entry while we were waiting for the lock
+            entry = self._read_entry(key)
+            if entry is not None:
+                return entry['value']
+            value = create()
+            self.put(key, value, ttl=ttl)
+        return value
+
+    def delete(self, key: str):
+        with self.lock():
+            self._remove_entry_file(self._entry_file(key))
+
+    def _remove_entry_file(self, entry_file: str):
+        # must only be called while holding the lock. Returns the size of the removed entry.
+        try:
+            removed_size = os.stat(entry_file).st_size
+            os.unlink(entry_file)
+        except FileNotFoundError:
+            return 0
+        try:
+            os.unlink(self._key_lock_file(entry_file))
+        except FileNotFoundError:
+            pass
+        size = self._read_size()
+        if size is not None:
+            self._write_size(size - removed_size)
+        return removed_size
+
+    def _entries(self):
+        # returns (path, size, mtime) of all entries
+        entries = []
+        try:
+            dir_entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return entries
+        for dir_entry in dir_entries:
+            if not dir_entry.name.endswith(_ENTRY_SUFFIX):
+                continue
+            try:
+                stat = dir_entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((dir_entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict(self):
+        # must only be called while holding the lock. Returns the remaining size.
+        entries = self._entries()
+        total_size = sum(size for _, size, _ in entries)
+        for path, size, _ in sorted(entries, key=lambda e: e[2]):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+                os.unlink(self._key_lock_file(path))
+            except FileNotFoundError:
+                pass
+            total_size -= size
+        return total_size
+
+    def remove_expired(self):
+        '''
+        removes all expired entries of this namespace (which are otherwise only removed once
+        evicted)
+        '''
+        with self.lock():
+            for path, _, _ in self._entries():
+                entry = self._load_entry_file(path)
+                if entry is not None and self._is_expired(entry):
+                    self._remove_entry_file(path)
+
+    def clear(self):
+        with self.lock():
+            for path, _, _ in self._entries():
+                try:
+                    os.unlink(path)
+                    os.unlink(self._key_lock_file(path))
+                except FileNotFoundError:
+                    pass
+            self._write_size(0)
+
+    def stats(self):
+        '''
+        returns the number and total size of the entries stored on disk for this namespace
+        (see `hits` and `misses` for the lookups done through this instance)
+        '''
+        entries = self._entries()
+        return {
+            'namespace': self.namespace,
+            'entries': len(entries),
+            'size': sum(size for _, size, _ in entries),
+        }
+
+
+def _namespaces(cache_dir):
+    try:
+        return sorted(d.name for d in os.scandir(cache_dir) if d.is_dir())
+    except FileNotFoundError:
+        return []
+
+
+def show_stats(cache_dir: CliHints.existing_dir()=None):
+    '''prints the number and size of entries of all cache namespaces'''
+    cache_dir = cache_dir or default_cache_dir()
+    for namespace in _namespaces(cache_dir):
+        stats = DiskCache(namespace=namespace, cache_dir=cache_dir).stats()
+        info('{n}: {e} entries, {s} bytes'.format(n=namespace, e=stats['entries'], s=stats['size']))
+
+
+def clear(namespace: str=None, cache_dir: CliHints.existing_dir()=None):
+    '''removes all entries of the given cache namespace (or of all namespaces)'''
+    cache_dir = cache_dir or default_cache_dir()
+    namespaces = [namespace] if namespace else _namespaces(cache_dir)
+    for namespace in namespaces:
+        DiskCache(namespace=namespace, cache_dir=cache_dir).clear()
@@ -15,17 +15,30 @@
 # limitations under the License.
 
 import argparse
+import json
 import os
 import pkgutil
 import inspect
 import itertools
+import shlex
 import sys
+import threading
+import time
+import traceback
 
 import ctx
 import util
 
 import_errs = []
 
+# the subcommand manifest is generated from the same function signatures `add_module` inspects.
+# It allows to render the top-level usage without importing all modules
+MANIFEST_FILE = '.cli_manifest.json'
+
+# if set, commands are forwarded to the cli server listening on the specified unix domain socket
+SERVER_SOCKET_ENV_VAR = 'CC_CLI_SERVER_SOCKET'
+
+
 def print_import_errs():
     for ie in import_errs:
         util.verbose(ie)
@@ -38,20 +51,91 @@ def main():
     sub-sub-command. Based on the function signature, optional arguments are added.
     This parser is then used to parse the given ARGV. Provided that parsing succeeds,
     the thus specified function is executed.
+
+    Only the module for the requested sub-command is imported. If no (or an unknown) module
+    is requested, the other sub-commands are added from the subcommand manifest.
+
+    If the environment variable named by `SERVER_SOCKET_ENV_VAR` points to the socket of a
+    running cli server (see cliserver.py), the command is forwarded to it instead.
     '''
-    parser = argparse.ArgumentParser()
-    add_global_args(parser)
-    sub_command_parsers = parser.add_subparsers()
-    for _, module_name, _ in pkgutil.iter_modules([os.path.dirname(os.path.abspath(__file__))]):
-    # skip own module name
-        if module_name == os.path.splitext(os.path.basename(__file__))[0]:
-            continue
-        add_module(module_name, sub_command_parsers)
-    if len(sys.argv) == 1:
+    argv = sys.argv[1:]
+    socket_path = os.environ.get(SERVER_SOCKET_ENV_VAR)
+    if socket_path:
+        import cliserver
+        exit_code = cliserver.forward(socket_path=socket_path, argv=argv)
+        if exit_code is not None:
+            sys.exit(exit_code)
+        # fall back to local execution if the server is not reachable
+
+    run(argv)
+
+def run(argv):
+    '''
+    parses the given ARGV (excluding the program name) and executes the specified function
+    in the current process
+    '''
+    global_args, _ = _parse_global_args(argv)
+
+    accounting = None
+    if global_args and global_args.resource_report:
+        from accounting import ResourceAccounting
+        accounting = ResourceAccounting()
+        accounting.install()
+    tracer = None
+    if global_args and global_args.trace:
+        from tracing import Tracer
+        tracer = Tracer()
+        tracer.install()
+    try:
+        if global_args and global_args.batch:
+            run_batch(global_args)
+        else:
+            _run(argv, global_args)
+    finally:
+        if tracer:
+            tracer.uninstall()
+            tracer.write(global_args.trace)
+        if accounting:
+            accounting.uninstall()
+            accounting.write_report()
+        if global_args:
+            _expose_metrics(global_args)
+
+def _expose_metrics(global_args):
+    if not (global_args.metrics_file or global_args.metrics_pushgateway):
+        return
+    import metrics
+    if global_args.metrics_file:
+        metrics.REGISTRY.write(global_args.metrics_file)
+    if global_args.metrics_pushgateway:
+        try:
+            metrics.REGISTRY.push(global_args.metrics_pushgateway)
+        except Exception as e:
+            util.warning('failed to push metrics to {u}: {e}'.format(
+                u=global_args.metrics_pushgateway,
+                e=e,
+                )
+            )
+
+def _run(argv, global_args):
+    import_timer = None
+    if global_args and global_args.profile_imports:
+        import profiling
+        import_timer = profiling.ImportTimer()
+        import_timer.install()
+
+    try:
+        parser = create_parser(_requested_module_name(argv))
+    finally:
+        if import_timer:
+            import_timer.uninstall()
+            import_timer.write_tree(global_args.profile_imports)
+
+    if len(argv) == 0:
         parser.print_usage()
         print_import_errs()
         sys.exit(1)
-    parsed = parser.parse_args()
+    parsed = parser.parse_args(argv)
     # write parsed args to global ctx module so called module functions may
     # retrieve if (see util.ctx)
     ctx.args = parsed
@@ -59,13 +143,433 @@ def main():
     util._set_cli(True)
     if hasattr(parsed, 'module'):
         parsed.module.args = parsed
-        parsed.func(parsed)
+        if parsed.profile:
+            _run_profiled(parsed)
+        else:
+            parsed.func(parsed)
     print_import_errs()
 
+def _run_profiled(parsed):
+    import cProfile
+    import pstats
+    import profiling
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(parsed.func, parsed)
+    finally:
+        profiling.write_stats(
+            pstats.Stats(profiler),
+            out_file=parsed.profile,
+            output_format=parsed.profile_format,
+        )
+        util.verbose('wrote profile to {f}'.format(f=parsed.profile))
+
+def create_parser(module_name=None):
+    '''
+    creates the argument parser for the given module. If no (or an unknown) module name is
+    given, argument-less sub-commands are added for all modules from the subcommand manifest
+    '''
+    parser = argparse.ArgumentParser()
+    add_global_args(parser)
+    sub_command_parsers = parser.add_subparsers()
+
+    if module_name in _module_names():
+        add_module(module_name, sub_command_parsers)
+    else:
+        add_manifest_modules(load_manifest(), sub_command_parsers)
+    return parser
+
+def _src_dir():
+    return os.path.dirname(os.path.abspath(__file__))
+
+def _own_module_name():
+    return os.path.splitext(os.path.basename(__file__))[0]
+
+def _module_names():
+    return [
+        module_name for _, module_name, _ in pkgutil.iter_modules([_src_dir()])
+        # skip own module name
+        if module_name != _own_module_name()
+    ]
+
+def _parse_global_args(argv):
+    '''
+    parses only the global arguments from the given ARGV. Returns the parsed global arguments
+    (or None if they could not be parsed) and the remaining arguments
+    '''
+    global_parser = argparse.ArgumentParser(add_help=False)
+    add_global_args(global_parser)
+    try:
+        return global_parser.parse_known_args(argv)
+    except SystemExit:
+        return None, argv
+
+def _requested_module_name(argv):
+    '''
+    returns the first positional argument (i.e. the requested module name) without importing
+    any module, or None if no module was requested
+    '''
+    global_args, remaining = _parse_global_args(argv)
+    if not global_args:
+        return None
+    for arg in remaining:
+        if not arg.startswith('-'):
+            return arg
+    return None
+
+def _sources_fingerprint():
+    # module members may stem from arbitrary modules below our source dir - consider all of them
+    latest_mtime = 0
+    file_count = 0
+    for dirpath, dirnames, filenames in os.walk(_src_dir()):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.') and not d == 'test']
+        for filename in filenames:
+            if not filename.endswith('.py'):
+                continue
+            file_count += 1
+            latest_mtime = max(latest_mtime, os.stat(os.path.join(dirpath, filename)).st_mtime_ns)
+    return '{c}-{m}'.format(c=file_count, m=latest_mtime)
+
+def generate_manifest():
+    '''
+    imports all modules and collects the sub-commands (and their argument names) as they
+    would be added by `add_module`
+    '''
+    modules = {}
+    for module_name in _module_names():
+        try:
+            module = __import__(module_name)
+        except ImportError as ie:
+            import_errs.append('failed to import {m}: {e}'.format(m=module_name, e=ie))
+            continue
+        # skip if module defines a symbol 'main'
+        if hasattr(module, 'main'):
+            continue
+        modules[module_name] = {
+            fname: inspect.getfullargspec(function).args
+            for fname, function in _module_functions(module)
+        }
+    return {'fingerprint': _sources_fingerprint(), 'modules': modules}
+
+def load_manifest():
+    '''
+    returns the subcommand manifest. The manifest is (re-)generated and written if it is
+    absent or outdated.
+    '''
+    manifest_file = os.path.join(_src_dir(), MANIFEST_FILE)
+    fingerprint = _sources_fingerprint()
+    if os.path.isfile(manifest_file):
+        with open(manifest_file) as f:
+            try:
+                manifest = json.load(f)
+                if manifest.get('fingerprint') == fingerprint:
+                    return manifest
+            except ValueError:
+                pass # regenerate
+
+    manifest = generate_manifest()
+    try:
+        with open(manifest_file, 'w') as f:
+            json.dump(manifest, f, indent=2)
+    except OSError as ose:
+        # e.g. read-only installations - the manifest is then only kept in memory
+        util.verbose('could not write cli manifest: {e}'.format(e=ose))
+    return manifest
+
+def add_manifest_modules(manifest, parser):
+    '''
+    adds (argument-less) sub-commands for all modules contained in the given manifest
+    '''
+    for module_name, functions in sorted(manifest['modules'].items()):
+        module_parser = parser.add_parser(module_name)
+        module_parser.set_defaults(func=display_usage_function(module_parser))
+        function_parsers = module_parser.add_subparsers()
+        for fname in functions:
+            function_parser = function_parsers.add_parser(fname)
+            function_parser.set_defaults(func=display_usage_function(function_parser))
+
 def add_global_args(parser):
     parser.add_argument('--quiet', action='store_true')
     parser.add_argument('--verbose', action='store_true')
     parser.add_argument('--cfg-dir', default=None)
+    parser.add_argument(
+        '--cfg-snapshot',
+        default=None,
+        help='read cfg from the given snapshot (see config serialise_cfg, default: $CC_CFG_SNAPSHOT)',
+    )
+    parser.add_argument(
+        '--log-format',
+        default='text',
+        choices=('text', 'json'),
+        help='format of log output (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--profile',
+        default=None,
+        help='profile the executed function (using cProfile) and write the results to the given file',
+    )
+    parser.add_argument(
+        '--profile-format',
+        default='pstats',
+        choices=('pstats', 'collapsed'),
+        help='output format for --profile (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--profile-imports',
+        default=None,
+        help='write the import time of the executed module (as a tree) to the given file',
+    )
+    parser.add_argument(
+        '--resource-report',
+        action='store_true',
+        help='print wall/cpu time, peak rss, http requests, subprocesses and files upon exit',
+    )
+    parser.add_argument(
+        '--trace',
+        default=None,
+        help='write spans of the executed function (as chrome trace-event json) to the given file',
+    )
+    parser.add_argument(
+        '--metrics-file',
+        default=None,
+        help='write all recorded metrics (in prometheus text format) to the given file upon exit',
+    )
+    parser.add_argument(
+        '--metrics-pushgateway',
+        default=None,
+        help='push all recorded metrics to the given prometheus pushgateway url upon exit',
+    )
+    parser.add_argument(
+        '--max-workers',
+        default=None,
+        type=int,
+        help='max. number of concurrent (remote) operations of bulk commands (default: $CC_MAX_WORKERS or 1, i.e. sequential)',
+    )
+    parser.add_argument(
+        '--batch',
+        default=None,
+        help='run the commands read from the given file (one per line, "-" for stdin)',
+    )
+    parser.add_argument(
+        '--batch-workers',
+        default=1,
+        type=int,
+        help='max. number of batch commands to run concurrently (default: %(default)s)',
+    )
+
+def _read_batch_commands(batch_file):
+    if batch_file == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(util.ensure_file_exists(batch_file)) as f:
+            lines = f.readlines()
+    commands = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        commands.append(shlex.split(line))
+    return commands
+
+def _exit_code(system_exit):
+    if system_exit.code is None:
+        return 0
+    if isinstance(system_exit.code, int):
+        return system_exit.code
+    print(system_exit.code, file=sys.stderr)
+    return 1
+
+class _ThreadLocalStream(object):
+    '''
+    routes writes to a per-thread buffer (if one was set for the current thread) or the
+    wrapped stream otherwise
+
+    Not intended to be used outside of this module.
+    '''
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    def set_buffer(self, buffer):
+        self._local.buffer = buffer
+
+    def _target(self):
+        return getattr(self._local, 'buffer', None) or self._stream
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        return self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+class _ThreadLocalArgs(object):
+    '''
+    stand-in for `ctx.args` for concurrently run batch commands, exposing each thread's
+    own parsed arguments
+
+    Not intended to be used outside of this module.
+    '''
+    def __init__(self):
+        object.__setattr__(self, '_local', threading.local())
+
+    def set_args(self, args):
+        self._local.args = args
+
+    def __bool__(self):
+        return bool(getattr(self._local, 'args', None))
+
+    def __getattr__(self, name):
+        return getattr(self._local.args, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._local.args, name, value)
+
+def run_batch(global_args):
+    '''
+    runs all commands read from `global_args.batch` in this interpreter. Each command is
+    specified as `<module> <function> [args]`; global arguments not specified for a command
+    are inherited from the batch invocation. Parsers are created once per module.
+
+    With `--batch-workers` greater than one, commands are run concurrently (they must thus be
+    independent of each other); their output is buffered and written in command order.
+    '''
+    commands = _read_batch_commands(global_args.batch)
+    ctx.args = global_args
+    util._set_cli(True)
+
+    parsers = {}
+    def parse(command):
+        module_name = _requested_module_name(command)
+        if module_name not in parsers:
+            parsers[module_name] = create_parser(module_name)
+        namespace = argparse.Namespace(**vars(global_args))
+        namespace.batch = None
+        return parsers[module_name].parse_args(command, namespace=namespace)
+
+    def execute(parsed, set_module_args=True):
+        parsed._cli = True
+        if not hasattr(parsed, 'module'):
+            return 0
+        if set_module_args:
+            parsed.module.args = parsed
+        try:
+            parsed.func(parsed)
+        except SystemExit as se:
+            return _exit_code(se)
+        except Exception:
+            traceback.print_exc()
+            return 1
+        return 0
+
+    def run_command(command):
+        start = time.monotonic()
+        try:
+            parsed = parse(command)
+            ctx.args = parsed
+            exit_code = execute(parsed)
+        except SystemExit as se:
+            exit_code = _exit_code(se) # invalid arguments
+        return exit_code, time.monotonic() - start
+
+    def report(index, command, exit_code, duration):
+        print('batch [{i}/{n}] {r} ({d:.3f}s): {c}'.format(
+            i=index + 1,
+            n=len(commands),
+            r='succeeded' if exit_code == 0 else 'failed with exit code {e}'.format(e=exit_code),
+            d=duration,
+            c=' '.join(map(shlex.quote, command)),
+            )
+        )
+        sys.stdout.flush()
+
+    batch_start = time.monotonic()
+    failed = 0
+
+    if global_args.batch_workers <= 1:
+        try:
+            for index, command in enumerate(commands):
+                exit_code, duration = run_command(command)
+                failed += int(exit_code != 0)
+                report(index, command, exit_code, duration)
+        finally:
+            ctx.args = global_args
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        from contextlib import redirect_stderr
+        from io import StringIO
+
+        # parse all commands upfront (argparse and module imports are not thread-safe)
+        parsed_commands = []
+        for command in commands:
+            parse_output = StringIO()
+            try:
+                with redirect_stderr(parse_output):
+                    parsed_commands.append((parse(command), ''))
+            except SystemExit as se:
+                parsed_commands.append((se, parse_output.getvalue()))
+
+        stdout, stderr = _ThreadLocalStream(sys.stdout), _ThreadLocalStream(sys.stderr)
+        thread_local_args = _ThreadLocalArgs()
+
+        def run_parsed(parsed_command):
+            parsed, parse_output = parsed_command
+            output = StringIO(parse_output)
+            output.seek(0, 2)
+            stdout.set_buffer(output)
+            stderr.set_buffer(output)
+            thread_local_args.set_args(parsed)
+            start = time.monotonic()
+            try:
+                if isinstance(parsed, SystemExit):
+                    exit_code = _exit_code(parsed)
+                else:
+                    # module.args is a _ThreadLocalArgs (see below)
+                    exit_code = execute(parsed, set_module_args=False)
+            finally:
+                stdout.set_buffer(None)
+                stderr.set_buffer(None)
+            return exit_code, time.monotonic() - start, output.getvalue()
+
+        # commands of the same module may run concurrently - each must see its own arguments
+        modules = {
+            parsed.module for parsed, _ in parsed_commands
+            if not isinstance(parsed, SystemExit) and hasattr(parsed, 'module')
+        }
+        original_module_args = {module: getattr(module, 'args', None) for module in modules}
+        for module in modules:
+            module.args = thread_local_args
+
+        original_streams = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = stdout, stderr
+        ctx.args = thread_local_args
+        try:
+            with ThreadPoolExecutor(max_workers=global_args.batch_workers) as executor:
+                # executor.map yields results in command order
+                for index, (exit_code, duration, output) in enumerate(
+                    executor.map(run_parsed, parsed_commands)
+                ):
+                    failed += int(exit_code != 0)
+                    original_streams[0].write(output)
+                    report(index, commands[index], exit_code, duration)
+        finally:
+            sys.stdout, sys.stderr = original_streams
+            ctx.args = global_args
+            for module, args in original_module_args.items():
+                module.args = args
+
+    print('batch: {n} command(s), {f} failed, {d:.3f}s'.format(
+        n=len(commands),
+        f=failed,
+        d=time.monotonic() - batch_start,
+        )
+    )
+    print_import_errs()
+    if failed:
+        sys.exit(1)
 
 def add_module(module_name, parser):
     module = __import__(module_name)
@@ -83,9 +587,7 @@ def add_module(module_name, parser):
 
     function_parsers = module_parser.add_subparsers()
 
-    for fname, function in inspect.getmembers(module, predicate=inspect.isfunction):
-        if fname.startswith('_'):
-            continue # skip "private" functions
+    for fname, function in _module_functions(module):
         function_parser = function_parsers.add_parser(fname)
         fspec = inspect.getfullargspec(function)
         function_parser.set_defaults(func=run_function(function))
@@ -156,15 +658,71 @@ def add_module(module_name, parser):
                   **kwargs
                 )
 
+def _module_functions(module):
+    for fname, function in inspect.getmembers(module, predicate=inspect.isfunction):
+        if fname.startswith('_'):
+            continue # skip "private" functions
+        yield fname, function
+
 def run_function(function):
     def function_runner(args):
         fspec = inspect.getfullargspec(function)
         function_args = []
         for argname in fspec.args:
             function_args.append(getattr(args, argname))
-        function(*function_args)
+        if inspect.iscoroutinefunction(function):
+            run_coroutine(function(*function_args))
+        else:
+            function(*function_args)
     return function_runner
 
+def run_coroutine(coroutine):
+    '''
+    runs the given coroutine in a new event loop until it is complete. SIGINT and SIGTERM
+    cancel the coroutine (exiting with 128 + signal number after cleanup). Remaining tasks
+    are cancelled and async http sessions (see `http_requests.async_session`) are closed
+    before the loop is closed.
+    '''
+    import asyncio
+    import signal
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    main_task = loop.create_task(coroutine)
+    received_signals = []
+
+    def cancel(signum):
+        received_signals.append(signum)
+        main_task.cancel()
+
+    handled_signals = []
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, cancel, signum)
+            handled_signals.append(signum)
+        except (NotImplementedError, RuntimeError, ValueError):
+            pass # not supported on this platform or not in main thread (e.g. batch workers)
+
+    try:
+        return loop.run_until_complete(main_task)
+    except asyncio.CancelledError:
+        if not received_signals:
+            raise
+        util.warning('cancelled (received signal {s})'.format(s=received_signals[0]))
+        raise SystemExit(128 + received_signals[0])
+    finally:
+        for signum in handled_signals:
+            loop.remove_signal_handler(signum)
+        pending_tasks = [t for t in asyncio.all_tasks(loop) if not t.done()]
+        for task in pending_tasks:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*pending_tasks, return_exceptions=True))
+        from http_requests import close_async_sessions
+        close_async_sessions(loop)
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        asyncio.set_event_loop(None)
+        loop.close()
+
 def display_usage_function(parser):
     def display_usage(_):
         parser.print_usage()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+A "warm" server for cli.py commands, listening on a unix domain socket.
+
+All modules (and optionally the cfg_factory) are loaded once when the server is started.
+Each forwarded command is run in a child process forked from the server, so it starts with
+all imports and the parsed configuration already in place. The client passes its
+stdin/stdout/stderr file descriptors along with the command, so the command's output is
+written directly to the client's streams. The exit code is sent back to the client.
+
+A preloaded cfg_factory is created again (before forking the next command) if the cfg source's
+contents changed, or upon SIGHUP (see ctx.cfg_factory).
+
+Clients do not need to use this module directly: cli.py forwards all commands to the server
+if the environment variable `CC_CLI_SERVER_SOCKET` is set (see cli.SERVER_SOCKET_ENV_VAR).
+
+Passing file descriptors requires Python >= 3.9 (socket.send_fds / socket.recv_fds). With older
+interpreters, the server refuses to start and cli.py runs all commands locally.
+
+Start the server with:
+
+    cliserver.py --socket <path> [--cfg-dir <dir>] [--preload-cfg]
+'''
+
+import argparse
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+
+# length prefix of requests, child pid and exit code (all as 4-byte big-endian int)
+_INT = struct.Struct('>i')
+
+MIN_PYTHON_VERSION = (3, 9)
+
+
+def _fd_passing_supported():
+    return sys.version_info >= MIN_PYTHON_VERSION and hasattr(socket, 'send_fds')
+
+
+def _recv_exactly(sock, length: int, initial: bytes=b''):
+    data = initial
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            raise EOFError('connection closed after {n} of {l} bytes'.format(n=len(data), l=length))
+        data += chunk
+    return data
+
+
+def forward(socket_path: str, argv):
+    '''
+    forwards the given ARGV to the cli server listening on `socket_path` and blocks until
+    the command finished. Returns the command's exit code, or `None` if the server is not
+    reachable (or file descriptors cannot be passed with this Python version).
+    '''
+    if not _fd_passing_supported():
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+
+    with sock:
+        request = json.dumps({
+            'argv': [sys.argv[0]] + list(argv),
+            'cwd': os.getcwd(),
+            'env': dict(os.environ),
+        }).encode('utf-8')
+        sys.stdout.flush()
+        sys.stderr.flush()
+        socket.send_fds(sock, [_INT.pack(len(request)) + request], [0, 1, 2])
+
+        child_pid = None
+        try:
+            child_pid, = _INT.unpack(_recv_exactly(sock, _INT.size))
+            exit_code, = _INT.unpack(_recv_exactly(sock, _INT.size))
+        except KeyboardInterrupt:
+            if child_pid:
+                os.kill(child_pid, signal.SIGINT)
+            return 130
+        except EOFError:
+            # the child terminated without reporting an exit code (e.g. it was killed)
+            return 1
+        return exit_code
+
+
+class CliServer(object):
+    '''
+    Accepts connections on the given unix domain socket and runs the received commands
+    in forked child processes.
+
+    Not intended to be used outside of this module.
+    '''
+    def __init__(self, socket_path: str):
+        self.socket_path = os.path.abspath(socket_path)
+        self.cfg_preloaded = False
+
+    def preload_modules(self):
+        import cli
+        for module_name in cli._module_names():
+            try:
+                __import__(module_name)
+            except ImportError as ie:
+                cli.import_errs.append('failed to import {m}: {e}'.format(m=module_name, e=ie))
+
+    def preload_cfg(self, cfg_dir: str=None):
+        import ctx
+        ctx.args = argparse.Namespace(cfg_dir=cfg_dir)
+        ctx.cfg_factory()
+        self.cfg_preloaded = True
+
+    def _refresh_cfg(self):
+        if not self.cfg_preloaded:
+            return
+        import ctx
+        try:
+            ctx.cfg_factory()
+        except (Exception, SystemExit):
+            # e.g. cfg is being modified - the command will report the error (if it persists)
+            ctx.reload_cfg_factory()
+
+    def _reload_cfg(self):
+        import ctx
+        ctx.reload_cfg_factory()
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path) # stale socket from a previous run
+
+        # children are reaped automatically
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        signal.signal(signal.SIGHUP, lambda signum, frame: self._reload_cfg())
+
+        server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            # create the socket accessible only by the current user (chmod-ing it after bind
+            # would leave a window in which other users could connect)
+            previous_umask = os.umask(0o177)
+            try:
+                server_socket.bind(self.socket_path)
+            finally:
+                os.umask(previous_umask)
+            server_socket.listen()
+            while True:
+                connection, _ = server_socket.accept()
+                self._handle(server_socket, connection)
+        finally:
+            server_socket.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def _handle(self, server_socket, connection):
+        try:
+            msg, fds, _, _ = socket.recv_fds(connection, 64 * 1024, 3)
+            length, = _INT.unpack(msg[:_INT.size])
+            request = json.loads(_recv_exactly(connection, length, msg[_INT.size:]).decode('utf-8'))
+        except (EOFError, OSError, ValueError, struct.error):
+            connection.close()
+            return
+        if len(fds) != 3:
+            for fd in fds:
+                os.close(fd)
+            connection.close()
+            return
+
+        self._refresh_cfg()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            server_socket.close()
+            exit_code = self._run_command(connection, fds, request)
+            os._exit(exit_code)
+
+        for fd in fds:
+            os.close(fd)
+        connection.close()
+
+    def _run_command(self, connection, fds, request):
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGHUP, signal.SIG_DFL)
+
+        for target_fd, fd in enumerate(fds):
+            os.dup2(fd, target_fd)
+            os.close(fd)
+        sys.stdin = open(0, 'r', closefd=False)
+        sys.stdout = open(1, 'w', buffering=1 if os.isatty(1) else -1, closefd=False)
+        sys.stderr = open(2, 'w', buffering=1, closefd=False)
+
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        sys.argv = request['argv']
+
+        connection.sendall(_INT.pack(os.getpid()))
+
+        import cli
+        exit_code = 0
+        try:
+            cli.run(sys.argv[1:])
+        except SystemExit as se:
+            if se.code is None:
+                exit_code = 0
+            elif isinstance(se.code, int):
+                exit_code = se.code
+            else:
+                print(se.code, file=sys.stderr)
+                exit_code = 1
+        except KeyboardInterrupt:
+            exit_code = 130
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+            exit_code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+
+        try:
+            connection.sendall(_INT.pack(exit_code))
+        except OSError:
+            pass # client went away
+        return exit_code
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--socket', required=True, help='path of the unix domain socket to listen on')
+    parser.add_argument('--cfg-dir', default=None, help='cfg dir to preload (see --preload-cfg)')
+    parser.add_argument(
+        '--preload-cfg',
+        action='store_true',
+        help='create the cfg_factory (from --cfg-dir or the secrets server) upon startup',
+    )
+    parsed = parser.parse_args()
+    if not _fd_passing_supported():
+        parser.error('Python >= {v} is required'.format(v='.'.join(map(str, MIN_PYTHON_VERSION))))
+
+    server = CliServer(socket_path=parsed.socket)
+    server.preload_modules()
+    if parsed.preload_cfg:
+        server.preload_cfg(cfg_dir=parsed.cfg_dir)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,7 @@
 # limitations under the License.
 
 from ensure import ensure_annotations
+import functools
 import json
 from urllib3.exceptions import InsecureRequestWarning
 from urllib.parse import urljoin, urlparse, urlencode
@@ -20,9 +21,11 @@ import warnings
 from enum import Enum
 import sseclient
 
+import metrics
+import tracing
 from http_requests import AuthenticatedRequestBuilder
 from model import ConcourseTeamCredentials
-from util import fail, warning, ensure_not_empty, SimpleNamespaceDict
+from util import fail, warning, ensure_not_empty, NamespaceView
 
 warnings.filterwarnings('ignore', 'Unverified HTTPS request is being made.*', InsecureRequestWarning)
 
@@ -53,6 +56,37 @@ def select_attr(name: str):
 # GLOBAL DEFINES
 CONCOURSE_API_SUFFIX = 'api/v1'
 
+_API_CALL_DURATION = metrics.histogram(
+    'concourse_api_call_duration_seconds',
+    description='duration of concourse API calls (including all HTTP requests issued by a call)',
+    labelnames=('endpoint',),
+)
+_API_CALL_FAILURES = metrics.counter(
+    'concourse_api_call_failures_total',
+    description='number of failed concourse API calls',
+    labelnames=('endpoint',),
+)
+
+
+def _instrumented(function):
+    '''
+    records the duration and failures of the decorated `ConcourseApi` method, using the
+    method name as endpoint label, and traces each call as span
+    '''
+    endpoint = function.__name__
+
+    @functools.wraps(function)
+    def instrumented_function(*args, **kwargs):
+        span = tracing.span('concourse ' + endpoint, category='http')
+        with span, _API_CALL_DURATION.labels(endpoint=endpoint).time():
+            try:
+                return function(*args, **kwargs)
+            except BaseException:
+                _API_CALL_FAILURES.labels(endpoint=endpoint).inc()
+                raise
+    return instrumented_function
+
+
 class ConcourseApiRoutes(object):
     '''
     Constructs concourse REST API endpoint URLs for the given concourse base URL and
@@ -176,6 +210,7 @@ class ConcourseApi(object):
     def _delete(self, url: str):
         return self.request_builder.delete(url)
 
+    @_instrumented
     @ensure_annotations
     def login(self, team: str, username: str, passwd: str):
         login_url = self.routes.login()
@@ -193,6 +228,7 @@ class ConcourseApi(object):
         )
         return self.auth_token
 
+    @_instrumented
     @ensure_annotations
     def set_pipeline(self, name: str, pipeline_definition):
         previous_version = self.pipeline_config_version(name)
@@ -201,20 +237,24 @@ class ConcourseApi(object):
         url = self.routes.pipeline_cfg(name)
         self._put(url, str(pipeline_definition), headers=headers)
 
+    @_instrumented
     @ensure_annotations
     def delete_pipeline(self, name: str):
         url = self.routes.pipeline(pipeline_name=name)
         self._delete(url)
 
+    @_instrumented
     def pipelines(self):
         pipelines_url = self.routes.pipelines()
         response = self._get(pipelines_url)
         return map(select_attr('name'), response)
 
+    @_instrumented
     def order_pipelines(self, pipeline_names):
         url = self.routes.order_pipelines()
         self._put(url, json.dumps(pipeline_names))
 
+    @_instrumented
     @ensure_annotations
     def pipeline_cfg(self, pipeline_name: str):
         pipeline_cfg_url = self.routes.pipeline_cfg(pipeline_name)
@@ -222,6 +262,7 @@ class ConcourseApi(object):
         ensure_not_empty(response)
         return PipelineConfig(response, concourse_api=self, name=pipeline_name)
 
+    @_instrumented
     @ensure_annotations
     def pipeline_config_version(self, pipeline_name: str):
         pipeline_cfg_url = self.routes.pipeline_cfg(pipeline_name)
@@ -238,6 +279,7 @@ class ConcourseApi(object):
 
         return response.headers['X-Concourse-Config-Version']
 
+    @_instrumented
     @ensure_annotations
     def unpause_pipeline(self, pipeline_name: str):
         unpause_url = self.routes.unpause_pipeline(pipeline_name)
@@ -246,6 +288,7 @@ class ConcourseApi(object):
                 body=""
         )
 
+    @_instrumented
     @ensure_annotations
     def expose_pipeline(self, pipeline_name: str):
         expose_url = self.routes.expose_pipeline(pipeline_name)
@@ -254,6 +297,7 @@ class ConcourseApi(object):
                 body="",
         )
 
+    @_instrumented
     @ensure_annotations
     def job_builds(self, pipeline_name: str, job_name: str):
         '''
@@ -266,17 +310,20 @@ class ConcourseApi(object):
         builds = sorted(builds, key=lambda b: b.id())
         return builds
 
+    @_instrumented
     @ensure_annotations
     def trigger_build(self, pipeline_name: str, job_name: str):
         trigger_url = self.routes.job_builds(pipeline_name, job_name)
         response = self._post(trigger_url)
 
+    @_instrumented
     @ensure_annotations
     def build_plan(self, build_id):
         build_plan_url = self.routes.build_plan(build_id)
         response = self._get(build_plan_url)
         return BuildPlan(response, self)
 
+    @_instrumented
     @ensure_annotations
     def build_events(self, build_id):
         build_plan_url = self.routes.build_events(build_id)
@@ -290,6 +337,7 @@ class ConcourseApi(object):
         )
         return BuildEvents(response, self)
 
+    @_instrumented
     def set_team(self, team_credentials: ConcourseTeamCredentials):
         body = {}
         if team_credentials.has_basic_auth_credentials():
@@ -336,7 +384,7 @@ class ModelBase(object):
     '''
     def __init__(self, raw_dict: dict, concourse_api:ConcourseApi):
         self.api = concourse_api
-        self.raw_dict = SimpleNamespaceDict(raw_dict)
+        self.raw_dict = NamespaceView(raw_dict)
 
 
 class PipelineConfig(object):
@@ -483,7 +531,7 @@ class BuildEvents(object):
         'finish-task' event is reached, which marks the end of a build execution.
 
         An optional callback may be specified, which is called for each received event
-        with the parsed event data (wrapped into a SimpleNamespaceDict). If the callback's
+        with the parsed event data (wrapped into a read-only NamespaceView). If the callback's
         return value evaluates to true in a boolean context, further event processing will
         be stopped.
 
@@ -496,7 +544,7 @@ class BuildEvents(object):
         for event in client.events():
             if event is None or not event.data or len(event.data.strip()) == 0:
                 return True
-            parsed = SimpleNamespaceDict(json.loads(event.data))
+            parsed = NamespaceView(json.loads(event.data))
             data = parsed.data
 
             if not data:
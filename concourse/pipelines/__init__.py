@@ -11,8 +11,10 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import hashlib
 import os
 import sys
+import time
 
 from copy import deepcopy
 import itertools
@@ -20,8 +22,11 @@ import itertools
 import argparse
 import mako.template
 
+import metrics
+import tracing
 from util import (
-    SimpleNamespaceDict, fail, ensure_directory_exists, ensure_file_exists, info, is_yaml_file, merge_dicts
+    SimpleNamespaceDict, fail, ensure_directory_exists, ensure_file_exists, info, is_yaml_file, merge_dicts,
+    BoundedExecutor,
 )
 from githubutil import branches
 
@@ -29,22 +34,48 @@ from concourse.pipelines.factory import DefinitionFactory, RawPipelineDefinition
 from concourse.pipelines.enumerator import PipelineEnumerator
 
 from concourse import client
-from model import ConcourseTeamCredentials, ConcourseConfig
+from model import ConcourseTeamCredentials, ConcourseConfig, fingerprint
 
+_RENDER_DURATION = metrics.histogram(
+    'pipeline_render_duration_seconds',
+    description='duration of rendering a pipeline definition (including its template)',
+    labelnames=('pipeline',),
+)
+_DEPLOY_DURATION = metrics.histogram(
+    'pipeline_deploy_duration_seconds',
+    description='duration of deploying a rendered pipeline to concourse',
+    labelnames=('pipeline',),
+)
+_DEPLOY_FAILURES = metrics.counter(
+    'pipeline_deploy_failures_total',
+    description='number of failed pipeline deployments',
+    labelnames=('pipeline',),
+)
 
-def generate_pipelines(
+def enumerate_pipeline_definitions(
         definitions_root_dir,
         job_mapping,
-        template_path,
-        template_include_dir,
         config_set: 'ConfigurationSet'
     ):
     enumerator = PipelineEnumerator(
         base_dir=definitions_root_dir,
         cfg_set=config_set,
     )
+    return itertools.chain(*enumerator.enumerate_pipeline_definitions(job_mapping))
+
 
-    pipeline_definitions = itertools.chain(*enumerator.enumerate_pipeline_definitions(job_mapping))
+def generate_pipelines(
+        definitions_root_dir,
+        job_mapping,
+        template_path,
+        template_include_dir,
+        config_set: 'ConfigurationSet'
+    ):
+    pipeline_definitions = enumerate_pipeline_definitions(
+        definitions_root_dir=definitions_root_dir,
+        job_mapping=job_mapping,
+        config_set=config_set,
+    )
 
     github_cfg = config_set.github()
 
@@ -68,20 +99,94 @@ def deploy_pipeline(
         unpause_pipeline: bool=True,
         expose_pipeline: bool=True,
     ):
-    api = client.ConcourseApi(
-        base_url=concourse_cfg.external_url(),
-        team_name=team_credentials.teamname(),
-    )
-    api.login(
-        team_credentials.teamname(),
-        team_credentials.username(),
-        team_credentials.passwd(),
-    )
-    api.set_pipeline(name=pipeline_name, pipeline_definition=pipeline_definition)
-    if unpause_pipeline:
-        api.unpause_pipeline(pipeline_name=pipeline_name)
-    if expose_pipeline:
-        api.expose_pipeline(pipeline_name=pipeline_name)
+    deploy_span = tracing.span('deploy pipeline', args={'pipeline': pipeline_name})
+    with deploy_span, _DEPLOY_DURATION.labels(pipeline=pipeline_name).time():
+        try:
+            api = client.ConcourseApi(
+                base_url=concourse_cfg.external_url(),
+                team_name=team_credentials.teamname(),
+            )
+            api.login(
+                team_credentials.teamname(),
+                team_credentials.username(),
+                team_credentials.passwd(),
+            )
+            api.set_pipeline(name=pipeline_name, pipeline_definition=pipeline_definition)
+            if unpause_pipeline:
+                api.unpause_pipeline(pipeline_name=pipeline_name)
+            if expose_pipeline:
+                api.expose_pipeline(pipeline_name=pipeline_name)
+        except BaseException:
+            _DEPLOY_FAILURES.labels(pipeline=pipeline_name).inc()
+            raise
+
+
+def directory_fingerprint(directory: str):
+    '''
+    returns a fingerprint of the names and contents of all files below the given directory
+    '''
+    file_digests = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            with open(path, 'rb') as f:
+                file_digests.append(
+                    (os.path.relpath(path, directory), hashlib.sha256(f.read()).hexdigest())
+                )
+    return fingerprint(file_digests)
+
+
+def code_fingerprint():
+    '''
+    returns a fingerprint of the (python) code involved in rendering pipelines, i.e. this
+    package, the `model` package and `util`
+    '''
+    import model
+    import util
+    source_files = [util.__file__]
+    for package_dir in (os.path.dirname(__file__), os.path.dirname(model.__file__)):
+        for dirpath, dirnames, filenames in os.walk(package_dir):
+            dirnames.sort()
+            source_files.extend(
+                os.path.join(dirpath, filename) for filename in sorted(filenames)
+                if filename.endswith('.py')
+            )
+    file_digests = []
+    for path in source_files:
+        with open(path, 'rb') as f:
+            file_digests.append(hashlib.sha256(f.read()).hexdigest())
+    return fingerprint(file_digests)
+
+
+def render_fingerprint(
+    pipeline_definition: RawPipelineDefinitionDescriptor,
+    config_set: 'ConfigurationSet',
+    template_path,
+    template_include_fingerprint: str=None,
+    code_fingerprint: str=None,
+):
+    '''
+    returns a fingerprint of all inputs of rendering the given pipeline definition (see
+    `render_pipelines`), i.e. the definition, its template and the cfg_set (including all
+    elements it references).
+
+    @param template_include_fingerprint: `directory_fingerprint` of the template include dir
+    @param code_fingerprint: `code_fingerprint` (so a changed renderer invalidates results)
+    '''
+    template_file = find_template_file(pipeline_definition.template, template_path)
+    with open(template_file, 'rb') as f:
+        template_digest = hashlib.sha256(f.read()).hexdigest()
+
+    return fingerprint({
+        'name': pipeline_definition.name,
+        'base_definition': pipeline_definition.base_definition,
+        'variants': pipeline_definition.variants,
+        'template': template_digest,
+        'template_include': template_include_fingerprint,
+        'cfg_set': config_set.fingerprint(),
+        'code': code_fingerprint,
+    })
 
 
 def find_template_file(template_name:str, template_path:[str]):
@@ -105,6 +210,7 @@ def render_pipelines(
     template_path,
     template_include_dir=None
 ):
+    render_start = time.perf_counter()
     template_name = pipeline_definition.template
     template_file = find_template_file(template_name, template_path)
 
@@ -134,13 +240,19 @@ def render_pipelines(
         # fallback in case no main_repository was found
         pipeline_metadata.pipeline_name = pipeline_definition.name
 
-    t = mako.template.Template(filename=template_file, lookup=lookup)
+    with tracing.span('render template', args={'pipeline': pipeline_definition.name}):
+        t = mako.template.Template(filename=template_file, lookup=lookup)
+        rendered_pipeline = t.render(
+            instance_args=generated_model,
+            config_set=config_set,
+            pipeline=pipeline_metadata
+        )
+    # only measure rendering (not the time consumers take to process the yielded result)
+    _RENDER_DURATION.labels(pipeline=pipeline_definition.name).observe(
+        time.perf_counter() - render_start
+    )
     yield (
-            t.render(
-                instance_args=generated_model,
-                config_set=config_set,
-                pipeline=pipeline_metadata
-                ),
+            rendered_pipeline,
             generated_model,
             pipeline_metadata
     )
@@ -162,15 +274,19 @@ def replicate_pipelines(
 
     pipeline_names = set()
 
-    for rendered_pipeline, _, pipeline_metadata in generate_pipelines(
-        definitions_root_dir=definitions_root_dir,
-        job_mapping=job_mapping,
-        template_path=template_path,
-        template_include_dir=template_include_dir,
-        config_set=cfg_set,
-    ):
-        pipeline_name = pipeline_metadata.pipeline_name
-        pipeline_names.add(pipeline_name)
+    def rendered_pipelines():
+        for rendered_pipeline, _, pipeline_metadata in generate_pipelines(
+            definitions_root_dir=definitions_root_dir,
+            job_mapping=job_mapping,
+            template_path=template_path,
+            template_include_dir=template_include_dir,
+            config_set=cfg_set,
+        ):
+            pipeline_names.add(pipeline_metadata.pipeline_name)
+            yield rendered_pipeline, pipeline_metadata.pipeline_name
+
+    def deploy(rendered_pipeline_and_name):
+        rendered_pipeline, pipeline_name = rendered_pipeline_and_name
         info('deploying pipeline {p} to team {t}'.format(p=pipeline_name, t=team_name))
         deploy_pipeline(
             pipeline_definition=rendered_pipeline,
@@ -181,6 +297,10 @@ def replicate_pipelines(
             expose_pipeline=expose_pipelines,
         )
 
+    # pipelines are deployed while the remaining ones are being rendered
+    for _ in BoundedExecutor().map(deploy, rendered_pipelines()):
+        pass
+
     concourse_api = client.ConcourseApi(base_url=concourse_cfg.external_url(), team_name=team_name)
     concourse_api.login(
         team=team_name,
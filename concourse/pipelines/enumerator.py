@@ -14,14 +14,16 @@
 import os
 from copy import deepcopy
 from itertools import chain
-import yaml
 from github3.exceptions import NotFoundError
 
 from util import (
+    load_yaml,
     parse_yaml_file,
     merge_dicts,
     info,
 )
+import tracing
+from github import API_CALL_DURATION as GITHUB_API_CALL_DURATION
 from githubutil import _create_github_api_object
 from model import JobMapping
 from concourse.pipelines.factory import RawPipelineDefinitionDescriptor
@@ -50,7 +52,8 @@ class PipelineEnumerator(object):
 
             branch_filter = lambda b: b == 'master'
             github_api = _create_github_api_object(github_cfg)
-            github_org = github_api.organization(github_org_name)
+            with GITHUB_API_CALL_DURATION.labels(operation='organization').time():
+                github_org = github_api.organization(github_org_name)
 
             for repository in github_org.repositories():
                 yield self._scan_repository_for_definitions(
@@ -60,19 +63,29 @@ class PipelineEnumerator(object):
                 )
 
     def _scan_repository_for_definitions(self, org_name, repository, branch_filter):
-        for branch_name in filter(branch_filter, map(lambda b: b.name, repository.branches())):
-            try:
-                definitions = repository.file_contents(
-                    path='.ci/pipeline_definitions',
-                    ref=branch_name
-                )
-            except NotFoundError:
-                continue # no pipeline definition for this branch
-
-            info('from repo: ' + repository.name + ':' + branch_name)
-            definitions = yaml.load(definitions.decoded.decode('utf-8'))
+        repo_path = '/'.join([org_name, repository.name])
+        branches_span = tracing.span('list branches', category='http', args={'repository': repo_path})
+        with branches_span, GITHUB_API_CALL_DURATION.labels(operation='branches').time():
+            branch_names = [b.name for b in repository.branches()]
+        for branch_name in filter(branch_filter, branch_names):
+            scan_span = tracing.span(
+                'scan repository',
+                args={'repository': repo_path, 'branch': branch_name},
+            )
+            with scan_span:
+                try:
+                    with GITHUB_API_CALL_DURATION.labels(operation='file_contents').time():
+                        definitions = repository.file_contents(
+                            path='.ci/pipeline_definitions',
+                            ref=branch_name
+                        )
+                except NotFoundError:
+                    continue # no pipeline definition for this branch
+
+                info('from repo: ' + repository.name + ':' + branch_name)
+                definitions = load_yaml(definitions.decoded.decode('utf-8'))
             yield from self._preprocess_and_wrap_into_descriptors(
-                repo_path='/'.join([org_name, repository.name]),
+                repo_path=repo_path,
                 branch=branch_name,
                 raw_definitions=definitions
             )
@@ -97,7 +110,7 @@ class PipelineEnumerator(object):
         main_repo_raw = {'path': repo_path, 'branch': branch_name}
 
         if base_definition.get('repo'):
-            merged_main_repo = merge_dicts(base_definition['repo'], main_repo_raw)
+            merged_main_repo = merge_dicts(base_definition['repo'], main_repo_raw, copy=False)
             base_definition['repo'] = merged_main_repo
         else:
             base_definition['repo'] = main_repo_raw
@@ -107,15 +120,16 @@ class PipelineEnumerator(object):
 
 def enumerate_pipeline_definitions(directories):
     for directory in directories:
-        # for now, hard-code mandatory .repository_mapping
-        repo_mapping = parse_yaml_file(os.path.join(directory, '.repository_mapping'))
-        repo_definition_mapping = {repo_path: list() for repo_path in repo_mapping.keys()}
-
-        for repo_path, definition_files in repo_mapping.items():
-            for definition_file_path in definition_files:
-                abs_file = os.path.abspath(os.path.join(directory, definition_file_path))
-                pipeline_raw_definition = parse_yaml_file(abs_file, as_snd=False)
-                repo_definition_mapping[repo_path].append(pipeline_raw_definition)
+        with tracing.span('scan definition directory', args={'directory': directory}):
+            # for now, hard-code mandatory .repository_mapping
+            repo_mapping = parse_yaml_file(os.path.join(directory, '.repository_mapping'))
+            repo_definition_mapping = {repo_path: list() for repo_path in repo_mapping.keys()}
+
+            for repo_path, definition_files in repo_mapping.items():
+                for definition_file_path in definition_files:
+                    abs_file = os.path.abspath(os.path.join(directory, definition_file_path))
+                    pipeline_raw_definition = parse_yaml_file(abs_file, as_snd=False)
+                    repo_definition_mapping[repo_path].append(pipeline_raw_definition)
 
         for repo_path, definitions in  repo_definition_mapping.items():
             yield (repo_path, definitions)
@@ -2,6 +2,7 @@ from copy import deepcopy
 from itertools import chain
 import toposort
 
+import tracing
 from util import merge_dicts
 from model.base import ModelValidationError
 from concourse.pipelines.modelbase import (
@@ -53,6 +54,13 @@ class DefinitionFactory(object):
         self.raw_definition_descriptor = ensure_not_none(raw_definition_descriptor)
 
     def create_pipeline_definition(self) -> PipelineDefinition:
+        with tracing.span(
+            'create_pipeline_definition',
+            args={'pipeline': self.raw_definition_descriptor.name},
+        ):
+            return self._create_pipeline_definition()
+
+    def _create_pipeline_definition(self):
         merged_variants_dict = self._create_variants_dict(self.raw_definition_descriptor)
 
         resource_registry = ResourceRegistry()
@@ -90,8 +98,12 @@ class DefinitionFactory(object):
     def _create_variants_dict(self, raw_definition_descriptor):
         variants_dict = normalise_to_dict(deepcopy(raw_definition_descriptor.variants))
 
-        base_dict = deepcopy(raw_definition_descriptor.base_definition)
+        # not copied - neither merge_dicts nor deepcopy modify it
+        base_dict = raw_definition_descriptor.base_definition
 
+        # each variant needs its own copy (merge_dicts(copy=False) or sharing base_dict are not
+        # an option): raw dicts are modified in place while creating variants (e.g. PipelineStep
+        # normalises 'depends', and traits add variant-specific step dependencies)
         merged_variants = {}
         for variant_name, variant_args in variants_dict.items():
             # optimisation: if there are no variant-specific arguments, we do not need to merge
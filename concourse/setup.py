@@ -28,6 +28,7 @@ import yaml
 
 import util
 import kubeutil
+import tracing
 
 import concourse.client as client
 
@@ -40,6 +41,7 @@ from model import (
     GcrCredentials,
     KubernetesConfig,
     NamedModelElement,
+    fingerprint,
 )
 from util import (
     ctx as global_ctx,
@@ -47,6 +49,7 @@ from util import (
     ensure_directory_exists,
     ensure_not_empty,
     ensure_not_none,
+    flush_log,
     info,
     fail,
 )
@@ -171,8 +174,13 @@ def create_instance_specific_helm_values(concourse_cfg: ConcourseConfig):
 def deploy_concourse_landscape(
         config_name: str,
         deployment_name: str='concourse',
-        timeout_seconds: int='180'
+        timeout_seconds: int='180',
+        previous_cfg_snapshot: str=None,
 ):
+    '''
+    @param previous_cfg_snapshot: cfg snapshot of the previous deployment. If given, only the
+    parts of the landscape whose configuration changed since are deployed again.
+    '''
     ensure_not_empty(config_name)
     ensure_helm_setup()
 
@@ -181,12 +189,36 @@ def deploy_concourse_landscape(
     config_set = config_factory.cfg_set(cfg_name=config_name)
     concourse_cfg = config_set.concourse()
 
+    previous_cfg_factory = None
+    if previous_cfg_snapshot:
+        previous_cfg_factory = ConfigFactory.from_snapshot(ensure_file_exists(previous_cfg_snapshot))
+        if previous_cfg_factory.fingerprint('cfg_set', config_name) is None:
+            info('{c} not contained in previous cfg snapshot - deploying everything'.format(
+                c=config_name,
+                )
+            )
+            previous_cfg_factory = None
+
+    def unchanged(*elements):
+        return _elements_unchanged(config_factory, previous_cfg_factory, elements)
+
+    concourse_element = ('concourse', concourse_cfg.name())
+
     # Set the global context to the cluster specified by the given config
     kubernetes_config = config_set.kubernetes()
     kubeutil.ctx.set_kubecfg(kubernetes_config.kubeconfig())
 
     ensure_cluster_version(kubernetes_config)
 
+    # the cfg snapshot does not cover the deployment name or the helm chart version - check the
+    # deployed Concourse instead
+    deployed_chart = None
+    if previous_cfg_factory:
+        deployed_chart = _deployed_concourse_chart(deployment_name)
+        if deployed_chart is None:
+            info('Concourse not deployed as {d} - deploying everything'.format(d=deployment_name))
+            previous_cfg_factory = None
+
     # Container-registry config
     image_pull_secret_name = concourse_cfg.image_pull_secret()
     container_registry = config_factory._cfg_element(
@@ -214,66 +246,158 @@ def deploy_concourse_landscape(
         cfg_name = concourse_cfg.helm_chart_values()
     ).raw
 
-    info('Creating default image-pull-secret ...')
-    create_image_pull_secret(
-        credentials=cr_credentials,
-        image_pull_secret_name=image_pull_secret_name,
+    if unchanged(('container_registry', image_pull_secret_name), concourse_element):
+        info('Skipping default image-pull-secret (unchanged)')
+    else:
+        info('Creating default image-pull-secret ...')
+        create_image_pull_secret(
+            credentials=cr_credentials,
+            image_pull_secret_name=image_pull_secret_name,
+            namespace=deployment_name,
+        )
+
+    if unchanged(('tls_config', tls_config_name), concourse_element):
+        info('Skipping tls-secret (unchanged)')
+    else:
+        info('Creating tls-secret ...')
+        create_tls_secret(
+            tls_config=tls_config,
+            tls_secret_name=tls_secret_name,
+            namespace=deployment_name,
+        )
+
+    if unchanged(('secrets_server', secrets_server_config.name())) and _deployed_spec_fingerprint(
+        namespace=secrets_server_config.namespace(),
+        name=secrets_server_config.service_name(),
+    ) == _secrets_server_spec_fingerprint(secrets_server_config):
+        info('Skipping secrets-server (unchanged)')
+    else:
+        info('Deploying secrets-server ...')
+        deploy_secrets_server(
+            secrets_server_config=secrets_server_config,
+        )
+
+    if unchanged(concourse_element) and _deployed_spec_fingerprint(
         namespace=deployment_name,
-    )
+        name='delaying-proxy',
+    ) == _delaying_proxy_spec_fingerprint(concourse_cfg):
+        info('Skipping delaying proxy (unchanged)')
+    else:
+        info('Deploying delaying proxy ...')
+        deploy_delaying_proxy(
+            concourse_cfg=concourse_cfg,
+            deployment_name=deployment_name,
+        )
+
+    if unchanged(
+        concourse_element,
+        ('kubernetes', kubernetes_config.name()),
+        (helmchart_cfg_type, concourse_cfg.helm_chart_default_values_config()),
+        (helmchart_cfg_type, concourse_cfg.helm_chart_values()),
+    ) and deployed_chart == 'concourse-' + CONCOURSE_HELM_CHART_VERSION:
+        info('Skipping Concourse (unchanged)')
+    else:
+        info('Deploying Concourse ...')
+        # Concourse is deployed last since Helm will lose connection if deployment takes more than ~60 seconds.
+        # Helm will still continue deploying server-side, but the client will report an error.
+        deploy_or_upgrade_concourse(
+            default_helm_values=default_helm_values,
+            custom_helm_values=custom_helm_values,
+            concourse_cfg=concourse_cfg,
+            kubernetes_config=kubernetes_config,
+            deployment_name=deployment_name,
+        )
+
+        info('Waiting until the webserver can be reached ...')
+        flush_log()
+        deployment_helper = kubeutil.ctx.deployment_helper()
+        is_web_deployment_available = deployment_helper.wait_until_deployment_available(
+            namespace=deployment_name,
+            name='concourse-web',
+            timeout_seconds=timeout_seconds,
+        )
+        if not is_web_deployment_available:
+            fail(
+                dedent(
+                    """No Concourse webserver reachable after {t} second(s).
+                    Check status of Pods created by "concourse-web"-deployment in namespace {ns}
+                    """
+                ).format(
+                    t = timeout_seconds,
+                    ns = deployment_name,
+                )
+            )
+        info('Webserver became accessible.')
+
+        # Even though the deployment is available, the ingress might need a few seconds to update.
+        flush_log()
+        time.sleep(3)
+
+    previous_concourse_cfg = None
+    if previous_cfg_factory and previous_cfg_factory.fingerprint(*concourse_element):
+        previous_concourse_cfg = previous_cfg_factory.concourse(concourse_cfg.name())
+    info('Setting teams on Concourse ...')
+    set_teams(config=concourse_cfg, previous_config=previous_concourse_cfg)
 
-    info('Creating tls-secret ...')
-    create_tls_secret(
-        tls_config=tls_config,
-        tls_secret_name=tls_secret_name,
+
+def _deployed_concourse_chart(deployment_name: str):
+    # returns the chart ('<name>-<version>') the Concourse webserver was deployed with ('' if
+    # unknown), or None if there is no such deployment
+    deployment = kubeutil.ctx.deployment_helper().get_deployment(
         namespace=deployment_name,
+        name='concourse-web',
     )
+    if not deployment:
+        return None
+    return (deployment.metadata.labels or {}).get('chart', '')
 
-    info('Deploying secrets-server ...')
-    deploy_secrets_server(
-        secrets_server_config=secrets_server_config,
-    )
 
-    info('Deploying delaying proxy ...')
-    deploy_delaying_proxy(
-        concourse_cfg=concourse_cfg,
-        deployment_name=deployment_name,
-    )
-    info('Deploying Concourse ...')
-    # Concourse is deployed last since Helm will lose connection if deployment takes more than ~60 seconds.
-    # Helm will still continue deploying server-side, but the client will report an error.
-    deploy_or_upgrade_concourse(
-        default_helm_values=default_helm_values,
-        custom_helm_values=custom_helm_values,
-        concourse_cfg=concourse_cfg,
-        kubernetes_config=kubernetes_config,
-        deployment_name=deployment_name,
+# deployments generated by this module are annotated with a fingerprint of their generated
+# specs, as those also depend on this module (e.g. default images), not only on the cfg
+SPEC_FINGERPRINT_ANNOTATION = 'cc-utils/spec-fingerprint'
+
+
+def _spec_fingerprint(*resources):
+    return fingerprint([resource.to_dict() for resource in resources])
+
+
+def _annotate_spec_fingerprint(deployment, spec_fingerprint: str):
+    annotations = dict(deployment.metadata.annotations or {})
+    annotations[SPEC_FINGERPRINT_ANNOTATION] = spec_fingerprint
+    deployment.metadata.annotations = annotations
+
+
+def _deployed_spec_fingerprint(namespace: str, name: str):
+    # returns the spec fingerprint of the given deployment (None if absent or not annotated)
+    deployment = kubeutil.ctx.deployment_helper().get_deployment(namespace=namespace, name=name)
+    if not deployment:
+        return None
+    return (deployment.metadata.annotations or {}).get(SPEC_FINGERPRINT_ANNOTATION)
+
+
+def _secrets_server_spec_fingerprint(secrets_server_config: SecretsServerConfig):
+    return _spec_fingerprint(
+        generate_secrets_server_service(secrets_server_config),
+        generate_secrets_server_deployment(secrets_server_config),
     )
 
-    info('Waiting until the webserver can be reached ...')
-    deployment_helper = kubeutil.ctx.deployment_helper()
-    is_web_deployment_available = deployment_helper.wait_until_deployment_available(
-        namespace=deployment_name,
-        name='concourse-web',
-        timeout_seconds=timeout_seconds,
+
+def _delaying_proxy_spec_fingerprint(concourse_cfg: ConcourseConfig):
+    return _spec_fingerprint(
+        generate_delaying_proxy_service(),
+        generate_delaying_proxy_deployment(concourse_cfg),
+        generate_delaying_proxy_ingress(concourse_cfg),
     )
-    if not is_web_deployment_available:
-        fail(
-            dedent(
-                """No Concourse webserver reachable after {t} second(s).
-                Check status of Pods created by "concourse-web"-deployment in namespace {ns}
-                """
-            ).format(
-                t = timeout_seconds,
-                ns = deployment_name,
-            )
-        )
-    info('Webserver became accessible.')
 
-    # Even though the deployment is available, the ingress might need a few seconds to update.
-    time.sleep(3)
 
-    info('Setting teams on Concourse ...')
-    set_teams(config=concourse_cfg)
+def _elements_unchanged(cfg_factory, previous_cfg_factory, elements):
+    # elements: (cfg_type_name, cfg_name) tuples
+    if not previous_cfg_factory:
+        return False
+    return all(
+        cfg_factory.fingerprint(*element) == previous_cfg_factory.fingerprint(*element)
+        for element in elements
+    )
 
 # pylint: disable=no-member
 def ensure_cluster_version(kubernetes_config: KubernetesConfig):
@@ -300,7 +424,8 @@ def ensure_cluster_version(kubernetes_config: KubernetesConfig):
 def ensure_helm_setup():
     """Ensure that Helm is installed and its repo-list is up-to-date. Return the path to the found Helm executable"""
     helm_executable = util.which('helm')
-    with open(os.devnull) as devnull:
+    flush_log()
+    with open(os.devnull) as devnull, tracing.span('helm repo update', category='subprocess'):
         subprocess.run([helm_executable, 'repo', 'update'], check=True, stdout=devnull)
     return helm_executable
 
@@ -366,7 +491,9 @@ def deploy_or_upgrade_concourse(
             yaml.dump(kubernetes_config.kubeconfig(), f)
 
         # run helm from inside the temporary directory so that the prepared file paths work
-        subprocess.run(subprocess_args, check=True, cwd=temp_dir, env=helm_env)
+        flush_log() # helm writes to the same stdout
+        with tracing.span('helm upgrade', category='subprocess', args={'release': namespace}):
+            subprocess.run(subprocess_args, check=True, cwd=temp_dir, env=helm_env)
 
 
 def deploy_secrets_server(secrets_server_config: SecretsServerConfig):
@@ -393,6 +520,7 @@ def deploy_secrets_server(secrets_server_config: SecretsServerConfig):
 
     service = generate_secrets_server_service(secrets_server_config)
     deployment = generate_secrets_server_deployment(secrets_server_config)
+    _annotate_spec_fingerprint(deployment, _secrets_server_spec_fingerprint(secrets_server_config))
 
     service_helper.replace_or_create_service(namespace, service)
     deployment_helper.replace_or_create_deployment(namespace, deployment)
@@ -417,15 +545,34 @@ def deploy_delaying_proxy(
     service = generate_delaying_proxy_service()
     deployment = generate_delaying_proxy_deployment(concourse_cfg)
     ingress = generate_delaying_proxy_ingress(concourse_cfg)
+    _annotate_spec_fingerprint(deployment, _delaying_proxy_spec_fingerprint(concourse_cfg))
 
     service_helper.replace_or_create_service(namespace, service)
     deployment_helper.replace_or_create_deployment(namespace, deployment)
     ingress_helper.replace_or_create_ingress(namespace, ingress)
 
 
-def set_teams(config: ConcourseConfig):
+def set_teams(config: ConcourseConfig, previous_config: ConcourseConfig=None):
+    '''
+    @param previous_config: if given, only teams whose credentials differ from the ones
+    contained in it are set
+    '''
     ensure_not_none(config)
 
+    # We skip the main team here since we cannot update all its credentials at this time.
+    teams = [team for team in config.all_team_credentials() if team.teamname != "main"]
+    if previous_config:
+        previous_fingerprints = {
+            team.teamname(): fingerprint(team.raw) for team in previous_config.all_team_credentials()
+        }
+        teams = [
+            team for team in teams
+            if previous_fingerprints.get(team.teamname()) != fingerprint(team.raw)
+        ]
+        if not teams:
+            info('Team credentials unchanged')
+            return
+
     # Use main-team, i.e. the team that can change the other teams' credentials
     main_team_credentials = config.main_team_credentials()
 
@@ -438,11 +585,8 @@ def set_teams(config: ConcourseConfig):
         username=main_team_credentials.username(),
         passwd=main_team_credentials.passwd(),
     )
-    for team in config.all_team_credentials():
-        # We skip the main team here since we cannot update all its credentials at this time.
-        if team.teamname == "main":
-            continue
-        concourse_api.set_team(team)
+    for _ in util.BoundedExecutor().map(concourse_api.set_team, teams):
+        pass
 
 
 def generate_secrets_server_service(
@@ -471,6 +615,11 @@ def generate_secrets_server_service(
     )
 
 
+# job image in which the secrets-server is run, unless configured otherwise (see
+# SecretsServerConfig.image). Images not containing secretsserver.py serve the secrets using
+# `python3 -m http.server` instead.
+SECRETS_SERVER_DEFAULT_IMAGE = 'eu.gcr.io/gardener-project/cc/job-image:0.20.0'
+
 def generate_secrets_server_deployment(
     secrets_server_config: SecretsServerConfig,
 ):
@@ -496,12 +645,14 @@ def generate_secrets_server_deployment(
                 spec=V1PodSpec(
                     containers=[
                         V1Container(
-                            image='eu.gcr.io/gardener-project/cc/job-image:0.20.0',
+                            image=secrets_server_config.image() or SECRETS_SERVER_DEFAULT_IMAGE,
                             image_pull_policy='IfNotPresent',
                             name='secrets-server',
+                            # all secrets (and gzip-compressed copies) are held in memory, along
+                            # with the documents of the most recently requested cfg_sets
                             resources=V1ResourceRequirements(
-                                requests={'cpu':'50m', 'memory': '50Mi'},
-                                limits={'cpu':'50m', 'memory': '50Mi'},
+                                requests={'cpu':'50m', 'memory': '128Mi'},
+                                limits={'cpu':'200m', 'memory': '256Mi'},
                             ),
                             command=['bash'],
                             args=[
@@ -513,8 +664,12 @@ def generate_secrets_server_deployment(
                                 cp -r /var/run/secrets/kubernetes.io/serviceaccount serviceaccount
                                 # store Kubernetes service endpoint env as file for consumer
                                 env | grep KUBERNETES_SERVICE > serviceaccount/env
-                                # launch minimalistic python server in that directory serving requests across all network interfaces
-                                python3 -m http.server 8080
+                                # serve (and reload upon changes) all secrets across all network interfaces (see secretsserver.py)
+                                if [ -f /cc/utils/secretsserver.py ]; then
+                                    exec python3 /cc/utils/secretsserver.py --secrets-dir /secrets --port 8080
+                                fi
+                                # older images do not contain the secrets-server
+                                exec python3 -m http.server 8080
                                 '''
                             ],
                             ports=[
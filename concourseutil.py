@@ -12,8 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
+import json
 import os
 import subprocess
+import tempfile
 
 from copy import copy
 from ensure import ensure_annotations
@@ -21,7 +24,8 @@ from github3.github import GitHubEnterprise, GitHub
 from urllib.parse import urlparse, parse_qs
 
 from util import ctx
-from util import parse_yaml_file, info, fail, which, warning, CliHints, CliHint
+from util import parse_yaml_file, info, fail, flush_log, which, warning, CliHints, CliHint
+from util import BoundedExecutor, BulkExecutionError
 from util import ctx as global_ctx
 from concourse import pipelines
 import concourse.client as concourse
@@ -42,6 +46,7 @@ def deploy_or_upgrade_concourse(
     config_name: CliHint(typehint=str, help="Which of the configurations contained in --config-dir to use."),
     deployment_name: CliHint(typehint=str, help="Name under which Concourse will be deployed. Will also be the identifier of the namespace into which it is deployed.")='concourse',
     timeout_seconds: CliHint(typehint=int, help="Maximum time (in seconds) to wait after deploying for the Concourse-webserver to become available.")=180,
+    previous_cfg_snapshot: CliHint(typehint=str, help="cfg snapshot of the previous deployment. If given, only changed components are deployed.")=None,
     dry_run: bool=True,
 ):
     '''Deploys a new concourse-instance using the given deployment name and config-directory.'''
@@ -61,6 +66,7 @@ def deploy_or_upgrade_concourse(
         config_name=config_name,
         deployment_name=deployment_name,
         timeout_seconds=timeout_seconds,
+        previous_cfg_snapshot=previous_cfg_snapshot,
     )
 
 
@@ -85,17 +91,25 @@ def destroy_concourse(release: str, dry_run: bool = True):
     if cli_args and hasattr(cli_args, 'kubeconfig') and cli_args.kubeconfig:
         helm_env['KUBECONFIG'] = cli_args.kubeconfig
 
+    flush_log() # helm writes to the same stdout
     subprocess.run([helm_executable, "delete", release, "--purge"], env=helm_env)
 
 
 def set_teams(
     config_name: CliHint(typehint=str, help='Which of the configurations contained in "--config-file" to use.'),
+    previous_cfg_snapshot: CliHint(typehint=str, help='cfg snapshot containing the previously set teams. If given, only changed teams are set.')=None,
 ):
     config_factory = ctx().cfg_factory()
     config_set = config_factory.cfg_set(cfg_name=config_name)
     config = config_set.concourse()
 
-    setup.set_teams(config=config)
+    previous_config = None
+    if previous_cfg_snapshot:
+        previous_factory = ConfigFactory.from_snapshot(previous_cfg_snapshot)
+        if previous_factory.fingerprint('concourse', config.name()):
+            previous_config = previous_factory.concourse(config.name())
+
+    setup.set_teams(config=config, previous_config=previous_config)
 
 
 def _display_info(dry_run: bool, operation: str, **kwargs):
@@ -114,12 +128,16 @@ def render_secrets(cfg_dir: CliHints.existing_dir(), cfg_name: str, out_file: st
     # todo: serialise configuration set or rm function
 
 
+RENDER_FINGERPRINTS_FILE_NAME = '.render-fingerprints.json'
+
+
 def render_pipelines(
         definitions_root_dir: str,
         template_path: [str],
         config_name: str,
         template_include_dir: str,
-        out_dir: str
+        out_dir: str,
+        incremental: bool=False,
     ):
     if not os.path.isdir(out_dir):
         os.makedirs(out_dir)
@@ -130,17 +148,101 @@ def render_pipelines(
     concourse_cfg = config_set.concourse()
     job_mapping_set = cfg_factory.job_mapping(concourse_cfg.job_mapping_cfg_name())
 
+    if incremental:
+        # pipelines whose render inputs and output files are unchanged since the previous
+        # (incremental) run are not rendered again
+        fingerprints_file = os.path.join(out_dir, RENDER_FINGERPRINTS_FILE_NAME)
+        previous_fingerprints = _read_render_fingerprints(fingerprints_file)
+        fingerprints = {}
+        template_include_fingerprint = None
+        if template_include_dir:
+            template_include_fingerprint = pipelines.directory_fingerprint(template_include_dir)
+        code_fingerprint = pipelines.code_fingerprint()
+
     for job_mapping in job_mapping_set.job_mappings().values():
-        for rendered_pipeline, definition, pipeline_args in pipelines.generate_pipelines(
+        for pipeline_definition in pipelines.enumerate_pipeline_definitions(
                 definitions_root_dir=definitions_root_dir,
                 job_mapping=job_mapping,
-                template_path=template_path,
-                template_include_dir=template_include_dir,
                 config_set=config_set
             ):
-            out_name = os.path.join(out_dir, pipeline_args.name + '.yaml')
-            with open(out_name, 'w') as f:
-                f.write(rendered_pipeline)
+            if incremental:
+                # pipeline names are only unique per repository
+                key = '{r}:{n}'.format(
+                    r=pipeline_definition.base_definition.get('repo', {}).get('path'),
+                    n=pipeline_definition.name,
+                )
+                render_fingerprint = pipelines.render_fingerprint(
+                    pipeline_definition=pipeline_definition,
+                    config_set=config_set,
+                    template_path=template_path,
+                    template_include_fingerprint=template_include_fingerprint,
+                    code_fingerprint=code_fingerprint,
+                )
+                previous = previous_fingerprints.get(key)
+                if previous and previous.get('fingerprint') == render_fingerprint \
+                        and _out_files_unchanged(out_dir, previous.get('out_files', {})):
+                    info('skipping unchanged pipeline ' + pipeline_definition.name)
+                    fingerprints[key] = previous
+                    continue
+
+            out_files = {}
+            for rendered_pipeline, definition, pipeline_args in pipelines.render_pipelines(
+                    pipeline_definition=pipeline_definition,
+                    config_set=config_set,
+                    template_path=template_path,
+                    template_include_dir=template_include_dir,
+                ):
+                out_name = pipeline_args.name + '.yaml'
+                with open(os.path.join(out_dir, out_name), 'w') as f:
+                    f.write(rendered_pipeline)
+                out_files[out_name] = _digest(rendered_pipeline.encode('utf-8'))
+
+            if incremental:
+                fingerprints[key] = {'fingerprint': render_fingerprint, 'out_files': out_files}
+
+    if incremental:
+        _write_render_fingerprints(fingerprints_file, fingerprints)
+
+
+def _digest(content: bytes):
+    return hashlib.sha256(content).hexdigest()
+
+
+def _out_files_unchanged(out_dir, out_files: dict):
+    # out_files: {<file name>: <digest>} - files may be overwritten by pipelines of the same name
+    if not out_files:
+        return False
+    for out_name, digest in out_files.items():
+        try:
+            with open(os.path.join(out_dir, out_name), 'rb') as f:
+                if _digest(f.read()) != digest:
+                    return False
+        except FileNotFoundError:
+            return False
+    return True
+
+
+def _read_render_fingerprints(fingerprints_file):
+    try:
+        with open(fingerprints_file) as f:
+            fingerprints = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    # ignore files written by previous versions
+    if not isinstance(fingerprints, dict) or not all(isinstance(v, dict) for v in fingerprints.values()):
+        return {}
+    return fingerprints
+
+
+def _write_render_fingerprints(fingerprints_file, fingerprints):
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(fingerprints_file), prefix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(fingerprints, f, indent=2, sort_keys=True)
+        os.replace(tmp_file, fingerprints_file)
+    except BaseException:
+        os.unlink(tmp_file)
+        raise
 
 
 def deploy_pipeline(
@@ -246,18 +348,24 @@ def sync_webhooks(
     webhook_syncer = github.GithubWebHookSyncer(github_obj)
     failed_hooks = 0
 
-    for repo, resources in path_to_resources.items():
-        try:
-            _sync_webhook(
-              resources=resources,
-              webhook_syncer=webhook_syncer,
-              concourse_cfg=concourse_cfg,
-              concourse_proxy_url=concourse_proxy_url,
-              skip_ssl_validation=not concourse_verify_ssl
-            )
-        except RuntimeError as rte:
+    def sync_webhook(resources):
+        _sync_webhook(
+          resources=resources,
+          webhook_syncer=webhook_syncer,
+          concourse_cfg=concourse_cfg,
+          concourse_proxy_url=concourse_proxy_url,
+          skip_ssl_validation=not concourse_verify_ssl
+        )
+
+    try:
+        for _ in BoundedExecutor(fail_fast=False).map(sync_webhook, path_to_resources.values()):
+            pass
+    except BulkExecutionError as bee:
+        for _, error in bee.errors:
+            if not isinstance(error, RuntimeError):
+                raise error
             failed_hooks += 1
-            info(str(rte))
+            info(str(error))
 
     if failed_hooks is not 0:
         fail('{n} webhooks could not be updated or created!'.format(n=failed_hooks))
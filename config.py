@@ -12,28 +12,95 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
 import os
+import posixpath
+import re
 import requests
 import json
+import shlex
+import sys
+import tempfile
+import threading
+import time
 
+from cacheutil import DiskCache
 from util import urljoin, fail
-from util import ctx, CliHints
-from model import ConfigFactory, ConfigSetSerialiser as CSS
-
-def serialise_cfg(cfg_dir: CliHints.existing_dir(), cfg_sets: [str], out_file: str):
+from util import ctx, CliHint, CliHints
+from model import ConfigFactory, ConfigSetSerialiser as CSS, diff as _diff
+
+def serialise_cfg(
+    cfg_dir: CliHints.existing_dir(),
+    cfg_sets: [str],
+    out_file: str,
+    sharded: bool=False,
+    output_format: str='json',
+):
+    '''
+    serialises the given cfg_sets into out_file. If `sharded` is set, out_file only contains an
+    index, and each element is written to a separate file in the same directory (consumers then
+    only retrieve the elements they actually use).
+
+    output_format `snapshot` writes a binary snapshot, which can be read without decoding all
+    elements (see the global --cfg-snapshot option).
+    '''
     factory = ConfigFactory.from_cfg_dir(cfg_dir=cfg_dir)
     cfg_sets = [factory.cfg_set(cfg_set) for cfg_set in cfg_sets]
     serialiser = CSS(cfg_sets=cfg_sets, cfg_factory=factory)
+    if output_format == 'snapshot':
+        if sharded:
+            raise ValueError('snapshots cannot be sharded')
+        with open(out_file, 'wb') as f:
+            f.write(serialiser.serialise(output_format=output_format))
+        return
+    if not sharded:
+        with open(out_file, 'w') as f:
+            f.write(serialiser.serialise())
+        return
+
+    out_dir = os.path.dirname(os.path.abspath(out_file))
+    documents = serialiser.serialise_sharded()
     with open(out_file, 'w') as f:
-        f.write(serialiser.serialise())
+        f.write(documents.pop('index'))
+    for name, document in documents.items():
+        with open(os.path.join(out_dir, name), 'w') as f:
+            f.write(document)
+
+
+# seconds for which retrieved secrets are used without revalidation
+DEFAULT_CACHE_TTL = 300
+# secrets cached on disk are removed if they were not (re)validated for this many seconds
+DEFAULT_CACHE_MAX_AGE = 24 * 60 * 60
 
 
 class SecretsServerClient(object):
+    '''
+    Retrieves (and caches) configuration sets from the secrets-server.
+
+    Retrieved secrets are cached and considered fresh for `cache_ttl` seconds. Afterwards, they
+    are revalidated using conditional requests (based on the ETag / Last-Modified response
+    headers). By default, they are only cached in memory (i.e. per client).
+
+    If `cache_dir` is given, retrieved secrets are cached on disk (see `cacheutil.DiskCache`,
+    which refuses directories other users may access) instead, and shared between processes.
+    Concurrent processes coordinate through the cache's lock, so that only one of them contacts
+    the secrets-server. Cached secrets are removed `cache_max_age` seconds after they were last
+    retrieved or revalidated.
+
+    If `cache_file` is given and exists, secrets are read from it (without contacting the
+    secrets-server). Otherwise, retrieved secrets are written to it.
+
+    If the secrets were serialised sharded (see `ConfigSetSerialiser.serialise_sharded`), the
+    configured secret name denotes the index. Shards are expected next to it, and are
+    retrieved (and cached) separately using `retrieve_shard`.
+    '''
     @staticmethod
     def from_env(
         endpoint_env_var='SECRETS_SERVER_ENDPOINT',
         concourse_secret_env_var='SECRETS_SERVER_CONCOURSE_CFG_NAME',
-        cache_file='SECRETS_SERVER_CACHE'
+        cache_file='SECRETS_SERVER_CACHE',
+        cache_ttl_env_var='SECRETS_SERVER_CACHE_TTL',
+        cache_dir_env_var='SECRETS_SERVER_CACHE_DIR',
     ):
         if not cache_file in os.environ:
             if not all(map(lambda e: e in os.environ, (endpoint_env_var, concourse_secret_env_var))):
@@ -41,26 +108,124 @@ class SecretsServerClient(object):
                     v=', '.join((endpoint_env_var, concourse_secret_env_var))
                 ))
         cache_file = os.environ.get(cache_file, None)
+        cache_ttl = float(os.environ.get(cache_ttl_env_var, DEFAULT_CACHE_TTL))
 
         return SecretsServerClient(
                 endpoint_url=os.environ.get(endpoint_env_var),
                 concourse_secret_name=os.environ.get(concourse_secret_env_var),
-                cache_file=cache_file
+                cache_file=cache_file,
+                cache_dir=os.environ.get(cache_dir_env_var),
+                cache_ttl=cache_ttl,
         )
 
-    def __init__(self, endpoint_url, concourse_secret_name, cache_file=None):
+    def __init__(
+        self,
+        endpoint_url,
+        concourse_secret_name,
+        cache_file=None,
+        cache_dir=None,
+        cache_ttl=DEFAULT_CACHE_TTL,
+        cache_max_age=DEFAULT_CACHE_MAX_AGE,
+    ):
         self.url = endpoint_url
         self.concourse_secret_name = concourse_secret_name
         self.cache_file=cache_file
+        self.cache_ttl = cache_ttl
+        self.cache_max_age = cache_max_age
+        if cache_dir:
+            self.cache = DiskCache(namespace='secrets_server', cache_dir=cache_dir)
+        else:
+            self.cache = None
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _use_cache_file(self):
+        return self.cache_file and os.path.isfile(self.cache_file)
 
     def retrieve_secrets(self):
-        if self.cache_file and os.path.isfile(self.cache_file):
+        if self._use_cache_file():
             with open(self.cache_file) as f:
                 return json.load(f)
+        if not self.url:
+            raise ValueError('neither secrets-server endpoint nor cache file configured')
+
+        secrets = self._retrieve(urljoin(self.url, self.concourse_secret_name))
 
-        request_url = urljoin(self.url, self.concourse_secret_name)
-        response = requests.get(request_url)
+        if self.cache_file:
+            self._write_cache_file(secrets)
+
+        return secrets
+
+    def retrieve_shard(self, shard_name: str):
+        if not self.url:
+            raise ValueError('cannot retrieve {s} without secrets-server endpoint'.format(s=shard_name))
+        index_dir = posixpath.dirname(self.concourse_secret_name)
+        return self._retrieve(urljoin(*filter(None, (self.url, index_dir, shard_name))))
+
+    def validator(self):
+        '''
+        returns an identifier of the secrets' current version, which changes whenever the
+        retrieved secrets change. Cached secrets are revalidated if they are no longer fresh.
+        Note that for sharded secrets, only changes of the index are detected.
+        '''
+        if self._use_cache_file() or not self.url:
+            stat = os.stat(self.cache_file)
+            return (stat.st_mtime_ns, stat.st_size)
+        entry = self._entry(urljoin(self.url, self.concourse_secret_name))
+        return entry['metadata'].get('digest')
+
+    def _retrieve(self, request_url):
+        return self._entry(request_url)['value']
+
+    def _cached_entry(self, request_url):
+        if self.cache:
+            return self.cache.get_entry(request_url)
+        return self._entries.get(request_url)
+
+    def _cache_lock(self):
+        if self.cache:
+            return self.cache.lock()
+        return self._lock
+
+    def _entry(self, request_url):
+        entry = self._cached_entry(request_url)
+        if self._is_fresh(entry):
+            return entry
+
+        with self._cache_lock():
+            # another process may have retrieved the secrets while we were waiting for the lock
+            entry = self._cached_entry(request_url)
+            if self._is_fresh(entry):
+                return entry
+
+            secrets, metadata = self._fetch(request_url, entry)
+            metadata['fresh_until'] = time.time() + self.cache_ttl
+            entry = {'value': secrets, 'metadata': metadata}
+            if self.cache:
+                self.cache.put(request_url, secrets, ttl=self.cache_max_age, metadata=metadata)
+                self.cache.remove_expired()
+            else:
+                self._entries[request_url] = entry
+
+        return entry
+
+    def _is_fresh(self, entry):
+        return entry is not None and entry['metadata'].get('fresh_until', 0) > time.time()
+
+    def _fetch(self, request_url, entry):
+        # returns the secrets and the validators to send when revalidating them
+        headers = {}
+        if entry:
+            validators = entry['metadata']
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+
+        response = requests.get(request_url, headers=headers)
         # pylint: disable=no-member
+        if entry and response.status_code == requests.codes.not_modified:
+            return entry['value'], dict(entry['metadata'])
         if not response.status_code == requests.codes.ok:
         # pylint: enable=no-member
             raise RuntimeError('secrets_server sent {d}: {m}'.format(
@@ -68,11 +233,24 @@ class SecretsServerClient(object):
                 m=response.content
             ))
 
-        if self.cache_file:
-            with open(self.cache_file, 'w') as f:
-                json.dump(response.json(), f)
-
-        return response.json()
+        metadata = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'digest': hashlib.sha256(response.content).hexdigest(),
+        }
+        return response.json(), metadata
+
+    def _write_cache_file(self, secrets):
+        # write atomically, as other processes may read the cache file concurrently
+        cache_dir = os.path.dirname(os.path.abspath(self.cache_file))
+        fd, tmp_file = tempfile.mkstemp(dir=cache_dir, prefix='.secrets')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(secrets, f)
+            os.replace(tmp_file, self.cache_file)
+        except BaseException:
+            os.unlink(tmp_file)
+            raise
 
 
 def __add_module_command_args(parser):
@@ -99,21 +277,26 @@ def _client():
     return SecretsServerClient.from_env()
 
 
-def _parse_model(raw_dict):
-    factory = ConfigFactory.from_dict(raw_dict)
+def _parse_model(raw_dict, retrieve_shard=None):
+    factory = ConfigFactory.from_dict(raw_dict, retrieve_shard=retrieve_shard)
     return factory
 
 
-def _retrieve_model_element(cfg_type: str, cfg_name: str):
+def _retrieve_cfg_factory():
     client = _client()
     secrets_dict = client.retrieve_secrets()
-    cfg_factory = _parse_model(secrets_dict)
+    return _parse_model(secrets_dict, retrieve_shard=client.retrieve_shard)
+
+
+def _retrieve_model_element(cfg_type: str, cfg_name: str, cfg_factory=None):
+    if not cfg_factory:
+        cfg_factory = _retrieve_cfg_factory()
 
     return cfg_factory._cfg_element(cfg_type_name=cfg_type, cfg_name=cfg_name)
 
 
-def model_element(cfg_type: str, cfg_name: str, key: str):
-    cfg = _retrieve_model_element(cfg_type=cfg_type, cfg_name=cfg_name)
+def _model_element_value(cfg_type: str, cfg_name: str, key: str, cfg_factory=None):
+    cfg = _retrieve_model_element(cfg_type=cfg_type, cfg_name=cfg_name, cfg_factory=cfg_factory)
 
     attrib_path = key.split('.')
     attrib_path.reverse()
@@ -122,11 +305,11 @@ def model_element(cfg_type: str, cfg_name: str, key: str):
         getter = getattr(cfg, attrib_path.pop())
         cfg = getter()
 
-    print(str(cfg))
+    return cfg
 
 
-def attribute(cfg_type: str, cfg_name: str, key: str):
-    raw = _retrieve_model_element(cfg_type=cfg_type, cfg_name=cfg_name).raw
+def _attribute_value(cfg_type: str, cfg_name: str, key: str, cfg_factory=None):
+    raw = _retrieve_model_element(cfg_type=cfg_type, cfg_name=cfg_name, cfg_factory=cfg_factory).raw
 
     attrib_path = key.split('.')
     attrib_path.reverse()
@@ -135,5 +318,94 @@ def attribute(cfg_type: str, cfg_name: str, key: str):
         attrib = raw.get(attrib_path.pop())
         raw = attrib
 
-    print(str(attrib))
+    return attrib
+
 
+def model_element(cfg_type: str, cfg_name: str, key: str):
+    print(str(_model_element_value(cfg_type=cfg_type, cfg_name=cfg_name, key=key)))
+
+
+def attribute(cfg_type: str, cfg_name: str, key: str):
+    print(str(_attribute_value(cfg_type=cfg_type, cfg_name=cfg_name, key=key)))
+
+
+def _parse_selector(selector: str):
+    # [<variable>=]<cfg_type>:<cfg_name>:<key>
+    variable, _, query = selector.rpartition('=')
+    parts = query.split(':')
+    if not len(parts) == 3 or not all(parts):
+        fail('invalid selector (expected [<variable>=]<cfg_type>:<cfg_name>:<key>): ' + selector)
+    if not variable:
+        variable = re.sub('[^A-Za-z0-9_]', '_', query).upper()
+    elif not re.fullmatch('[A-Za-z_][A-Za-z0-9_]*', variable):
+        fail('invalid variable name: ' + variable)
+    return variable, parts
+
+
+def query(
+    selectors: CliHint(
+        typehint=[str],
+        help='[<variable>=]<cfg_type>:<cfg_name>:<key> (read from stdin, one per line, if omitted)',
+    )=None,
+    output_format: CliHint(typehint=str, choices=('json', 'shell'))='json',
+    attributes: bool=False,
+):
+    '''
+    resolves all given selectors against one retrieved configuration (like `model_element`, or
+    `attribute` if `attributes` is set). Output is either a json object (with the selectors as
+    keys) or variable assignments to be evaluated by a shell (variables are named after the
+    selectors unless specified otherwise).
+    '''
+    if not selectors:
+        selectors = [
+            line.strip() for line in sys.stdin
+            if line.strip() and not line.strip().startswith('#')
+        ]
+    parsed_selectors = [(selector, _parse_selector(selector)) for selector in selectors]
+
+    resolve = _attribute_value if attributes else _model_element_value
+    cfg_factory = _retrieve_cfg_factory()
+
+    results = []
+    for selector, (variable, (cfg_type, cfg_name, key)) in parsed_selectors:
+        value = resolve(cfg_type=cfg_type, cfg_name=cfg_name, key=key, cfg_factory=cfg_factory)
+        results.append((selector, variable, value))
+
+    if output_format == 'json':
+        print(json.dumps(
+            {selector: value for selector, _, value in results},
+            indent=2,
+            default=str,
+        ))
+    else:
+        for _, variable, value in results:
+            print('{v}={q}'.format(v=variable, q=shlex.quote(str(value))))
+
+
+def diff_snapshots(
+    old_snapshot: CliHints.existing_file(),
+    new_snapshot: CliHints.existing_file(),
+    output_format: CliHint(typehint=str, choices=('text', 'json'))='text',
+):
+    '''
+    prints the elements (and cfg_sets) added, removed or changed between two cfg snapshots (see
+    `serialise_cfg`)
+    '''
+    config_diff = _diff(
+        ConfigFactory.from_snapshot(old_snapshot),
+        ConfigFactory.from_snapshot(new_snapshot),
+    )
+    kinds = (
+        ('added', config_diff.added),
+        ('removed', config_diff.removed),
+        ('changed', config_diff.changed),
+    )
+    if output_format == 'json':
+        print(json.dumps(
+            {kind: ['/'.join(element) for element in sorted(elements)] for kind, elements in kinds},
+            indent=2,
+        ))
+        return
+    for kind, elements in kinds:
+        for cfg_type_name, cfg_name in sorted(elements):
+            print('{k}: {t}/{n}'.format(k=kind, t=cfg_type_name, n=cfg_name))
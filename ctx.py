@@ -16,8 +16,28 @@
 Execution context. Filled upon invocation of cli.py, read by submodules
 '''
 
+import os
+import time
+
 args=None # the parsed command line arguments
 
+CFG_SNAPSHOT_ENV_VAR = 'CC_CFG_SNAPSHOT'
+
+# the process-wide cfg_factory (see cfg_factory), the cfg source (and version) it was created
+# from and when the cfg source was last checked for changes
+_cfg_factory = None
+_cfg_factory_source = None
+_cfg_factory_version = None
+_cfg_factory_checked = 0
+
+# the secrets-server client (and the cfg source it was created for), shared between change
+# checks and retrievals so that they use the same cache (and send conditional requests)
+_secrets_server_client = None
+_secrets_server_client_source = None
+
+# min. seconds between checks of the cfg source for changes
+CFG_CHANGE_CHECK_INTERVAL = 1
+
 def _cfg_factory_from_dir():
     if not args or not args.cfg_dir:
         return None
@@ -30,20 +50,141 @@ def _cfg_factory_from_dir():
     return factory
 
 
-def _cfg_factory_from_secrets_server():
+def _cfg_snapshot_file():
+    if args and getattr(args, 'cfg_snapshot', None):
+        return args.cfg_snapshot
+    return os.environ.get(CFG_SNAPSHOT_ENV_VAR)
+
+
+def _cfg_factory_from_snapshot():
+    snapshot_file = _cfg_snapshot_file()
+    if not snapshot_file:
+        return None
+
+    from model import ConfigFactory
+    return ConfigFactory.from_snapshot(snapshot_file)
+
+
+def _client_for(cfg_source):
+    global _secrets_server_client, _secrets_server_client_source
+    if _secrets_server_client is None or _secrets_server_client_source != cfg_source:
+        import config
+        _secrets_server_client = config._client()
+        _secrets_server_client_source = cfg_source
+    return _secrets_server_client
+
+
+def _cfg_factory_from_secrets_server(cfg_source):
     import config
-    return config._parse_model(config._client().retrieve_secrets())
+    client = _client_for(cfg_source)
+    return config._parse_model(client.retrieve_secrets(), retrieve_shard=client.retrieve_shard)
+
+
+def _cfg_source():
+    '''
+    returns a hashable identifier for the cfg source cfg_factory would read from
+    '''
+    if args and args.cfg_dir:
+        return ('cfg_dir', os.path.abspath(args.cfg_dir))
+    if _cfg_snapshot_file():
+        return ('cfg_snapshot', os.path.abspath(_cfg_snapshot_file()))
+    # see config._client
+    cli_args = tuple(
+        getattr(args, name, None) for name in ('server_endpoint', 'concourse_cfg_name', 'cache_file')
+    )
+    env_vars = tuple(
+        os.environ.get(name) for name in (
+            'SECRETS_SERVER_ENDPOINT',
+            'SECRETS_SERVER_CONCOURSE_CFG_NAME',
+            'SECRETS_SERVER_CACHE',
+            'SECRETS_SERVER_CACHE_TTL',
+            'SECRETS_SERVER_CACHE_DIR',
+        )
+    )
+    return ('secrets_server',) + cli_args + env_vars
+
+
+def _dir_version(directory):
+    # (relative path, mtime, size) of all files (hidden ones excluded, e.g. '.git')
+    files = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        for filename in filenames:
+            if filename.startswith('.'):
+                continue
+            path = os.path.join(dirpath, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((os.path.relpath(path, directory), stat.st_mtime_ns, stat.st_size))
+    return tuple(sorted(files))
+
+
+def _cfg_version(cfg_source):
+    '''
+    returns an identifier of the current version of the given cfg source's contents
+    '''
+    source_type = cfg_source[0]
+    if source_type == 'cfg_dir':
+        return _dir_version(cfg_source[1])
+    if source_type == 'cfg_snapshot':
+        try:
+            stat = os.stat(cfg_source[1])
+        except FileNotFoundError:
+            return None # reported when creating the cfg_factory
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    return _client_for(cfg_source).validator()
+
+
+def reload_cfg_factory():
+    '''
+    drops the process-wide cfg_factory (and cached secrets), so it is created again upon the
+    next call of `cfg_factory`.
+    '''
+    global _cfg_factory, _cfg_factory_source, _cfg_factory_version
+    global _secrets_server_client, _secrets_server_client_source
+    _cfg_factory = None
+    _cfg_factory_source = None
+    _cfg_factory_version = None
+    _secrets_server_client = None
+    _secrets_server_client_source = None
 
 
 def cfg_factory():
+    '''
+    returns the cfg_factory for the configured cfg source. The factory is created once per
+    process and cfg source. It is created again if the cfg source's contents changed (checked
+    at most every CFG_CHANGE_CHECK_INTERVAL seconds), or after `reload_cfg_factory` was called.
+    '''
+    global _cfg_factory, _cfg_factory_source, _cfg_factory_version, _cfg_factory_checked
     from util import fail
 
+    cfg_source = _cfg_source()
+    if _cfg_factory and _cfg_factory_source == cfg_source:
+        if time.monotonic() - _cfg_factory_checked < CFG_CHANGE_CHECK_INTERVAL:
+            return _cfg_factory
+        cfg_version = _cfg_version(cfg_source)
+        _cfg_factory_checked = time.monotonic()
+        if cfg_version == _cfg_factory_version:
+            return _cfg_factory
+    else:
+        cfg_version = _cfg_version(cfg_source)
+
     factory = _cfg_factory_from_dir()
+    if not factory:
+        factory = _cfg_factory_from_snapshot()
     # fallback to secrets-server
     if not factory:
-        factory = _cfg_factory_from_secrets_server()
+        factory = _cfg_factory_from_secrets_server(cfg_source)
 
     if not factory:
-        fail('cfg_factory is required. configure using the global --cfg-dir option or via env')
+        fail('cfg_factory is required. configure using --cfg-dir, --cfg-snapshot or via env')
+
+    _cfg_factory = factory
+    _cfg_factory_source = cfg_source
+    _cfg_factory_version = cfg_version
+    _cfg_factory_checked = time.monotonic()
 
     return factory
@@ -19,10 +19,18 @@ from github3.repos.hook import Hook
 from github3.repos.repo import Repository
 from urllib.parse import urlparse
 
+import metrics
+
 DEFAULT_HOOK_EVENTS = ['create', 'pull_request', 'push']
 DEFAULT_HOOK_NAME = 'web' # see https://developer.github.com/v3/repos/hooks/
 DEFAULT_HOOK_CONTENT_TYPE = 'json'
 
+API_CALL_DURATION = metrics.histogram(
+    'github_api_call_duration_seconds',
+    description='duration of github API operations (including all HTTP requests issued by an operation)',
+    labelnames=('operation',),
+)
+
 class GithubWebHookSyncer(object):
     '''
     Synchronises web hooks for repositories hosted on a github instance.
@@ -173,6 +181,29 @@ class GithubWebHookSyncer(object):
         @param content_type: webhook content type (see github webhook documentation)
         @param active: whether the webhook should be active
         '''
+        with API_CALL_DURATION.labels(operation='add_or_update_hook').time():
+            self._add_or_update_hook(
+                owner=owner,
+                repository_name=repository_name,
+                callback_url=callback_url,
+                hook_name=hook_name,
+                events=events,
+                content_type=content_type,
+                active=active,
+                skip_ssl_validation=skip_ssl_validation,
+            )
+
+    def _add_or_update_hook(
+        self,
+        owner,
+        repository_name,
+        callback_url,
+        hook_name,
+        events,
+        content_type,
+        active,
+        skip_ssl_validation,
+    ):
         repository = self.github.repository(
             owner=owner,
             repository=repository_name
@@ -244,6 +275,15 @@ class GithubWebHookSyncer(object):
         urls_to_keep,
         url_filter_fun,
     ):
+        with API_CALL_DURATION.labels(operation='remove_outdated_hooks').time():
+            return self._remove_outdated_hooks(
+                owner=owner,
+                repository_name=repository_name,
+                urls_to_keep=urls_to_keep,
+                url_filter_fun=url_filter_fun,
+            )
+
+    def _remove_outdated_hooks(self, owner, repository_name, urls_to_keep, url_filter_fun):
         repository = self.github.repository(
             owner=owner,
             repository=repository_name
@@ -279,7 +279,8 @@ def retrieve_email_addresses(
 
     email_addresses_count = 0
 
-    for email_address in filter(None, map(retrieve_email, github_users)):
+    email_addresses = util.BoundedExecutor().map(retrieve_email, github_users)
+    for email_address in filter(None, email_addresses):
         fh.write(email_address + '\n')
         email_addresses_count += 1
 
@@ -12,14 +12,126 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import functools
+import http.cookiejar
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 
+from util import warning
+
+POOL_SIZE_ENV_VAR = 'CC_HTTP_POOL_SIZE'
+KEEP_ALIVE_ENV_VAR = 'CC_HTTP_KEEP_ALIVE'
+DEFAULT_POOL_SIZE = 10
+
+# pooled sessions shared per (scheme, host) - see `shared_session`
+_sessions = {}
+_sessions_lock = threading.Lock()
+# set by `configure_sessions` (None: read from the environment upon creating sessions)
+_pool_size = None
+_keep_alive = None
+
+
+def configure_sessions(pool_size: int=None, keep_alive: bool=None):
+    '''
+    sets the max. number of (kept-alive) connections per host and whether connections are kept
+    alive at all (defaults: $CC_HTTP_POOL_SIZE, $CC_HTTP_KEEP_ALIVE). Existing shared sessions
+    are closed.
+    '''
+    global _pool_size, _keep_alive
+    if pool_size is not None:
+        if pool_size < 1:
+            raise ValueError('pool_size must be positive')
+        _pool_size = pool_size
+    if keep_alive is not None:
+        _keep_alive = keep_alive
+    close_sessions()
+
+
+def _configured_pool_size():
+    if _pool_size is not None:
+        return _pool_size
+    value = os.environ.get(POOL_SIZE_ENV_VAR)
+    if not value:
+        return DEFAULT_POOL_SIZE
+    try:
+        if int(value) >= 1:
+            return int(value)
+    except ValueError:
+        pass
+    warning('ignoring invalid {n}: {v}'.format(n=POOL_SIZE_ENV_VAR, v=value))
+    return DEFAULT_POOL_SIZE
+
+
+def _configured_keep_alive():
+    if _keep_alive is not None:
+        return _keep_alive
+    return os.environ.get(KEEP_ALIVE_ENV_VAR, 'true').lower() not in ('false', '0', 'no')
+
+
+def _create_session():
+    session = requests.Session()
+    pool_size = _configured_pool_size()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    # do not share cookies between callers (e.g. concourse logins of different teams)
+    session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    if not _configured_keep_alive():
+        session.headers['Connection'] = 'close'
+    return session
+
+
+def shared_session(url: str):
+    '''
+    returns the pooled `requests.Session` shared by all requests (of this process) to the given
+    url's scheme and host, so subsequent requests re-use kept-alive (TLS) connections.
+    '''
+    parsed = urlsplit(url)
+    key = (parsed.scheme, parsed.netloc)
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _create_session()
+                _sessions[key] = session
+    return session
+
+
+def close_sessions():
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+
+def _reset_sessions_after_fork():
+    # connections must not be shared with forked children (e.g. by cliserver.py)
+    global _sessions_lock
+    _sessions.clear()
+    _sessions_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_sessions_after_fork)
+
+
 class AuthenticatedRequestBuilder(object):
     '''
     Wrapper around the 'requests' library, handling concourse-specific
     http headers and also checking for http response codes.
 
+    Requests are sent using the pooled sessions shared per host (see `shared_session`), unless
+    a session is passed.
+
     Not intended to be used outside of this module.
     '''
     def __init__(
@@ -27,10 +139,12 @@ class AuthenticatedRequestBuilder(object):
             auth_token: str=None,
             basic_auth_username: str=None,
             basic_auth_passwd: str=None,
-            verify_ssl: bool=True
+            verify_ssl: bool=True,
+            session: requests.Session=None,
     ):
         self.headers = None
         self.auth = None
+        self.session = session
 
         if auth_token:
             self.headers={'Authorization': 'Bearer {}'.format(auth_token)}
@@ -57,7 +171,9 @@ class AuthenticatedRequestBuilder(object):
         if 'data' in kwargs:
             headers['content-type'] = 'application/x-yaml'
 
-        result = method(
+        session = self.session or shared_session(url)
+        result = session.request(
+            method,
             url,
             headers=headers,
             auth=self.auth,
@@ -75,7 +191,7 @@ class AuthenticatedRequestBuilder(object):
 
     def get(self, url: str, return_type: str='json', **kwargs):
         return self._request(
-                method=requests.get,
+                method='GET',
                 url=url,
                 return_type=return_type,
                 **kwargs
@@ -83,7 +199,7 @@ class AuthenticatedRequestBuilder(object):
 
     def put(self, url: str, body, **kwargs):
         return self._request(
-                method=requests.put,
+                method='PUT',
                 url=url,
                 return_type=None,
                 data=str(body),
@@ -92,7 +208,7 @@ class AuthenticatedRequestBuilder(object):
 
     def post(self, url: str, body, **kwargs):
         return self._request(
-                method=requests.post,
+                method='POST',
                 url=url,
                 return_type=None,
                 data=str(body),
@@ -101,9 +217,67 @@ class AuthenticatedRequestBuilder(object):
 
     def delete(self, url: str, return_type=None, **kwargs):
         return self._request(
-                method=requests.delete,
+                method='DELETE',
                 url=url,
                 return_type=None,
                 **kwargs
         )
 
+
+class AsyncSession(object):
+    '''
+    asyncio facade for a pooled `requests.Session`. Requests are run in a bounded thread
+    pool, so that up to `max_connections` requests may be in flight concurrently, re-using
+    keep-alive connections.
+
+    Users will most likely want to retrieve the shared instance for the running event loop
+    using `async_session`.
+    '''
+    def __init__(self, max_connections: int=10):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_connections)
+
+    async def request(self, method: str, url: str, **kwargs):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self._executor,
+            functools.partial(self.session.request, method, url, **kwargs),
+        )
+
+    async def get(self, url: str, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def put(self, url: str, **kwargs):
+        return await self.request('PUT', url, **kwargs)
+
+    async def post(self, url: str, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def delete(self, url: str, **kwargs):
+        return await self.request('DELETE', url, **kwargs)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+
+# shared AsyncSession instances per event loop
+_async_sessions = {}
+
+def async_session():
+    '''
+    returns the AsyncSession shared by all coroutines running in the current event loop.
+    Sessions are closed by cli.py once an async command completed.
+    '''
+    loop = asyncio.get_event_loop()
+    if loop not in _async_sessions:
+        _async_sessions[loop] = AsyncSession()
+    return _async_sessions[loop]
+
+def close_async_sessions(loop):
+    session = _async_sessions.pop(loop, None)
+    if session:
+        session.close()
@@ -34,9 +34,38 @@ from kubernetes.client import (
 import kubernetes.client
 from kubernetes.config.kube_config import KubeConfigLoader
 
+import metrics
+import tracing
 from util import fail, info, verbose, ensure_file_exists, ensure_not_empty, ensure_not_none
+from util import BoundedExecutor, thaw
 from util import ctx as global_ctx
 
+_API_CALL_DURATION = metrics.histogram(
+    'kubernetes_api_call_duration_seconds',
+    description='duration of kubernetes API calls',
+    labelnames=('method', 'resource'),
+)
+
+
+def _instrumented(api):
+    '''
+    records the duration of all calls issued via the given kubernetes API object, using the
+    (templated) resource path as label
+    '''
+    api_client = api.api_client
+    if getattr(api_client, '_instrumented', False):
+        return api
+    call_api = api_client.call_api
+
+    def instrumented_call_api(resource_path, method, *args, **kwargs):
+        with _API_CALL_DURATION.labels(method=method, resource=resource_path).time():
+            return call_api(resource_path, method, *args, **kwargs)
+
+    api_client.call_api = instrumented_call_api
+    api_client._instrumented = True
+    return api
+
+
 class Ctx(object):
     '''
     handles the execution context of kubernetes-api calls.
@@ -66,7 +95,8 @@ class Ctx(object):
         ensure_not_none(kubeconfig_dict)
 
         configuration = kubernetes.client.Configuration()
-        cfg_loader = KubeConfigLoader(dict(kubeconfig_dict))
+        # the loader writes refreshed tokens (e.g. of gcp auth-providers) into the dict
+        cfg_loader = KubeConfigLoader(thaw(kubeconfig_dict))
         cfg_loader.load_and_set(configuration)
         # pylint: disable=no-member
         kubernetes.client.Configuration.set_default(configuration)
@@ -93,27 +123,27 @@ class Ctx(object):
 
     def create_core_api(self):
         cfg = self.get_kubecfg()
-        return client.CoreV1Api(cfg)
+        return _instrumented(client.CoreV1Api(cfg))
 
     def create_rbac_api(self):
         cfg = self.get_kubecfg()
-        return client.RbacAuthorizationV1beta1Api(cfg)
+        return _instrumented(client.RbacAuthorizationV1beta1Api(cfg))
 
     def create_custom_api(self):
         cfg = self.get_kubecfg()
-        return client.CustomObjectsApi(cfg)
+        return _instrumented(client.CustomObjectsApi(cfg))
 
     def create_apps_api(self):
         cfg = self.get_kubecfg()
-        return client.AppsV1Api(cfg)
+        return _instrumented(client.AppsV1Api(cfg))
 
     def create_extensions_v1beta1_api(self):
         cfg = self.get_kubecfg()
-        return client.ExtensionsV1beta1Api(cfg)
+        return _instrumented(client.ExtensionsV1beta1Api(cfg))
 
     def create_version_api(self):
         cfg = self.get_kubecfg()
-        return client.VersionApi(cfg)
+        return _instrumented(client.VersionApi(cfg))
 
 
 def __add_module_command_args(parser):
@@ -343,6 +373,7 @@ class KubernetesDeploymentHelper(object):
             raise ae
         return deployment
 
+    @tracing.traced('wait until deployment available', category='kubernetes')
     def wait_until_deployment_available(self, namespace: str, name: str, timeout_seconds: int=60) -> bool:
         '''Block until the given deployment has at least one available replica or `timeout_seconds` seconds elapsed.
         Return `True` if the deployment is available, `False` if a timeout occured.
@@ -446,29 +477,30 @@ def copy_secrets(from_ns: str, to_ns: str, secret_names: [str]):
 
     core_api = ctx.create_core_api()
 
-    # new metadata used to overwrite the ones from retrieved secrets
-    metadata = V1ObjectMeta(namespace=to_ns)
-
-    for name in secret_names:
+    def copy_secret(name):
         secret = core_api.read_namespaced_secret(name=name, namespace=from_ns, export=True)
-        metadata.name=name
-        secret.metadata = metadata
+        # new metadata used to overwrite the ones from retrieved secrets
+        secret.metadata = V1ObjectMeta(namespace=to_ns, name=name)
         core_api.create_namespaced_secret(namespace=to_ns, body=secret)
 
+    for _ in BoundedExecutor().map(copy_secret, secret_names):
+        pass
+
 def wait_for_ns(namespace):
     ensure_not_empty(namespace)
 
     core_api = ctx.create_core_api()
     w = watch.Watch()
-    for e in w.stream(core_api.list_namespace, _request_timeout=120):
-        # check if 'tis our namespace
-        ns = e['object'].metadata.name
-        if not ns == namespace:
-            continue
-        info(e['type'])
-        if not e['type'] == 'ADDED':
-            continue # ignore
-        w.stop()
+    with tracing.span('wait for namespace', category='kubernetes', args={'namespace': namespace}):
+        for e in w.stream(core_api.list_namespace, _request_timeout=120):
+            # check if 'tis our namespace
+            ns = e['object'].metadata.name
+            if not ns == namespace:
+                continue
+            info(e['type'])
+            if not e['type'] == 'ADDED':
+                continue # ignore
+            w.stop()
 
 def wait_for_shoot_cluster_operation_success(namespace:str, shoot_name:str, optype:str, timeout_seconds:int=120):
     ensure_not_empty(namespace)
@@ -550,6 +582,7 @@ def wait_for_shoot_cluster_to_become_healthy(namespace:str, shoot_name:str, time
         fail('cluster did not become healthy within {} minute(s)'.format(math.ceil(timeout_seconds/60)))
 
 
+@tracing.traced('wait for shoot', category='kubernetes')
 def _wait_for_shoot(namespace, on_event, expected_result, timeout_seconds:int=120):
     ensure_not_empty(namespace)
     start_time = int(time.time())
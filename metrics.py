@@ -0,0 +1,256 @@
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+A minimal, process-wide metrics registry (counters, gauges and histograms with labels),
+exposable in the Prometheus text format.
+
+Usage:
+------
+
+    import metrics
+    REQUEST_DURATION = metrics.histogram(
+        'concourse_api_request_duration_seconds',
+        description='duration of concourse API requests',
+        labelnames=('endpoint',),
+    )
+    with REQUEST_DURATION.labels(endpoint='pipelines').time():
+        ...
+
+cli.py writes all metrics upon exit if the global --metrics-file or --metrics-pushgateway
+arguments are given.
+'''
+
+import bisect
+import functools
+import math
+import threading
+import time
+
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _escape(value: str):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{k}="{v}"'.format(k=k, v=_escape(v)) for k, v in labels) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Child(object):
+    def __init__(self, lock):
+        self._lock = lock
+
+
+class _CounterChild(_Child):
+    def __init__(self, lock):
+        super().__init__(lock)
+        self.value = 0.0
+
+    def inc(self, amount: float=1):
+        if amount < 0:
+            raise ValueError('counters must not be decreased')
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name):
+        yield name, (), self.value
+
+
+class _GaugeChild(_Child):
+    def __init__(self, lock):
+        super().__init__(lock)
+        self.value = 0.0
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+    def inc(self, amount: float=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float=1):
+        self.inc(-amount)
+
+    def samples(self, name):
+        yield name, (), self.value
+
+
+class _HistogramChild(_Child):
+    def __init__(self, lock, buckets):
+        super().__init__(lock)
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if index < len(self.buckets):
+                self.bucket_counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self, name):
+        cumulative = 0
+        for upper_bound, count in zip(self.buckets, self.bucket_counts):
+            cumulative += count
+            yield name + '_bucket', (('le', _format_value(float(upper_bound))),), cumulative
+        yield name + '_bucket', (('le', '+Inf'),), self.count
+        yield name + '_sum', (), self.sum
+        yield name + '_count', (), self.count
+
+
+class Metric(object):
+    '''
+    A named metric with an optional set of label names. Values are recorded on the children
+    returned by `labels` (or directly on the metric if it has no labels).
+
+    Not intended to be instantiated by users of this module (see `counter`, `gauge` and
+    `histogram`).
+    '''
+    def __init__(self, name: str, metric_type: str, description: str, labelnames, child_factory):
+        self.name = name
+        self.metric_type = metric_type
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._child_factory = child_factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError('expected labels {e}, got {g}'.format(
+                e=', '.join(self.labelnames),
+                g=', '.join(labels),
+                )
+            )
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            child = self._children.get(key)
+            if not child:
+                child = self._child_factory(threading.Lock())
+                self._children[key] = child
+        return child
+
+    def __getattr__(self, name):
+        # allow calling inc/set/observe/time on metrics without labels
+        if name.startswith('_') or self.__dict__.get('labelnames'):
+            raise AttributeError(name)
+        return getattr(self.labels(), name)
+
+    def expose(self):
+        lines = [
+            '# HELP {n} {d}'.format(n=self.name, d=self.description.replace('\n', ' ')),
+            '# TYPE {n} {t}'.format(n=self.name, t=self.metric_type),
+        ]
+        with self._lock:
+            children = sorted(self._children.items())
+        for label_values, child in children:
+            labels = tuple(zip(self.labelnames, label_values))
+            for sample_name, sample_labels, value in child.samples(self.name):
+                lines.append('{n}{l} {v}'.format(
+                    n=sample_name,
+                    l=_format_labels(labels + sample_labels),
+                    v=_format_value(value),
+                    )
+                )
+        return '\n'.join(lines)
+
+
+class Registry(object):
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, metric_type: str, description: str, labelnames, child_factory):
+        '''
+        returns the metric registered with the given name, creating it if absent
+        '''
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric:
+                if metric.metric_type != metric_type or metric.labelnames != tuple(labelnames):
+                    raise ValueError('metric {n} was already registered differently'.format(n=name))
+                return metric
+            metric = Metric(name, metric_type, description, labelnames, child_factory)
+            self._metrics[name] = metric
+            return metric
+
+    def expose(self):
+        '''
+        returns all metrics in the Prometheus text exposition format
+        '''
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        return ''.join(m.expose() + '\n' for m in metrics)
+
+    def write(self, out_file: str):
+        with open(out_file, 'w') as f:
+            f.write(self.expose())
+
+    def push(self, gateway_url: str, job: str='cc-utils'):
+        '''
+        pushes all metrics to a Prometheus pushgateway (compatible endpoint)
+        '''
+        import requests
+        from util import urljoin
+
+        response = requests.put(
+            urljoin(gateway_url, 'metrics', 'job', job),
+            data=self.expose().encode('utf-8'),
+            headers={'Content-Type': 'text/plain; version=0.0.4'},
+        )
+        response.raise_for_status()
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, description: str, labelnames=()):
+    return REGISTRY.register(name, 'counter', description, labelnames, _CounterChild)
+
+
+def gauge(name: str, description: str, labelnames=()):
+    return REGISTRY.register(name, 'gauge', description, labelnames, _GaugeChild)
+
+
+def histogram(name: str, description: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+    buckets = tuple(sorted(buckets))
+    return REGISTRY.register(
+        name, 'histogram', description, labelnames, functools.partial(_HistogramChild, buckets=buckets)
+    )
@@ -12,14 +12,25 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections.abc
+import functools
+import hashlib
 import os
 import sys
 import json
+import threading
 
 from urllib.parse import urlparse
 
+import model.snapshot
 from model.base import NamedModelElement, ModelBase, ModelValidationError
-from util import ensure_file_exists, parse_yaml_file, ensure_directory_exists, ensure_not_none
+from util import (
+    ensure_file_exists,
+    parse_yaml_file,
+    ensure_directory_exists,
+    ensure_not_none,
+    freeze,
+)
 
 '''
 Configuration model and retrieval handling.
@@ -28,9 +39,9 @@ Users of this module will most likely want to create an instance of `ConfigFacto
 to create `ConfigurationSet` instances.
 
 Configuration sets are factories themselves, that are backed with a configuration source.
-They create concrete configuration instances. While technically modifiable, all configuration
-instances should not be altered by users. Configuration objects should usually not be
-instantiated by users of this module.
+They create concrete configuration instances. Configuration instances are read-only (their
+raw dicts are `util.FrozenDict`s) and may thus be shared between threads. Configuration objects
+should usually not be instantiated by users of this module.
 '''
 
 class ConfigFactory(object):
@@ -47,6 +58,7 @@ class ConfigFactory(object):
     '''
 
     CFG_TYPES = 'cfg_types'
+    SHARDS = 'shards'
 
     @staticmethod
     def from_cfg_dir(cfg_dir: str, cfg_types_file='config_types.yaml'):
@@ -56,49 +68,196 @@ class ConfigFactory(object):
 
         raw[ConfigFactory.CFG_TYPES] = cfg_types_dict
 
-        def parse_cfg(cfg_type):
+        def cfg_parser(cfg_type):
             # assume for now that there is exactly one cfg source (file)
             cfg_sources = list(cfg_type.sources())
             if not len(cfg_sources) == 1:
                 raise ValueError('currently, only exactly one cfg file is supported per type')
 
             cfg_file = cfg_sources[0].file()
-            parsed_cfg =  parse_yaml_file(os.path.join(cfg_dir, cfg_file), as_snd=False)
-            return parsed_cfg
+            return lambda: parse_yaml_file(os.path.join(cfg_dir, cfg_file), as_snd=False)
 
-        # parse all configurations
+        # configurations are parsed on first access
+        parsers = {}
         for cfg_type in map(ConfigType, cfg_types_dict.values()):
             cfg_name = cfg_type.cfg_type_name()
-            raw[cfg_name] = parse_cfg(cfg_type)
+            parsers[cfg_name] = cfg_parser(cfg_type)
 
 
+        return ConfigFactory(raw_dict=_LazyDict(values=raw, loaders=parsers))
+
+    @staticmethod
+    def from_snapshot(snapshot_file: str):
+        '''
+        creates a factory from a snapshot (see `ConfigSetSerialiser.serialise`). Elements are
+        decoded on first access.
+        '''
+        snapshot = model.snapshot.Snapshot(ensure_file_exists(snapshot_file))
+
+        def cfg_type_loader(cfg_type_name):
+            def load_cfg_type():
+                return _LazyDict(
+                    values={},
+                    loaders={
+                        cfg_name: functools.partial(snapshot.element, cfg_type_name, cfg_name)
+                        for cfg_name in snapshot.cfg_names(cfg_type_name)
+                    },
+                )
+            return load_cfg_type
+
+        raw = _LazyDict(
+            values={ConfigFactory.CFG_TYPES: snapshot.cfg_types},
+            loaders={t: cfg_type_loader(t) for t in snapshot.cfg_type_names()},
+        )
         return ConfigFactory(raw_dict=raw)
 
     @staticmethod
-    def from_dict(raw_dict: dict):
+    def from_dict(raw_dict: dict, retrieve_shard=None):
+        '''
+        @param retrieve_shard: callable returning the raw dict of the given shard (see
+            `ConfigSetSerialiser.serialise_sharded`). Required if `raw_dict` is a shard index
+        '''
         raw = ensure_not_none(raw_dict)
 
-        return ConfigFactory(raw_dict=raw)
+        return ConfigFactory(raw_dict=raw, retrieve_shard=retrieve_shard)
 
-    def __init__(self, raw_dict: dict):
+    def __init__(self, raw_dict: dict, retrieve_shard=None):
         self.raw = ensure_not_none(raw_dict)
         if not self.CFG_TYPES in self.raw:
             raise ValueError('missing required attribute: {ct}'.format(ct=self.CFG_TYPES))
+        # elements not contained in raw_dict, which are retrieved on first access
+        self._shards = self.raw.get(self.SHARDS, {})
+        if self._shards and not retrieve_shard:
+            raise ValueError('retrieve_shard is required to read sharded configurations')
+        self._retrieve_shard = retrieve_shard
+        # retrieved shards, keyed by (cfg_type_name, cfg_name) - kept separate from raw_dict
+        # (which is owned by the caller)
+        self._retrieved_shards = {}
+        self._shards_lock = threading.Lock()
+        self._cfg_types_index = None
+        self._element_types = {}
+        # constructed elements, keyed by (cfg_type_name, cfg_name)
+        self._elements = {}
+        # serialises the creation of (cached) elements - reads do not require it
+        self._lock = threading.RLock()
+        self._fingerprints = {}
+
+    def invalidate(self, cfg_type_name: str=None, cfg_name: str=None):
+        '''
+        drops cached elements (of the given type / with the given name), so they are created
+        again from `raw` on next access. Must be called after modifying `raw`. Without
+        arguments, the cfg_types index is also recomputed.
+        '''
+        with self._lock:
+            # cfg_set fingerprints depend on the elements they reference
+            self._fingerprints.clear()
+            if not cfg_type_name and not cfg_name:
+                self._cfg_types_index = None
+                self._element_types.clear()
+                self._elements.clear()
+                return
+            for type_name, name in list(self._elements.keys()):
+                if cfg_type_name and type_name != cfg_type_name:
+                    continue
+                if cfg_name and name != cfg_name:
+                    continue
+                del self._elements[(type_name, name)]
 
     def _configs(self, cfg_name: str):
         return self.raw[cfg_name]
 
+    def _raw_element(self, cfg_type_name: str, cfg_name: str):
+        if cfg_name in self._shards.get(cfg_type_name, ()) and \
+                cfg_name not in self.raw.get(cfg_type_name, {}):
+            return self._retrieved_shard(cfg_type_name, cfg_name)
+        return self._configs(cfg_type_name)[cfg_name]
+
+    def _retrieved_shard(self, cfg_type_name: str, cfg_name: str):
+        key = (cfg_type_name, cfg_name)
+        raw = self._retrieved_shards.get(key)
+        if raw is None:
+            with self._shards_lock:
+                # another thread may have retrieved the shard while we were waiting for the lock
+                raw = self._retrieved_shards.get(key)
+                if raw is None:
+                    raw = self._retrieve_shard(shard_name(cfg_type_name, cfg_name))
+                    self._retrieved_shards[key] = raw
+        return raw
+
     def _cfg_types(self):
-        return {cfg.cfg_type_name(): cfg for cfg in map(ConfigType, self.raw[self.CFG_TYPES].values())}
+        cfg_types_index = self._cfg_types_index
+        if cfg_types_index is None:
+            with self._lock:
+                cfg_types_index = self._cfg_types_index = {
+                    cfg.cfg_type_name(): cfg
+                    for cfg in map(ConfigType, self.raw[self.CFG_TYPES].values())
+                }
+        return cfg_types_index
 
     def _cfg_types_raw(self):
         return self.raw[self.CFG_TYPES]
 
+    def _cfg_names(self, cfg_type_name: str):
+        cfg_names = set(self._shards.get(cfg_type_name, ()))
+        if cfg_type_name in self.raw:
+            cfg_names.update(self._configs(cfg_type_name).keys())
+        return cfg_names
+
+    def fingerprint(self, cfg_type_name: str, cfg_name: str):
+        '''
+        returns a fingerprint of the contents of the given element (`None` if there is no such
+        element). The fingerprint of a cfg_set also covers all elements it references.
+        '''
+        cfg_fingerprint = self._fingerprints.get((cfg_type_name, cfg_name))
+        if cfg_fingerprint is not None:
+            return cfg_fingerprint
+        if cfg_name not in self._cfg_names(cfg_type_name):
+            return None
+
+        element = self._cfg_element(cfg_type_name, cfg_name)
+        if isinstance(element, ConfigurationSet):
+            cfg_fingerprint = fingerprint({
+                'raw': element.raw,
+                'elements': [
+                    (t, n, self.fingerprint(t, n))
+                    for t, mapping in sorted(element._cfg_mappings())
+                    for n in sorted(mapping['config_names'])
+                ],
+            })
+        else:
+            cfg_fingerprint = fingerprint(element.raw)
+
+        self._fingerprints[(cfg_type_name, cfg_name)] = cfg_fingerprint
+        return cfg_fingerprint
+
+    def fingerprints(self):
+        '''
+        returns the fingerprints of all elements as dict ({(cfg_type_name, cfg_name): fingerprint})
+        '''
+        return {
+            (cfg_type_name, cfg_name): self.fingerprint(cfg_type_name, cfg_name)
+            for cfg_type_name in self._cfg_types()
+            for cfg_name in self._cfg_names(cfg_type_name)
+        }
+
     def cfg_set(self, cfg_name: str)->'ConfigurationSet':
         '''
         returns a new `ConfigurationSet` instance for the specified config name backed by the
         configured configuration source.
         '''
+        cfg_set = self._elements.get(('cfg_set', cfg_name))
+        if cfg_set is not None:
+            return cfg_set
+
+        with self._lock:
+            # another thread may have created the cfg_set while we were waiting for the lock
+            cfg_set = self._elements.get(('cfg_set', cfg_name))
+            if cfg_set is None:
+                cfg_set = self._create_cfg_set(cfg_name)
+                self._elements[('cfg_set', cfg_name)] = cfg_set
+            return cfg_set
+
+    def _create_cfg_set(self, cfg_name):
         configs_dict = self._configs('cfg_set')
 
         if not cfg_name in configs_dict:
@@ -113,7 +272,11 @@ class ConfigFactory(object):
             raw_dict=configs_dict[cfg_name]
         )
 
-    def _cfg_element(self, cfg_type_name: str, cfg_name: str):
+    def _element_type(self, cfg_type_name: str):
+        element_type = self._element_types.get(cfg_type_name)
+        if element_type is not None:
+            return element_type
+
         cfg_type = self._cfg_types().get(cfg_type_name, None)
         if not cfg_type:
             raise ValueError('unknown cfg_type: ' + str(cfg_type_name))
@@ -124,17 +287,40 @@ class ConfigFactory(object):
         if not type(element_type) == type:
             raise ValueError()
 
+        self._element_types[cfg_type_name] = element_type
+        return element_type
+
+    def _cfg_element(self, cfg_type_name: str, cfg_name: str):
+        '''
+        returns the element of the given type and name. Elements are created once and shared
+        between callers (see `invalidate`).
+        '''
+        element_instance = self._elements.get((cfg_type_name, cfg_name))
+        if element_instance is not None:
+            return element_instance
+
+        with self._lock:
+            # another thread may have created the element while we were waiting for the lock
+            element_instance = self._elements.get((cfg_type_name, cfg_name))
+            if element_instance is None:
+                element_instance = self._create_element(cfg_type_name, cfg_name)
+                self._elements[(cfg_type_name, cfg_name)] = element_instance
+            return element_instance
+
+    def _create_element(self, cfg_type_name: str, cfg_name: str):
+        element_type = self._element_type(cfg_type_name)
+
         # for now, let's assume all of our model element types are subtypes of NamedModelElement
-        # (with the exception of ConfigurationSet)
-        kwargs = {'raw_dict': self._configs(cfg_type.cfg_type_name())[cfg_name]}
+        # (with the exception of ConfigurationSet). Elements are read-only, so they can be
+        # shared (also between threads)
+        kwargs = {'raw_dict': freeze(self._raw_element(cfg_type_name, cfg_name))}
 
         if element_type == ConfigurationSet:
             kwargs.update({'cfg_name': cfg_name, 'cfg_factory': self})
         else:
             kwargs['name'] = cfg_name
 
-        element_instance = element_type(**kwargs)
-        return element_instance
+        return element_type(**kwargs)
 
     def concourse(self, cfg_name):
         return self._cfg_element(cfg_type_name='concourse', cfg_name=cfg_name)
@@ -161,6 +347,64 @@ class ConfigFactory(object):
         return self._cfg_element(cfg_type_name='protecode', cfg_name=cfg_name)
 
 
+class _LazyDict(collections.abc.MutableMapping):
+    '''
+    dict whose values are created by calling the given loaders on first access of the
+    respective key (e.g. to parse configuration files only if they are actually used).
+
+    Not intended to be used outside of this module
+    '''
+    def __init__(self, values: dict, loaders: dict):
+        self._values = dict(values)
+        self._loaders = {k: l for k, l in loaders.items() if k not in self._values}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        with self._lock:
+            # another thread may have loaded the value while we were waiting for the lock
+            if key in self._values:
+                return self._values[key]
+            loader = self._loaders[key]
+            value = self._values[key] = loader()
+            del self._loaders[key]
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._values[key] = value
+            self._loaders.pop(key, None)
+
+    def __delitem__(self, key):
+        with self._lock:
+            if key in self._values:
+                del self._values[key]
+            else:
+                del self._loaders[key]
+
+    def __contains__(self, key):
+        # do not load values only to check for their presence
+        return key in self._values or key in self._loaders
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._values.keys()) + list(self._loaders.keys()))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._values) + len(self._loaders)
+
+    def __repr__(self):
+        return '{c}(loaded={v}, pending={p})'.format(
+            c=self.__class__.__name__,
+            v=self._values,
+            p=list(self._loaders.keys()),
+        )
+
+
 class ConfigType(ModelBase):
     '''
     represents a configuration type (used for serialisation and deserialisation)
@@ -183,17 +427,134 @@ class ConfigTypeSource(ModelBase):
         return self.snd.file
 
 
+def fingerprint(value):
+    '''
+    returns a stable fingerprint (hex digest) of the given (json-serialisable) value's contents
+    '''
+    encoded = json.dumps(value, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ConfigDiff(object):
+    '''
+    The differences between two configurations (see `diff`). Elements are identified by
+    (cfg_type_name, cfg_name) tuples.
+    '''
+    def __init__(self, added, removed, changed):
+        self.added = frozenset(added)
+        self.removed = frozenset(removed)
+        self.changed = frozenset(changed)
+
+    def is_changed(self, cfg_type_name: str, cfg_name: str):
+        '''
+        returns whether the given element was added, removed or changed
+        '''
+        key = (cfg_type_name, cfg_name)
+        return key in self.added or key in self.removed or key in self.changed
+
+    def changed_elements(self, cfg_type_name: str=None):
+        '''
+        returns all added, removed or changed elements (of the given type)
+        '''
+        return {
+            key for key in self.added | self.removed | self.changed
+            if not cfg_type_name or key[0] == cfg_type_name
+        }
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def __repr__(self):
+        return 'ConfigDiff(added={a}, removed={r}, changed={c})'.format(
+            a=sorted(self.added),
+            r=sorted(self.removed),
+            c=sorted(self.changed),
+        )
+
+
+def diff(old_factory: ConfigFactory, new_factory: ConfigFactory) -> ConfigDiff:
+    '''
+    compares all elements of the given factories (e.g. created from two snapshots using
+    `ConfigFactory.from_snapshot`) based on their fingerprints.
+    '''
+    old_fingerprints = old_factory.fingerprints()
+    new_fingerprints = new_factory.fingerprints()
+    return ConfigDiff(
+        added=new_fingerprints.keys() - old_fingerprints.keys(),
+        removed=old_fingerprints.keys() - new_fingerprints.keys(),
+        changed={
+            key for key, new_fingerprint in new_fingerprints.items()
+            if key in old_fingerprints and old_fingerprints[key] != new_fingerprint
+        },
+    )
+
+
+def shard_name(cfg_type_name: str, cfg_name: str):
+    '''
+    returns the name of the document containing the given element in a sharded serialisation
+    '''
+    return '{t}.{n}'.format(t=cfg_type_name, n=cfg_name)
+
+
 class ConfigSetSerialiser(object):
     def __init__(self, cfg_sets: 'ConfigurationSet', cfg_factory: ConfigFactory):
         self.cfg_sets = ensure_not_none(cfg_sets)
         self.cfg_factory = ensure_not_none(cfg_factory)
 
     def serialise(self, output_format='json'):
+        '''
+        returns the serialised cfg_sets (and all referenced elements). Supported output formats:
+
+        - json: one json document (str)
+        - snapshot: binary snapshot (bytes) - see `model.snapshot`
+        '''
+        if output_format == 'snapshot':
+            return self._serialise_snapshot()
         if not output_format == 'json':
             raise ValueError('not implemented')
         if len(self.cfg_sets) < 1:
             return '{}' # early exit for empty cfg_sets-set
 
+        serialised_elements = self._serialised_elements()
+
+        # store cfg_set
+        serialised_elements['cfg_set'] = {cfg.name() : cfg.raw for cfg in self.cfg_sets}
+
+        # store cfg_types metadata (TODO: patch source attributes)
+        serialised_elements[ConfigFactory.CFG_TYPES] = self.cfg_factory._cfg_types_raw()
+
+        return json.dumps(serialised_elements, indent=2)
+
+    def _serialise_snapshot(self):
+        elements = self._serialised_elements() if self.cfg_sets else {}
+        elements['cfg_set'] = {cfg.name() : cfg.raw for cfg in self.cfg_sets}
+        return model.snapshot.serialise(
+            cfg_types=self.cfg_factory._cfg_types_raw(),
+            elements=elements,
+        )
+
+    def serialise_sharded(self):
+        '''
+        returns a dict of serialised (json) documents: an index (named 'index') containing the
+        cfg_sets and cfg_types, and one document per referenced element (see `shard_name`).
+        Consumers only need to retrieve the elements they actually use (see
+        `ConfigFactory.from_dict`).
+        '''
+        documents = {}
+        index = {
+            'cfg_set': {cfg.name() : cfg.raw for cfg in self.cfg_sets},
+            ConfigFactory.CFG_TYPES: self.cfg_factory._cfg_types_raw(),
+            ConfigFactory.SHARDS: {},
+        }
+        for cfg_type_name, elem_cfgs in self._serialised_elements().items():
+            index[ConfigFactory.SHARDS][cfg_type_name] = sorted(elem_cfgs.keys())
+            for cfg_name, raw in elem_cfgs.items():
+                documents[shard_name(cfg_type_name, cfg_name)] = json.dumps(raw, indent=2)
+
+        documents['index'] = json.dumps(index, indent=2)
+        return documents
+
+    def _serialised_elements(self):
         cfg_types = self.cfg_factory._cfg_types()
         # collect all cfg_names (<cfg-type>:[cfg-name])
         cfg_mappings = {}
@@ -215,15 +576,7 @@ class ConfigSetSerialiser(object):
 
             return (cfg_type.cfg_type_name(), elem_cfgs)
 
-        serialised_elements = dict([serialise_element(t, n) for t, n in cfg_mappings.items()])
-
-        # store cfg_set
-        serialised_elements['cfg_set'] = {cfg.name() : cfg.raw for cfg in self.cfg_sets}
-
-        # store cfg_types metadata (TODO: patch source attributes)
-        serialised_elements[ConfigFactory.CFG_TYPES] = self.cfg_factory._cfg_types_raw()
-
-        return json.dumps(serialised_elements, indent=2)
+        return dict([serialise_element(t, n) for t, n in cfg_mappings.items()])
 
 
 class ConfigurationSet(NamedModelElement):
@@ -234,25 +587,33 @@ class ConfigurationSet(NamedModelElement):
 
     Not intended to be instantiated by users of this module
     '''
-    def __init__(self, cfg_factory, cfg_name, *args, **kwargs):
+    def __init__(self, cfg_factory, cfg_name, raw_dict, *args, **kwargs):
         self.cfg_factory = ensure_not_none(cfg_factory)
-        super().__init__(name=cfg_name, *args, **kwargs)
 
-        # normalise cfg mappings
-        for cfg_type_name, entry in self.raw.items():
-            if type(entry) == dict:
+        # normalise cfg mappings (into a new, read-only dict - raw_dict is owned by cfg_factory)
+        normalised_dict = {}
+        for cfg_type_name, entry in ensure_not_none(raw_dict).items():
+            if isinstance(entry, dict):
                 entry = {
                     'config_names': entry['config_names'],
                     'default': entry.get('default', None)
                 }
-            elif type(entry) == str:
+            elif isinstance(entry, str):
                 entry = {'config_names': [entry], 'default': entry}
 
-            self.raw[cfg_type_name] = entry
+            normalised_dict[cfg_type_name] = entry
+
+        super().__init__(name=cfg_name, raw_dict=freeze(normalised_dict), *args, **kwargs)
 
     def _cfg_mappings(self):
         return self.raw.items()
 
+    def fingerprint(self):
+        '''
+        returns a fingerprint covering this cfg_set and all elements it references
+        '''
+        return self.cfg_factory.fingerprint(cfg_type_name='cfg_set', cfg_name=self.name())
+
     def _cfg_element(self, cfg_type_name: str, cfg_name=None):
         if not cfg_name:
             cfg_name = self.raw[cfg_type_name]['default']
@@ -614,6 +975,12 @@ class SecretsServerConfig(NamedModelElement):
     def secrets(self):
         return SecretsServerSecrets(raw_dict=self.raw['secrets'])
 
+    def image(self):
+        '''
+        the container image to run the secrets-server with (`None`: use the default image)
+        '''
+        return self.raw.get('image')
+
 
 class SecretsServerSecrets(ModelBase):
     def concourse_secret_name(self):
@@ -11,7 +11,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from util import ensure_not_none, SimpleNamespaceDict
+from util import ensure_not_none, NamespaceView
 
 class ModelValidationError(ValueError):
     '''
@@ -30,8 +30,10 @@ class ModelBase(object):
     attributes be contained in the given dictionary (ModelValidationError is raised on absent attribs).
     '''
     def __init__(self, raw_dict):
+        if isinstance(raw_dict, NamespaceView):
+            raw_dict = raw_dict.unwrap()
         self.raw = ensure_not_none(raw_dict)
-        self.snd = SimpleNamespaceDict(raw_dict)
+        self.snd = NamespaceView(raw_dict)
         self._validate_dict()
 
     def _required_attributes(self):
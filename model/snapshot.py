@@ -0,0 +1,139 @@
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Binary configuration snapshots, which can be loaded without decoding all contained elements.
+
+Layout (all integers big-endian):
+
+    magic (8 bytes) | version (uint16) | index length (uint32) | index | data
+
+The index is a JSON document containing the cfg_types and the offset (relative to the start of
+the data section) and length of one type index per cfg type. A type index (stored in the data
+section) in turn contains offset and length of each element of its type. Type indices and
+elements are stored as compact JSON documents, and decoded on first use.
+
+Usage:
+------
+
+    data = snapshot.serialise(cfg_types=cfg_types, elements={'github': {'name': raw}})
+    ...
+    with snapshot.Snapshot(path) as s:
+        s.element('github', 'name')
+
+See `model.ConfigSetSerialiser` and `model.ConfigFactory.from_snapshot`.
+'''
+
+import json
+import mmap
+import struct
+
+MAGIC = b'CCCFGSNP'
+VERSION = 1
+_HEADER = struct.Struct('>8sHI')
+
+
+def _encode(value):
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def serialise(cfg_types: dict, elements: dict) -> bytes:
+    '''
+    @param elements: {<cfg_type_name>: {<cfg_name>: <raw_dict>}}
+    '''
+    index = {'cfg_types': cfg_types, 'type_indices': {}}
+    data = []
+    offset = 0
+
+    def append(document):
+        nonlocal offset
+        encoded = _encode(document)
+        data.append(encoded)
+        offset += len(encoded)
+        return (offset - len(encoded), len(encoded))
+
+    for cfg_type_name, elem_cfgs in elements.items():
+        type_index = {cfg_name: append(raw) for cfg_name, raw in elem_cfgs.items()}
+        index['type_indices'][cfg_type_name] = append(type_index)
+
+    encoded_index = _encode(index)
+    header = _HEADER.pack(MAGIC, VERSION, len(encoded_index))
+    return b''.join([header, encoded_index] + data)
+
+
+def is_snapshot(path: str):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class Snapshot(object):
+    '''
+    A (memory-mapped) snapshot file. Type indices are decoded once, elements on each call of
+    `element`.
+    '''
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                raise ValueError('not a cfg snapshot: ' + path)
+            magic, version, index_length = _HEADER.unpack(header)
+            if not magic == MAGIC:
+                raise ValueError('not a cfg snapshot: ' + path)
+            if not version == VERSION:
+                raise ValueError('unsupported cfg snapshot version {v} (expected {e}): {p}'.format(
+                    v=version,
+                    e=VERSION,
+                    p=path,
+                    )
+                )
+            # the mapping stays valid after the file is closed
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        index_end = _HEADER.size + index_length
+        index = json.loads(self._data[_HEADER.size:index_end])
+        self._data_offset = index_end
+        self.cfg_types = index['cfg_types']
+        self._type_index_locations = index['type_indices']
+        self._type_indices = {}
+
+    def _decode(self, location):
+        offset, length = location
+        start = self._data_offset + offset
+        return json.loads(self._data[start:start + length])
+
+    def _type_index(self, cfg_type_name: str):
+        type_index = self._type_indices.get(cfg_type_name)
+        if type_index is None:
+            type_index = self._decode(self._type_index_locations[cfg_type_name])
+            self._type_indices[cfg_type_name] = type_index
+        return type_index
+
+    def cfg_type_names(self):
+        return self._type_index_locations.keys()
+
+    def cfg_names(self, cfg_type_name: str):
+        return self._type_index(cfg_type_name).keys()
+
+    def element(self, cfg_type_name: str, cfg_name: str):
+        return self._decode(self._type_index(cfg_type_name)[cfg_name])
+
+    def close(self):
+        self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,151 @@
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Profiling helpers used by cli.py (see the global --profile and --profile-imports arguments).
+'''
+
+import builtins
+import os
+import pstats
+import sys
+import time
+
+from util import CliHints
+
+
+class ImportTimer(object):
+    '''
+    Records the time spent importing modules as a tree (similar to `python -X importtime`).
+    Once installed, all modules that are newly imported through `import` statements
+    (or `__import__`) are recorded, along with the modules they import in turn.
+    '''
+    class _Node(object):
+        def __init__(self, name):
+            self.name = name
+            self.cumulative = 0.0
+            self.children = []
+
+        def self_time(self):
+            return self.cumulative - sum(c.cumulative for c in self.children)
+
+    def __init__(self):
+        self.root = ImportTimer._Node(name=None)
+        self._stack = [self.root]
+        self._original_import = None
+
+    def install(self):
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def uninstall(self):
+        if self._original_import:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # only record imports of modules that were not imported before (omit relative imports
+        # of already loaded packages, which would require resolving the package name)
+        if level != 0 or name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        node = ImportTimer._Node(name=name)
+        self._stack[-1].children.append(node)
+        self._stack.append(node)
+        start = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            node.cumulative = time.perf_counter() - start
+            self._stack.pop()
+
+    def write_tree(self, out_file):
+        def write_node(f, node, depth):
+            f.write('{s:>10} | {c:>10} | {i}{n}\n'.format(
+                s=int(node.self_time() * 1e6),
+                c=int(node.cumulative * 1e6),
+                i='  ' * depth,
+                n=node.name,
+                )
+            )
+            for child in node.children:
+                write_node(f, child, depth + 1)
+
+        with open(out_file, 'w') as f:
+            f.write('{s:>10} | {c:>10} | imported module\n'.format(s='self [us]', c='cumulative'))
+            for child in self.root.children:
+                write_node(f, child, 0)
+            f.write('total: {t:.3f}s\n'.format(t=sum(c.cumulative for c in self.root.children)))
+
+
+def _function_label(func):
+    filename, lineno, funcname = func
+    if filename == '~':
+        return funcname # built-in function
+    return '{f}:{l}({n})'.format(f=os.path.basename(filename), l=lineno, n=funcname)
+
+
+def collapsed_stacks(stats: pstats.Stats):
+    '''
+    converts the given profiling stats into collapsed stacks (as consumed by flamegraph.pl
+    or speedscope), mapping each stack to its self time in microseconds.
+
+    As cProfile only records caller/callee pairs rather than complete stacks, the time of
+    functions called from several call sites is attributed proportionally to their callers.
+    '''
+    # pylint: disable=no-member
+    raw_stats = stats.stats
+    # pylint: enable=no-member
+    callees = {}
+    for func, (_, _, _, _, callers) in raw_stats.items():
+        for caller, caller_stats in callers.items():
+            callees.setdefault(caller, {})[func] = caller_stats[3] # cumulative time via caller
+
+    stacks = {}
+
+    def visit(func, stack, share):
+        _, _, total_time, cumulative_time, _ = raw_stats[func]
+        if cumulative_time <= 0:
+            return
+        ratio = min(share / cumulative_time, 1.0)
+        stack = stack + [_function_label(func)]
+        self_us = int(total_time * ratio * 1e6)
+        if self_us > 0:
+            key = ';'.join(stack)
+            stacks[key] = stacks.get(key, 0) + self_us
+        for callee, callee_time in callees.get(func, {}).items():
+            if callee in raw_stats and _function_label(callee) not in stack: # omit recursion
+                visit(callee, stack, callee_time * ratio)
+
+    roots = [func for func, (_, _, _, _, callers) in raw_stats.items() if not callers]
+    for root in roots:
+        visit(root, [], raw_stats[root][3])
+
+    return stacks
+
+
+def write_stats(stats: pstats.Stats, out_file: str, output_format: str='pstats'):
+    if output_format == 'pstats':
+        stats.dump_stats(out_file)
+    elif output_format == 'collapsed':
+        with open(out_file, 'w') as f:
+            for stack, self_us in sorted(collapsed_stacks(stats).items()):
+                f.write('{s} {t}\n'.format(s=stack, t=self_us))
+    else:
+        raise ValueError('unsupported profile format: ' + str(output_format))
+
+
+def collapse_stats(stats_file: CliHints.existing_file(), out_file: str):
+    '''converts a pstats file (as written by --profile) into collapsed stacks'''
+    write_stats(pstats.Stats(stats_file), out_file=out_file, output_format='collapsed')
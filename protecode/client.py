@@ -15,10 +15,8 @@
 from functools import partial
 from urllib.parse import urlencode
 
-import requests
-
 from util import not_empty, not_none, urljoin
-from http_requests import AuthenticatedRequestBuilder
+from http_requests import AuthenticatedRequestBuilder, shared_session
 
 class ProtecodeApiRoutes(object):
     def __init__(self, base_url):
@@ -63,9 +61,14 @@ class ProtecodeApi(object):
             verify_ssl=tls_verify
         )
 
-        self._get = partial(requests.get, verify=tls_verify)
-        self._post = partial(requests.post, verify=tls_verify)
-        self._put = partial(requests.put, verify=tls_verify)
+        self._tls_verify = tls_verify
+        self._get = partial(self._request, 'GET')
+        self._post = partial(self._request, 'POST')
+        self._put = partial(self._request, 'PUT')
+
+    def _request(self, method: str, url: str, **kwargs):
+        # use the pooled session shared with _request_builder (see http_requests.shared_session)
+        return shared_session(url).request(method, url, verify=self._tls_verify, **kwargs)
 
     def upload(self, application_name, group_id, data, custom_attribs={}):
         url = self._routes.upload(file_name=application_name)
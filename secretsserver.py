@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+A (threaded) HTTP server serving the files below a secrets directory (e.g. a mounted
+kubernetes secret) to config.SecretsServerClient.
+
+All files are kept in memory, along with their digest (sent as ETag) and a gzip-compressed
+copy. Conditional requests (If-None-Match / If-Modified-Since) are answered with 304. The
+directory is checked for changes (at most every CHECK_INTERVAL seconds, upon requests) and
+reloaded if its contents changed. Hidden files and directories are not served (kubernetes
+mounts secrets using hidden directories, e.g. `..data`).
+
+Serialised configurations (see config.serialise_cfg) are additionally served per cfg_set (the
+documents of the MAX_CFG_SETS most recently requested cfg_sets are kept in memory):
+
+    <cfg file>/<cfg_set>            the given cfg_set (and all referenced elements)
+    <cfg file>/<cfg_set>/index      the given cfg_set (sharded, see ConfigSetSerialiser)
+    <cfg file>/<cfg_set>/<shard>    one element referenced by the given cfg_set
+
+Start the server with:
+
+    secretsserver.py --secrets-dir <dir> [--port <port>]
+'''
+
+import argparse
+import collections
+import email.utils
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import unquote, urlsplit
+
+import ctx
+from model import ConfigFactory, ConfigSetSerialiser
+from util import verbose
+
+# min. seconds between checks of the secrets dir for changes
+CHECK_INTERVAL = 5
+# smaller documents are not compressed
+GZIP_MIN_SIZE = 256
+# max. number of cfg_sets whose documents are kept in memory
+MAX_CFG_SETS = 8
+_GZIP_ETAG_SUFFIX = '-gzip"'
+
+
+class _Resource(object):
+    def __init__(self, content: bytes, mtime: float, content_type: str='application/octet-stream'):
+        self.content = content
+        self.mtime = mtime
+        self.content_type = content_type
+        self.etag = '"{d}"'.format(d=hashlib.sha256(content).hexdigest())
+        self.last_modified = email.utils.formatdate(mtime, usegmt=True)
+        self.gzipped = None
+        if len(content) >= GZIP_MIN_SIZE:
+            gzipped = gzip.compress(content)
+            if len(gzipped) < len(content):
+                self.gzipped = gzipped
+
+    def matches(self, etags: str):
+        # etags: value of an If-None-Match header
+        for etag in etags.split(','):
+            etag = etag.strip()
+            if etag == '*':
+                return True
+            if etag.startswith('W/'):
+                etag = etag[2:]
+            if etag.endswith(_GZIP_ETAG_SUFFIX):
+                etag = etag[:-len(_GZIP_ETAG_SUFFIX)] + '"'
+            if etag == self.etag:
+                return True
+        return False
+
+
+class SecretsIndex(object):
+    '''
+    In-memory copy of all (non-hidden) files below the given directory. Per-cfg_set documents
+    are created on first request; those of the `max_cfg_sets` most recently requested cfg_sets
+    are kept.
+    '''
+    def __init__(self, secrets_dir: str, max_cfg_sets: int=MAX_CFG_SETS):
+        self.secrets_dir = secrets_dir
+        self.max_cfg_sets = max_cfg_sets
+        # determined before reading, so changes while reading are detected by the next check
+        self.version = ctx._dir_version(secrets_dir)
+        self._resources = {}
+        self._files = set()
+        self._cfg_factories = {}
+        # (cfg file, cfg_set name) -> {path: resource}, least recently requested first
+        self._cfg_set_resources = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        for path, _, _ in self.version:
+            try:
+                with open(os.path.join(secrets_dir, path), 'rb') as f:
+                    content = f.read()
+                mtime = os.path.getmtime(os.path.join(secrets_dir, path))
+            except FileNotFoundError:
+                continue
+            path = path.replace(os.sep, '/')
+            self._resources[path] = _Resource(content=content, mtime=mtime)
+            self._files.add(path)
+
+    def resource(self, path: str):
+        '''
+        returns the resource to be served for the given (url) path, or `None` if there is none
+        '''
+        path = posixpath.normpath('/' + path).lstrip('/')
+        resource = self._resources.get(path)
+        if resource is not None:
+            return resource
+        with self._lock:
+            return self._cfg_set_resource(path)
+
+    def _cfg_factory(self, cfg_file: str):
+        # returns None if the given file is not a serialised configuration
+        if cfg_file in self._cfg_factories:
+            return self._cfg_factories[cfg_file]
+        try:
+            raw = json.loads(self._resources[cfg_file].content.decode('utf-8'))
+            factory = ConfigFactory.from_dict(raw) if isinstance(raw, dict) else None
+        except ValueError:
+            factory = None
+        self._cfg_factories[cfg_file] = factory
+        return factory
+
+    def _cfg_set_resource(self, path: str):
+        # must only be called while holding the lock
+        # path: <cfg file>/<cfg_set>[/<shard>]
+        cfg_file = posixpath.dirname(path)
+        if cfg_file not in self._files:
+            cfg_file = posixpath.dirname(cfg_file)
+            if cfg_file not in self._files:
+                return None
+        factory = self._cfg_factory(cfg_file)
+        if not factory:
+            return None
+
+        cfg_set_name = path[len(cfg_file) + 1:].split('/')[0]
+        key = (cfg_file, cfg_set_name)
+        if key in self._cfg_set_resources:
+            self._cfg_set_resources.move_to_end(key)
+            return self._cfg_set_resources[key].get(path)
+        if cfg_set_name not in factory._cfg_names('cfg_set'):
+            return None
+
+        serialiser = ConfigSetSerialiser(
+            cfg_sets=[factory.cfg_set(cfg_set_name)],
+            cfg_factory=factory,
+        )
+        mtime = self._resources[cfg_file].mtime
+        cfg_set_path = posixpath.join(cfg_file, cfg_set_name)
+        documents = {cfg_set_path: serialiser.serialise(output_format='json')}
+        for shard, document in serialiser.serialise_sharded().items():
+            documents[posixpath.join(cfg_set_path, shard)] = document
+        resources = {
+            document_path: _Resource(
+                content=document.encode('utf-8'),
+                mtime=mtime,
+                content_type='application/json',
+            )
+            for document_path, document in documents.items()
+        }
+        self._cfg_set_resources[key] = resources
+        while len(self._cfg_set_resources) > self.max_cfg_sets:
+            self._cfg_set_resources.popitem(last=False)
+        return resources.get(path)
+
+
+class SecretsRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep connections alive
+    server_version = 'cc-secrets-server'
+    # headers and body are written separately - avoid delayed ACKs on kept-alive connections
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._respond(include_body=True)
+
+    def do_HEAD(self):
+        self._respond(include_body=False)
+
+    def _respond(self, include_body: bool):
+        path = unquote(urlsplit(self.path).path)
+        resource = self.server.secrets_index().resource(path)
+        if resource is None:
+            self.send_error(404)
+            return
+
+        use_gzip = resource.gzipped is not None and \
+            'gzip' in self.headers.get('Accept-Encoding', '')
+        etag = resource.etag
+        if use_gzip:
+            etag = etag[:-1] + _GZIP_ETAG_SUFFIX
+
+        if self._not_modified(resource):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', resource.last_modified)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+
+        body = resource.gzipped if use_gzip else resource.content
+        self.send_response(200)
+        self.send_header('Content-Type', resource.content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', resource.last_modified)
+        self.send_header('Vary', 'Accept-Encoding')
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        if include_body:
+            self.wfile.write(body)
+
+    def _not_modified(self, resource: _Resource):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return resource.matches(if_none_match)
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if not if_modified_since:
+            return False
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(resource.mtime) <= since
+
+    def log_message(self, format, *args):
+        verbose(format % args)
+
+
+class SecretsServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, server_address, secrets_dir: str, check_interval: float=CHECK_INTERVAL):
+        self.secrets_dir = secrets_dir
+        self.check_interval = check_interval
+        self._index = SecretsIndex(secrets_dir)
+        self._checked = time.monotonic()
+        self._reload_lock = threading.Lock()
+        super().__init__(server_address, SecretsRequestHandler)
+
+    def secrets_index(self):
+        '''
+        returns the current index, reloading it first if the secrets dir's contents changed
+        '''
+        if time.monotonic() - self._checked < self.check_interval:
+            return self._index
+        # only one thread checks (and reloads) - the others keep serving the current index
+        if not self._reload_lock.acquire(blocking=False):
+            return self._index
+        try:
+            self._checked = time.monotonic()
+            if ctx._dir_version(self.secrets_dir) != self._index.version:
+                self._index = SecretsIndex(self.secrets_dir)
+        finally:
+            self._reload_lock.release()
+        return self._index
+
+
+def serve(secrets_dir: str, port: int=8080, host: str=''):
+    '''serves the files below the given directory (see module docstring)'''
+    server = SecretsServer((host, port), secrets_dir=secrets_dir)
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--secrets-dir', required=True, help='directory containing the secrets to serve')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--host', default='', help='address to listen on (default: all interfaces)')
+    parsed = parser.parse_args()
+    serve(secrets_dir=parsed.secrets_dir, port=parsed.port, host=parsed.host)
+
+
+if __name__ == '__main__':
+    main()
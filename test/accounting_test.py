@@ -0,0 +1,128 @@
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import http.server
+import os
+import subprocess
+import sys
+import threading
+import unittest
+
+from io import StringIO
+from tempfile import TemporaryDirectory
+
+import requests
+
+import accounting as examinee
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = b'hello'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _ChunkedHandler(_Handler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for chunk in (b'hello', b'world!'):
+            self.wfile.write('{l:x}\r\n'.format(l=len(chunk)).encode() + chunk + b'\r\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+
+class ResourceAccountingTest(unittest.TestCase):
+    def setUp(self):
+        self.examinee = examinee.ResourceAccounting()
+        self.examinee.install()
+
+    def tearDown(self):
+        self.examinee.uninstall()
+
+    def test_subprocesses_are_recorded(self):
+        subprocess.run([sys.executable, '-c', 'pass'], check=True)
+
+        self.assertEqual(len(self.examinee.subprocesses), 1)
+        args, duration, returncode = self.examinee.subprocesses[0]
+        self.assertEqual(args, sys.executable + ' -c pass')
+        self.assertGreater(duration, 0)
+        self.assertEqual(returncode, 0)
+
+    def test_files_are_recorded(self):
+        with TemporaryDirectory() as tmpdir:
+            written_file = os.path.join(tmpdir, 'written')
+            with open(written_file, 'w') as f:
+                f.write('foo')
+            with open(written_file) as f:
+                f.read()
+            read_file = os.path.join(tmpdir, 'read')
+            with open(read_file, 'w'):
+                pass
+            self.examinee.files.pop(read_file)
+            with open(read_file):
+                pass
+
+        self.assertEqual(self.examinee.files, {written_file: True, read_file: False})
+
+    def _serve(self, handler, request_count, **kwargs):
+        server = http.server.HTTPServer(('127.0.0.1', 0), handler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            for _ in range(request_count):
+                requests.get('http://127.0.0.1:{p}/'.format(p=server.server_port), **kwargs).content
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+    def test_http_requests_are_recorded(self):
+        self._serve(_Handler, request_count=3)
+
+        stats = self.examinee.hosts['127.0.0.1']
+        self.assertEqual(len(stats.latencies), 3)
+        self.assertEqual(stats.bytes_received, 15)
+
+        report = StringIO()
+        self.examinee.write_report(report)
+        self.assertIn('http requests: 3', report.getvalue())
+
+    def test_bytes_of_chunked_responses_are_recorded(self):
+        self._serve(_ChunkedHandler, request_count=2, stream=True)
+
+        stats = self.examinee.hosts['127.0.0.1']
+        self.assertEqual(len(stats.latencies), 2)
+        self.assertEqual(stats.bytes_received, 22)
+
+    def test_uninstall(self):
+        self.examinee.uninstall()
+        subprocess.run([sys.executable, '-c', 'pass'], check=True)
+
+        self.assertEqual(self.examinee.subprocesses, [])
+        self.assertIsNone(examinee.ResourceAccounting.installed())
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(examinee._percentile(values, 50), 50)
+        self.assertEqual(examinee._percentile(values, 99), 99)
+        self.assertEqual(examinee._percentile([3], 90), 3)
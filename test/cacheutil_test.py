@@ -0,0 +1,165 @@
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+
+import cacheutil as examinee
+
+
+def _create_once(cache_dir, marker_dir, key):
+    def create():
+        # leave a marker for each invocation
+        tempfile.mkstemp(dir=marker_dir)
+        time.sleep(0.1)
+        return 'value'
+    cache = examinee.DiskCache(namespace='test', cache_dir=cache_dir)
+    return cache.get_or_create(key, create)
+
+
+class DiskCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.examinee = examinee.DiskCache(namespace='test', cache_dir=self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_put_and_get(self):
+        self.assertIsNone(self.examinee.get('key'))
+
+        self.examinee.put('key', {'a': [1, 2]}, metadata={'etag': 'abc'})
+
+        self.assertEqual(self.examinee.get('key'), {'a': [1, 2]})
+        self.assertEqual(self.examinee.get_entry('key')['metadata'], {'etag': 'abc'})
+        self.assertEqual(self.examinee.stats()['entries'], 1)
+        self.assertEqual((self.examinee.hits, self.examinee.misses), (2, 1))
+
+    def test_expired_entries_are_not_returned(self):
+        self.examinee.put('key', 'value', ttl=-1)
+
+        self.assertIsNone(self.examinee.get('key'))
+        self.assertEqual(self.examinee.get('key', default='default'), 'default')
+
+    def test_namespaces_are_separate(self):
+        other = examinee.DiskCache(namespace='other', cache_dir=self.tmpdir.name)
+        self.examinee.put('key', 'value')
+
+        self.assertIsNone(other.get('key'))
+
+        other.clear()
+        self.assertEqual(self.examinee.get('key'), 'value')
+
+        with self.assertRaises(ValueError):
+            examinee.DiskCache(namespace='../escape', cache_dir=self.tmpdir.name)
+
+    def test_directories_accessible_by_other_users_are_refused(self):
+        self.examinee.put('key', 'value')
+
+        os.chmod(self.examinee.directory, 0o755)
+        with self.assertRaises(examinee.UnsafeCacheDirectoryError):
+            examinee.DiskCache(namespace='test', cache_dir=self.tmpdir.name).get('key')
+
+        os.chmod(self.examinee.directory, 0o700)
+        os.chmod(self.tmpdir.name, 0o777)
+        with self.assertRaises(examinee.UnsafeCacheDirectoryError):
+            examinee.DiskCache(namespace='other', cache_dir=self.tmpdir.name).put('key', 'value')
+
+    def test_least_recently_used_entries_are_evicted(self):
+        self.examinee.put('first', b'x' * 100)
+        entry_size = self.examinee.stats()['size']
+        # room for two entries (keys are of slightly different length)
+        self.examinee.max_size = entry_size * 2 + 16
+
+        self.examinee.put('second', b'x' * 100)
+        # mark 'first' as recently used
+        past = time.time() - 10
+        os.utime(self.examinee._entry_file('second'), (past, past))
+        self.examinee.get('first')
+        self.examinee.put('third', b'x' * 100)
+
+        self.assertIsNotNone(self.examinee.get('first'))
+        self.assertIsNone(self.examinee.get('second'))
+        self.assertIsNotNone(self.examinee.get('third'))
+
+    def test_get_or_create(self):
+        calls = []
+
+        def create():
+            calls.append(1)
+            return 'value'
+
+        self.assertEqual(self.examinee.get_or_create('key', create), 'value')
+        self.assertEqual(self.examinee.get_or_create('key', create), 'value')
+        self.assertEqual(len(calls), 1)
+
+        self.examinee.delete('key')
+        self.examinee.get_or_create('key', create)
+        self.assertEqual(len(calls), 2)
+
+    def test_get_or_create_only_blocks_callers_for_the_same_key(self):
+        import threading
+
+        creating = threading.Event()
+        release = threading.Event()
+
+        def create_slowly():
+            creating.set()
+            release.wait(timeout=5)
+            return 'slow'
+
+        creator = threading.Thread(target=self.examinee.get_or_create, args=('slow', create_slowly))
+        creator.start()
+        creating.wait(timeout=5)
+        try:
+            # neither blocked by the pending creation of another key
+            self.assertEqual(self.examinee.get_or_create('fast', lambda: 'fast'), 'fast')
+            self.examinee.put('other', 'value')
+            self.assertTrue(creator.is_alive())
+        finally:
+            release.set()
+            creator.join()
+
+        self.assertEqual(self.examinee.get('slow'), 'slow')
+
+    def test_size_is_tracked_without_scanning_entries(self):
+        import unittest.mock
+
+        self.examinee.put('first', b'x' * 100)
+        with unittest.mock.patch.object(self.examinee, '_entries', wraps=self.examinee._entries) as entries:
+            for i in range(5):
+                self.examinee.put(str(i), b'x' * 100)
+            self.examinee.put('first', b'x' * 200)
+            self.examinee.delete('0')
+
+            entries.assert_not_called()
+        size = sum(size for _, size, _ in self.examinee._entries())
+        with self.examinee.lock():
+            self.assertEqual(self.examinee._read_size(), size)
+
+    def test_get_or_create_creates_once_across_processes(self):
+        marker_dir = os.path.join(self.tmpdir.name, 'markers')
+        os.mkdir(marker_dir)
+
+        with multiprocessing.Pool(4) as pool:
+            results = pool.starmap(
+                _create_once,
+                [(self.tmpdir.name, marker_dir, 'key')] * 4,
+            )
+
+        self.assertEqual(results, ['value'] * 4)
+        self.assertEqual(len(os.listdir(marker_dir)), 1)
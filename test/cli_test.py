@@ -16,6 +16,8 @@ import os
 import subprocess
 import unittest
 
+import cli as examinee
+
 # assumption: we reside exactly one directory below our sources
 SRC_DIR = os.path.abspath(
     os.path.join(
@@ -40,4 +42,165 @@ class CliTest(unittest.TestCase):
         self.assertEqual(result.stderr.strip(), '')
         self.assertEqual(result.returncode, 0)
 
+    def test_requested_module_name(self):
+        self.assertEqual(examinee._requested_module_name(['util', 'info']), 'util')
+        self.assertEqual(
+            examinee._requested_module_name(['--verbose', '--cfg-dir', 'util', 'config']),
+            'config',
+        )
+        self.assertIsNone(examinee._requested_module_name([]))
+        self.assertIsNone(examinee._requested_module_name(['--help']))
+
+    def test_manifest_contains_module_functions(self):
+        manifest = examinee.generate_manifest()
+        modules = manifest['modules']
+
+        self.assertIn('util', modules)
+        self.assertEqual(modules['util']['info'], ['msg'])
+        # private functions and modules defining 'main' must be skipped
+        self.assertNotIn('_quiet', modules['util'])
+        self.assertNotIn('cli', modules)
+
+    def test_batch(self):
+        commands = '\n'.join((
+            '# comments and empty lines are ignored',
+            '',
+            'util info --msg first',
+            'util fail --msg second',
+            '--quiet util info --msg third',
+        ))
+        for workers in ('1', '2'):
+            result = subprocess.run(
+                [CLI_PY, '--batch', '-', '--batch-workers', workers],
+                input=commands,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                universal_newlines=True
+            )
+            lines = result.stdout.strip().split('\n')
+
+            self.assertEqual(lines[0], 'INFO: first')
+            self.assertTrue(lines[1].startswith('batch [1/3] succeeded'))
+            self.assertEqual(lines[2], 'ERROR: second')
+            self.assertTrue(lines[3].startswith('batch [2/3] failed with exit code 1'))
+            # --quiet only applies to the third command
+            self.assertTrue(lines[4].startswith('batch [3/3] succeeded'))
+            self.assertTrue(lines[5].startswith('batch: 3 command(s), 1 failed'))
+            self.assertEqual(result.returncode, 1)
+
+    def test_concurrent_batch_commands_see_their_own_module_args(self):
+        import tempfile
+        import time
+        import unittest.mock
+        import ctx
+        import util
+
+        mismatches = []
+
+        def info(msg: str):
+            time.sleep(0.01)
+            if util.args.msg != msg:
+                mismatches.append((msg, util.args.msg))
+
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.batch') as batch_file:
+            batch_file.write('\n'.join('util info --msg m{i}'.format(i=i) for i in range(16)))
+            batch_file.flush()
+            global_args, _ = examinee._parse_global_args(
+                ['--quiet', '--batch', batch_file.name, '--batch-workers', '8']
+            )
+            # run_batch switches util into cli mode (which replaces util.Failure)
+            original_args, original_failure = ctx.args, util.Failure
+            try:
+                with unittest.mock.patch.object(util, 'info', info):
+                    examinee.run_batch(global_args)
+            finally:
+                ctx.args, util.Failure = original_args, original_failure
+
+        self.assertEqual(mismatches, [])
+
+    def test_sequential_batch_restores_global_args(self):
+        import tempfile
+        import ctx
+        import util
+
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.batch') as batch_file:
+            batch_file.write('util info --msg first\nutil info --msg second')
+            batch_file.flush()
+            global_args, _ = examinee._parse_global_args(['--quiet', '--batch', batch_file.name])
+            original_args, original_failure = ctx.args, util.Failure
+            try:
+                examinee.run_batch(global_args)
+                args_after_batch = ctx.args
+            finally:
+                ctx.args, util.Failure = original_args, original_failure
+
+        self.assertIs(args_after_batch, global_args)
+
+    def test_run_async_function(self):
+        import asyncio
+        import argparse
+        import http_requests
+
+        results = []
+        sessions = []
+
+        async def command(first: str, second: int=2):
+            sessions.append(http_requests.async_session())
+            await asyncio.sleep(0)
+            sessions.append(http_requests.async_session())
+            results.append((first, second))
+
+        runner = examinee.run_function(command)
+        runner(argparse.Namespace(first='a', second=3))
+
+        self.assertEqual(results, [('a', 3)])
+        # the session is shared within the loop and closed afterwards
+        self.assertIs(sessions[0], sessions[1])
+        self.assertEqual(http_requests._async_sessions, {})
+
+    def test_run_coroutine_cancels_pending_tasks(self):
+        import asyncio
+
+        cancelled = []
+
+        async def background():
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def command():
+            asyncio.ensure_future(background())
+            await asyncio.sleep(0)
+            return 42
+
+        self.assertEqual(examinee.run_coroutine(command()), 42)
+        self.assertEqual(cancelled, [True])
+
+    def test_run_coroutine_is_cancelled_by_sigterm(self):
+        import signal
+        import sys
+        import time
+
+        script = '\n'.join((
+            'import asyncio, sys',
+            'sys.path.insert(0, {d})'.format(d=repr(SRC_DIR)),
+            'import cli',
+            'async def command():',
+            '    print("started", flush=True)',
+            '    await asyncio.sleep(60)',
+            'cli.run_coroutine(command())',
+        ))
+        process = subprocess.Popen(
+            [sys.executable, '-c', script],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        self.assertEqual(process.stdout.readline().strip(), 'started')
+        time.sleep(0.1)
+        process.send_signal(signal.SIGTERM)
+        process.communicate(timeout=10)
 
+        self.assertEqual(process.returncode, 128 + signal.SIGTERM)
@@ -0,0 +1,85 @@
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import stat
+import subprocess
+import sys
+import time
+import unittest
+
+from tempfile import TemporaryDirectory
+
+import cliserver as examinee
+
+from test.cli_test import SRC_DIR, CLI_PY
+
+CLI_SERVER_PY = os.path.join(SRC_DIR, 'cliserver.py')
+
+
+class CliServerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = TemporaryDirectory()
+        cls.socket_path = os.path.join(cls.tmpdir.name, 'cli.sock')
+        cls.server = subprocess.Popen(
+            [sys.executable, CLI_SERVER_PY, '--socket', cls.socket_path],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        for _ in range(100):
+            if os.path.exists(cls.socket_path):
+                break
+            time.sleep(0.1)
+        else:
+            raise RuntimeError('cli server did not create its socket')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.terminate()
+        cls.server.wait()
+        cls.tmpdir.cleanup()
+
+    def run_cli(self, *argv):
+        env = dict(os.environ)
+        env['CC_CLI_SERVER_SOCKET'] = self.socket_path
+        return subprocess.run(
+            [CLI_PY] + list(argv),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            env=env,
+        )
+
+    def test_forwarded_command(self):
+        result = self.run_cli('util', 'info', '--msg', 'foobar')
+
+        self.assertEqual(result.stdout.strip(), 'INFO: foobar')
+        self.assertEqual(result.stderr.strip(), '')
+        self.assertEqual(result.returncode, 0)
+
+    def test_exit_code_is_forwarded(self):
+        result = self.run_cli('util', 'fail', '--msg', 'foobar')
+
+        self.assertEqual(result.stdout.strip(), 'ERROR: foobar')
+        self.assertEqual(result.returncode, 1)
+
+    def test_forward_to_absent_server(self):
+        self.assertIsNone(
+            examinee.forward(os.path.join(self.tmpdir.name, 'no-such-socket'), ['util'])
+        )
+
+    def test_socket_is_only_accessible_by_owner(self):
+        mode = stat.S_IMODE(os.stat(self.socket_path).st_mode)
+        self.assertEqual(mode & 0o077, 0)
@@ -0,0 +1,244 @@
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import http.server
+import json
+import os
+import tempfile
+import threading
+import unittest
+import unittest.mock
+
+from test._test_utils import capture_out
+from test.model_serialisation_test import simple_cfg_dict
+
+import config as examinee
+import ctx
+
+
+class _SecretsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers, path=self.path))
+        if self.headers.get('If-None-Match') == server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps(server.secrets).encode('utf-8')
+        self.send_response(200)
+        self.send_header('ETag', server.etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class SecretsServerClientTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.server = http.server.HTTPServer(('127.0.0.1', 0), _SecretsHandler)
+        self.server.requests = []
+        self.server.secrets = {'a_type': {'a_name': {'key': 'value'}}}
+        self.server.etag = '"v1"'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+    def server_url(self):
+        return 'http://127.0.0.1:{p}'.format(p=self.server.server_port)
+
+    def client(self, cache_ttl, cache_file=None):
+        return examinee.SecretsServerClient(
+            endpoint_url=self.server_url(),
+            concourse_secret_name='concourse-secrets',
+            cache_file=cache_file,
+            cache_dir=self.tmpdir.name,
+            cache_ttl=cache_ttl,
+        )
+
+    def test_fresh_secrets_are_not_retrieved_again(self):
+        self.assertEqual(self.client(cache_ttl=60).retrieve_secrets(), self.server.secrets)
+        # also shared between clients (i.e. processes)
+        self.assertEqual(self.client(cache_ttl=60).retrieve_secrets(), self.server.secrets)
+
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_stale_secrets_are_revalidated(self):
+        client = self.client(cache_ttl=0)
+        expected = dict(self.server.secrets)
+        client.retrieve_secrets()
+
+        self.server.secrets = {'changed': {}}
+        self.assertEqual(client.retrieve_secrets(), expected)
+        self.assertEqual(self.server.requests[-1]['If-None-Match'], '"v1"')
+
+        self.server.etag = '"v2"'
+        self.assertEqual(client.retrieve_secrets(), {'changed': {}})
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_cache_file(self):
+        cache_file = os.path.join(self.tmpdir.name, 'secrets.json')
+        self.client(cache_ttl=60, cache_file=cache_file).retrieve_secrets()
+
+        offline_client = examinee.SecretsServerClient(
+            endpoint_url=None,
+            concourse_secret_name=None,
+            cache_file=cache_file,
+        )
+        self.assertEqual(offline_client.retrieve_secrets(), self.server.secrets)
+
+    def test_secrets_are_only_cached_on_disk_if_requested(self):
+        client = examinee.SecretsServerClient(
+            endpoint_url=self.server_url(),
+            concourse_secret_name='concourse-secrets',
+            cache_ttl=60,
+        )
+        client.retrieve_secrets()
+        client.retrieve_secrets()
+
+        self.assertIsNone(client.cache)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_expired_secrets_are_removed_from_disk(self):
+        client = self.client(cache_ttl=0)
+        client.cache_max_age = -1 # expire immediately
+        client.retrieve_secrets()
+        client.cache_max_age = 60
+        client.concourse_secret_name = 'other-secrets'
+        client.retrieve_secrets()
+
+        self.assertEqual(client.cache.stats()['entries'], 1)
+        self.assertIsNotNone(client.cache.get_entry(self.server_url() + '/other-secrets'))
+
+    def test_existing_cache_file_is_used(self):
+        cache_file = os.path.join(self.tmpdir.name, 'secrets.json')
+        with open(cache_file, 'w') as f:
+            json.dump({'cached': {}}, f)
+
+        self.assertEqual(self.client(cache_ttl=0, cache_file=cache_file).retrieve_secrets(), {'cached': {}})
+        self.assertEqual(self.server.requests, [])
+
+    def test_retrieve_shard(self):
+        client = self.client(cache_ttl=60)
+        client.concourse_secret_name = 'concourse-secrets/index'
+
+        self.assertEqual(client.retrieve_shard('a_type.a_name'), self.server.secrets)
+        self.assertEqual(self.server.requests[-1]['path'], '/concourse-secrets/a_type.a_name')
+
+    def test_validator(self):
+        client = self.client(cache_ttl=0)
+        validator = client.validator()
+        self.assertEqual(client.validator(), validator)
+
+        self.server.secrets = {'changed': {}}
+        self.server.etag = '"v2"'
+        self.assertNotEqual(client.validator(), validator)
+
+
+class CfgFactoryFromSecretsServerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.HTTPServer(('127.0.0.1', 0), _SecretsHandler)
+        self.server.requests = []
+        self.server.secrets = simple_cfg_dict()
+        self.server.etag = '"v1"'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.args = ctx.args
+        self.check_interval = ctx.CFG_CHANGE_CHECK_INTERVAL
+        ctx.args = argparse.Namespace(cfg_dir=None)
+        ctx.CFG_CHANGE_CHECK_INTERVAL = 0
+        ctx.reload_cfg_factory()
+
+    def tearDown(self):
+        ctx.args = self.args
+        ctx.CFG_CHANGE_CHECK_INTERVAL = self.check_interval
+        ctx.reload_cfg_factory()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_secrets_are_revalidated_using_a_shared_client(self):
+        env = {
+            'SECRETS_SERVER_ENDPOINT': 'http://127.0.0.1:{p}'.format(p=self.server.server_port),
+            'SECRETS_SERVER_CONCOURSE_CFG_NAME': 'concourse-secrets',
+            'SECRETS_SERVER_CACHE_TTL': '0', # always revalidate
+        }
+        with unittest.mock.patch.dict(os.environ, env):
+            os.environ.pop('SECRETS_SERVER_CACHE', None)
+            os.environ.pop('SECRETS_SERVER_CACHE_DIR', None)
+            factory = ctx.cfg_factory()
+            self.assertIs(ctx.cfg_factory(), factory)
+
+        # only the first request retrieves the secrets, all others are conditional
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertNotIn('If-None-Match', self.server.requests[0])
+        for request in self.server.requests[1:]:
+            self.assertEqual(request['If-None-Match'], '"v1"')
+
+
+class QueryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.server = http.server.HTTPServer(('127.0.0.1', 0), _SecretsHandler)
+        self.server.requests = []
+        self.server.secrets = simple_cfg_dict()
+        self.server.etag = '"v1"'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.args = ctx.args
+        ctx.args = argparse.Namespace(
+            server_endpoint='http://127.0.0.1:{p}'.format(p=self.server.server_port),
+            concourse_cfg_name='concourse-secrets',
+            cache_file=None,
+        )
+
+    def tearDown(self):
+        ctx.args = self.args
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+    def query(self, *args, **kwargs):
+        with unittest.mock.patch.dict(os.environ, {'CC_CACHE_DIR': self.tmpdir.name}):
+            with capture_out() as (stdout, _):
+                examinee.query(*args, **kwargs)
+        return stdout.getvalue()
+
+    def test_json(self):
+        result = json.loads(self.query(
+            selectors=['a_type:first_value_of_a:some_value', 'a_type:second_value_of_a:some_value'],
+            attributes=True,
+        ))
+
+        self.assertEqual(result, {
+            'a_type:first_value_of_a:some_value': 123,
+            'a_type:second_value_of_a:some_value': 42,
+        })
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_shell(self):
+        result = self.query(
+            selectors=['a_type:first_value_of_a:name', 'VALUE=cfg_set:first_set:name'],
+            output_format='shell',
+        )
+
+        self.assertEqual(result.splitlines(), [
+            'A_TYPE_FIRST_VALUE_OF_A_NAME=first_value_of_a',
+            'VALUE=first_set',
+        ])
@@ -0,0 +1,73 @@
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import os
+import unittest
+from tempfile import TemporaryDirectory
+from textwrap import dedent
+
+import ctx as examinee
+
+
+class CfgFactoryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = TemporaryDirectory()
+        self._file('config_types.yaml', '''
+        a_type:
+          src:
+          - file: a_type_values
+          model:
+            cfg_type_name: a_type
+            type: NamedModelElement
+        ''')
+        self._file('a_type_values', '''
+        a_value:
+            some_value: 123
+        ''')
+        self.args = examinee.args
+        self.check_interval = examinee.CFG_CHANGE_CHECK_INTERVAL
+        examinee.args = argparse.Namespace(cfg_dir=self.tmpdir.name)
+        examinee.CFG_CHANGE_CHECK_INTERVAL = 0
+        examinee.reload_cfg_factory()
+
+    def tearDown(self):
+        examinee.args = self.args
+        examinee.CFG_CHANGE_CHECK_INTERVAL = self.check_interval
+        examinee.reload_cfg_factory()
+        self.tmpdir.cleanup()
+
+    def _file(self, name, contents):
+        with open(os.path.join(self.tmpdir.name, name), 'w') as f:
+            f.write(dedent(contents))
+
+    def test_cfg_factory_is_memoised(self):
+        self.assertIs(examinee.cfg_factory(), examinee.cfg_factory())
+
+    def test_cfg_factory_is_recreated_upon_changes(self):
+        factory = examinee.cfg_factory()
+        self._file('a_type_values', '''
+        a_value:
+            some_value: 42
+        ''')
+
+        changed_factory = examinee.cfg_factory()
+        self.assertIsNot(changed_factory, factory)
+        self.assertEqual(changed_factory._cfg_element('a_type', 'a_value').raw['some_value'], 42)
+
+    def test_reload_cfg_factory(self):
+        factory = examinee.cfg_factory()
+        examinee.reload_cfg_factory()
+
+        self.assertIsNot(examinee.cfg_factory(), factory)
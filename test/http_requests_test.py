@@ -0,0 +1,89 @@
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import http.server
+import json
+import os
+import threading
+import unittest
+import unittest.mock
+
+from test._test_utils import capture_out
+
+import http_requests as examinee
+
+
+class _KeepAliveHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append({'client': self.client_address, 'headers': dict(self.headers)})
+        body = json.dumps({'path': self.path}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Set-Cookie', 'session=secret')
+        if self.headers.get('Connection') == 'close':
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class AuthenticatedRequestBuilderTest(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _KeepAliveHandler)
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{p}/'.format(p=self.server.server_port)
+
+    def tearDown(self):
+        examinee.configure_sessions(pool_size=examinee.DEFAULT_POOL_SIZE, keep_alive=True)
+        self.server.shutdown()
+        self.server.server_close()
+
+    def connections(self):
+        return {request['client'] for request in self.server.requests}
+
+    def test_connections_are_shared_between_builders(self):
+        for i in range(3):
+            builder = examinee.AuthenticatedRequestBuilder(auth_token='token{i}'.format(i=i))
+            self.assertEqual(builder.get(self.url + str(i)), {'path': '/' + str(i)})
+
+        self.assertEqual(len(self.connections()), 1)
+        self.assertIs(examinee.shared_session(self.url), examinee.shared_session(self.url + 'x'))
+        # only the builder's own credentials are sent (no cookies retained from other callers)
+        self.assertEqual(self.server.requests[2]['headers']['Authorization'], 'Bearer token2')
+        self.assertNotIn('Cookie', self.server.requests[2]['headers'])
+
+    def test_keep_alive_can_be_disabled(self):
+        examinee.configure_sessions(keep_alive=False)
+        builder = examinee.AuthenticatedRequestBuilder()
+        for _ in range(3):
+            builder.get(self.url)
+
+        self.assertEqual(len(self.connections()), 3)
+
+    def test_invalid_pool_size(self):
+        with self.assertRaises(ValueError):
+            examinee.configure_sessions(pool_size=0)
+
+    def test_pool_size_is_read_from_env(self):
+        with unittest.mock.patch.object(examinee, '_pool_size', None):
+            with unittest.mock.patch.dict(os.environ, {examinee.POOL_SIZE_ENV_VAR: '3'}):
+                self.assertEqual(examinee._configured_pool_size(), 3)
+            with unittest.mock.patch.dict(os.environ, {examinee.POOL_SIZE_ENV_VAR: 'many'}):
+                with capture_out():
+                    self.assertEqual(examinee._configured_pool_size(), examinee.DEFAULT_POOL_SIZE)
@@ -13,13 +13,14 @@
 # limitations under the License.
 
 import unittest
+import unittest.mock
 from unittest.mock import MagicMock
 import types
 import sys
 
 from test._test_utils import capture_out
 import kubeutil
-from util import Failure
+from util import Failure, freeze
 
 class CtxTest(unittest.TestCase):
     def setUp(self):
@@ -54,4 +55,26 @@ class CtxTest(unittest.TestCase):
             with self.assertRaises(Failure):
                 self.examinee.get_kubecfg()
 
+    def test_set_kubecfg_with_frozen_auth_provider(self):
+        kubeconfig = freeze({
+            'users': [{
+                'name': 'a_user',
+                'user': {'auth-provider': {'name': 'gcp', 'config': {'access-token': 'old'}}},
+            }],
+        })
 
+        class RefreshingLoader(object):
+            def __init__(self, config_dict):
+                self.config_dict = config_dict
+
+            def load_and_set(self, configuration):
+                # as done by KubeConfigLoader upon refreshing gcp tokens
+                provider = self.config_dict['users'][0]['user']['auth-provider']
+                provider['config']['access-token'] = 'refreshed'
+
+        with unittest.mock.patch.object(kubeutil, 'KubeConfigLoader', RefreshingLoader):
+            with unittest.mock.patch.object(kubeutil.kubernetes.client.Configuration, 'set_default'):
+                self.examinee.set_kubecfg(kubeconfig)
+
+        provider = kubeconfig['users'][0]['user']['auth-provider']
+        self.assertEqual(provider['config']['access-token'], 'old')
@@ -0,0 +1,141 @@
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import http.server
+import os
+import threading
+import unittest
+
+from tempfile import TemporaryDirectory
+
+import metrics as examinee
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = examinee.Registry()
+
+    def counter(self, labelnames=()):
+        return self.registry.register(
+            'test_total', 'counter', 'a test counter', labelnames, examinee._CounterChild
+        )
+
+    def test_counter_exposition(self):
+        counter = self.counter(labelnames=('endpoint',))
+        counter.labels(endpoint='pipelines').inc()
+        counter.labels(endpoint='pipelines').inc(2)
+        counter.labels(endpoint='a"b').inc()
+
+        self.assertEqual(
+            self.registry.expose(),
+            '# HELP test_total a test counter\n'
+            '# TYPE test_total counter\n'
+            'test_total{endpoint="a\\"b"} 1\n'
+            'test_total{endpoint="pipelines"} 3\n'
+        )
+
+    def test_counter_must_not_decrease(self):
+        with self.assertRaises(ValueError):
+            self.counter().inc(-1)
+
+    def test_labels_must_match(self):
+        counter = self.counter(labelnames=('endpoint',))
+        with self.assertRaises(ValueError):
+            counter.labels(pipeline='foo')
+        with self.assertRaises(AttributeError):
+            counter.inc()
+
+    def test_reregistration(self):
+        self.assertIs(self.counter(), self.counter())
+        with self.assertRaises(ValueError):
+            self.counter(labelnames=('endpoint',))
+
+    def test_gauge(self):
+        gauge = self.registry.register('test_gauge', 'gauge', 'a gauge', (), examinee._GaugeChild)
+        gauge.set(5)
+        gauge.dec(1.5)
+
+        self.assertIn('test_gauge 3.5\n', self.registry.expose())
+
+    def test_histogram_exposition(self):
+        histogram = self.registry.register(
+            'test_seconds',
+            'histogram',
+            'a histogram',
+            (),
+            lambda lock: examinee._HistogramChild(lock, buckets=(0.1, 1.0)),
+        )
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+
+        lines = self.registry.expose().splitlines()[2:]
+        self.assertEqual(
+            lines,
+            [
+                'test_seconds_bucket{le="0.1"} 1',
+                'test_seconds_bucket{le="1"} 2',
+                'test_seconds_bucket{le="+Inf"} 3',
+                'test_seconds_sum 5.55',
+                'test_seconds_count 3',
+            ]
+        )
+
+    def test_concurrent_increments(self):
+        counter = self.counter()
+
+        def increment():
+            for _ in range(1000):
+                counter.inc()
+
+        threads = [threading.Thread(target=increment) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertIn('test_total 8000\n', self.registry.expose())
+
+    def test_write(self):
+        self.counter().inc()
+        with TemporaryDirectory() as tmpdir:
+            out_file = os.path.join(tmpdir, 'metrics.prom')
+            self.registry.write(out_file)
+            with open(out_file) as f:
+                self.assertEqual(f.read(), self.registry.expose())
+
+    def test_push(self):
+        received = []
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_PUT(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                received.append((self.path, body.decode('utf-8')))
+                self.send_response(202)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.HTTPServer(('127.0.0.1', 0), Handler)
+        thread = threading.Thread(target=server.handle_request)
+        thread.start()
+        try:
+            self.counter().inc()
+            self.registry.push('http://127.0.0.1:{p}'.format(p=server.server_port), job='test')
+        finally:
+            thread.join()
+            server.server_close()
+
+        self.assertEqual(received, [('/metrics/job/test', self.registry.expose())])
@@ -113,6 +113,22 @@ class ConfigFactoryCfgDirDeserialisationTest(unittest.TestCase, ConfigFactorySmo
             f.write(dedent(contents))
         return filename
 
+    def test_cfg_files_are_parsed_on_first_access(self):
+        examinee = ConfigFactory.from_cfg_dir(
+            cfg_dir=self.tmpdir.name,
+            cfg_types_file=self.types_file
+        )
+        self.assertIn('a_type', examinee.raw)
+
+        # not parsed, yet
+        self._file('a_type_values.xxx', '''
+        first_value_of_a:
+            some_value: 1
+        ''')
+
+        self.assertEqual(examinee._cfg_element('a_type', 'first_value_of_a').raw, {'some_value': 1})
+        self.assertEqual(set(examinee.raw.keys()), {'cfg_types', 'a_type', 'cfg_set'})
+
     def test_absent_directory_causes_failure(self):
         with self.assertRaises(Failure):
             ConfigFactory.from_cfg_dir(cfg_dir='should not exist')
@@ -167,4 +183,206 @@ class ConfigFactoryDictDeserialisationTest(unittest.TestCase, ConfigFactorySmoke
         with self.assertRaises(ValueError):
             ConfigFactory.from_dict({})
 
+    def test_elements_are_interned(self):
+        first_element = self.examinee._cfg_element('a_type', 'first_value_of_a')
+
+        self.assertIs(self.examinee._cfg_element('a_type', 'first_value_of_a'), first_element)
+        self.assertIs(self.examinee.cfg_set('first_set')._cfg_element('a_type'), first_element)
+        self.assertIs(self.examinee.cfg_set('first_set'), self.examinee.cfg_set('first_set'))
+
+    def test_invalidate(self):
+        first_element = self.examinee._cfg_element('a_type', 'first_value_of_a')
+        second_element = self.examinee._cfg_element('a_type', 'second_value_of_a')
+
+        self.examinee.raw['a_type']['first_value_of_a'] = {'some_value': 1}
+        self.examinee.invalidate(cfg_type_name='a_type', cfg_name='first_value_of_a')
+
+        self.assertEqual(
+            self.examinee._cfg_element('a_type', 'first_value_of_a').raw,
+            {'some_value': 1},
+        )
+        self.assertIs(self.examinee._cfg_element('a_type', 'second_value_of_a'), second_element)
+
+        self.examinee.invalidate()
+        self.assertIsNot(self.examinee._cfg_element('a_type', 'second_value_of_a'), second_element)
+        self.assertIsNot(self.examinee._cfg_element('a_type', 'first_value_of_a'), first_element)
+
+
+def _modify_and_read(element):
+    # run in a child process
+    try:
+        element.raw['some_value'] = 0
+    except TypeError:
+        pass
+    return element.raw['some_value']
+
+
+class ConfigModelConcurrencyTest(unittest.TestCase):
+    def setUp(self):
+        types = {
+            'a_type': {'model': {'cfg_type_name': 'a_type', 'type': 'NamedModelElement'}},
+            'cfg_set': {'model': {'cfg_type_name': 'cfg_set', 'type': 'ConfigurationSet'}},
+        }
+        values = {'value{i}'.format(i=i): {'some_value': i, 'a_list': [i]} for i in range(100)}
+        cfg_sets = {
+            'a_set': {'a_type': {'config_names': list(values.keys()), 'default': 'value0'}},
+        }
+        self.raw = {'cfg_types': types, 'cfg_set': cfg_sets, 'a_type': values}
+        self.examinee = ConfigFactory.from_dict(self.raw)
+
+    def run_concurrently(self, function, thread_count=8):
+        from concurrent.futures import ThreadPoolExecutor
+        import threading
+        barrier = threading.Barrier(thread_count)
+
+        def run():
+            barrier.wait()
+            return function()
+
+        with ThreadPoolExecutor(max_workers=thread_count) as executor:
+            return [f.result() for f in [executor.submit(run) for _ in range(thread_count)]]
+
+    def test_elements_are_read_only(self):
+        cfg_set = self.examinee.cfg_set('a_set')
+        element = cfg_set._cfg_element('a_type')
+
+        with self.assertRaises(TypeError):
+            element.raw['some_value'] = 42
+        with self.assertRaises(TypeError):
+            element.raw['a_list'].append(42)
+        with self.assertRaises(TypeError):
+            cfg_set.raw['a_type']['default'] = 'value1'
+
+        # the factory's raw dicts are neither modified nor shared
+        self.assertEqual(self.raw['cfg_set']['a_set']['a_type'].keys(), {'config_names', 'default'})
+        self.raw['a_type']['value0']['some_value'] = 42
+        self.assertEqual(element.raw['some_value'], 0)
+
+    def test_concurrent_element_creation(self):
+        def create_elements():
+            cfg_set = self.examinee.cfg_set('a_set')
+            return [
+                cfg_set._cfg_element('a_type', 'value{i}'.format(i=i)) for i in range(100)
+            ]
+
+        results = self.run_concurrently(create_elements)
 
+        for elements in results:
+            for expected, element in zip(results[0], elements):
+                self.assertIs(element, expected)
+
+    def test_concurrent_lazy_loading(self):
+        import time
+        load_count = []
+
+        def load():
+            load_count.append(1)
+            time.sleep(0.01)
+            return 'value'
+
+        lazy_dict = model._LazyDict(values={}, loaders={'key': load})
+
+        self.assertEqual(self.run_concurrently(lambda: lazy_dict['key']), ['value'] * 8)
+        self.assertEqual(len(load_count), 1)
+
+    def test_elements_are_shared_with_processes(self):
+        import multiprocessing
+        elements = [self.examinee._cfg_element('a_type', 'value{i}'.format(i=i)) for i in range(4)]
+
+        with multiprocessing.Pool(2) as pool:
+            self.assertEqual(pool.map(_modify_and_read, elements), [0, 1, 2, 3])
+
+
+class ConfigFingerprintTest(unittest.TestCase):
+    def raw_cfg(self):
+        types = {
+            'a_type': {'model': {'cfg_type_name': 'a_type', 'type': 'NamedModelElement'}},
+            'cfg_set': {'model': {'cfg_type_name': 'cfg_set', 'type': 'ConfigurationSet'}},
+        }
+        values = {
+            'first_value_of_a': {'some_value': 123, 'a_dict': {'x': 1, 'y': 2}},
+            'second_value_of_a': {'some_value': 42},
+        }
+        cfg_sets = {
+            'first_set': {'a_type': 'first_value_of_a'},
+            'second_set': {'a_type': 'second_value_of_a'},
+        }
+        return {'cfg_types': types, 'cfg_set': cfg_sets, 'a_type': values}
+
+    def test_fingerprints_are_stable(self):
+        raw = self.raw_cfg()
+        factory = ConfigFactory.from_dict(raw)
+        # key order must not matter
+        raw['a_type']['first_value_of_a']['a_dict'] = {'y': 2, 'x': 1}
+        other_factory = ConfigFactory.from_dict(raw)
+
+        self.assertEqual(factory.fingerprints(), other_factory.fingerprints())
+        self.assertEqual(len(factory.fingerprints()), 4)
+        self.assertEqual(
+            factory.cfg_set('first_set').fingerprint(),
+            factory.fingerprint('cfg_set', 'first_set'),
+        )
+        self.assertIsNone(factory.fingerprint('a_type', 'absent_value'))
+        self.assertIsNone(factory.fingerprint('absent_type', 'absent_value'))
+
+    def test_fingerprint_after_invalidate(self):
+        factory = ConfigFactory.from_dict(self.raw_cfg())
+        fingerprint = factory.fingerprint('a_type', 'second_value_of_a')
+        cfg_set_fingerprint = factory.fingerprint('cfg_set', 'second_set')
+
+        factory.raw['a_type']['second_value_of_a'] = {'some_value': 1}
+        factory.invalidate(cfg_type_name='a_type', cfg_name='second_value_of_a')
+
+        self.assertNotEqual(factory.fingerprint('a_type', 'second_value_of_a'), fingerprint)
+        self.assertNotEqual(factory.fingerprint('cfg_set', 'second_set'), cfg_set_fingerprint)
+
+    def test_diff(self):
+        old_factory = ConfigFactory.from_dict(self.raw_cfg())
+        raw = self.raw_cfg()
+        raw['a_type']['second_value_of_a']['some_value'] = 43
+        raw['a_type']['third_value_of_a'] = {}
+        del raw['cfg_set']['first_set']
+        new_factory = ConfigFactory.from_dict(raw)
+
+        config_diff = model.diff(old_factory, new_factory)
+
+        self.assertEqual(config_diff.added, {('a_type', 'third_value_of_a')})
+        self.assertEqual(config_diff.removed, {('cfg_set', 'first_set')})
+        # cfg_sets change along with the elements they reference
+        self.assertEqual(
+            config_diff.changed,
+            {('a_type', 'second_value_of_a'), ('cfg_set', 'second_set')},
+        )
+        self.assertTrue(config_diff.is_changed('a_type', 'third_value_of_a'))
+        self.assertFalse(config_diff.is_changed('a_type', 'first_value_of_a'))
+        self.assertEqual(
+            config_diff.changed_elements(cfg_type_name='cfg_set'),
+            {('cfg_set', 'first_set'), ('cfg_set', 'second_set')},
+        )
+        self.assertFalse(model.diff(old_factory, ConfigFactory.from_dict(self.raw_cfg())))
+
+    def test_diff_snapshots(self):
+        def write_snapshot(directory, raw):
+            path = os.path.join(directory, 'snapshot')
+            serialiser = model.ConfigSetSerialiser(
+                cfg_sets=[ConfigFactory.from_dict(raw).cfg_set('second_set')],
+                cfg_factory=ConfigFactory.from_dict(raw),
+            )
+            with open(path, 'wb') as f:
+                f.write(serialiser.serialise(output_format='snapshot'))
+            return ConfigFactory.from_snapshot(path)
+
+        raw = self.raw_cfg()
+        with TemporaryDirectory() as old_dir, TemporaryDirectory() as new_dir:
+            old_factory = write_snapshot(old_dir, raw)
+            raw['a_type']['second_value_of_a']['some_value'] = 43
+            new_factory = write_snapshot(new_dir, raw)
+
+            config_diff = model.diff(old_factory, new_factory)
+
+        self.assertEqual(config_diff.added, set())
+        self.assertEqual(config_diff.removed, set())
+        self.assertEqual(
+            config_diff.changed,
+            {('a_type', 'second_value_of_a'), ('cfg_set', 'second_set')},
+        )
@@ -119,3 +119,71 @@ class ConfigSetSerialiserTest(unittest.TestCase):
         first_value_from_cfg_set = two_of_a_kind_set._cfg_element('a_type', 'first_value_of_a')
         self.assertEqual(first_value.raw, first_value_from_cfg_set.raw)
 
+
+    def test_serialise_sharded(self):
+        examinee = CSS(cfg_sets={self.set_with_two_of_a_kind}, cfg_factory=self.factory)
+        documents = examinee.serialise_sharded()
+
+        self.assertEqual(
+            set(documents.keys()),
+            {'index', 'a_type.first_value_of_a', 'a_type.second_value_of_a'},
+        )
+
+        retrieved_shards = []
+
+        def retrieve_shard(name):
+            retrieved_shards.append(name)
+            return json.loads(documents[name])
+
+        deserialised = ConfigFactory.from_dict(
+            json.loads(documents['index']),
+            retrieve_shard=retrieve_shard,
+        )
+        two_of_a_kind_set = deserialised.cfg_set('set_with_two_of_a_kind')
+        self.assertEqual(retrieved_shards, [])
+
+        # shards are retrieved once, on first access
+        self.assertEqual(two_of_a_kind_set._cfg_element('a_type').raw['some_value'], 42)
+        self.assertEqual(two_of_a_kind_set._cfg_element('a_type').raw['some_value'], 42)
+        deserialised.invalidate()
+        self.assertEqual(two_of_a_kind_set._cfg_element('a_type').raw['some_value'], 42)
+        self.assertEqual(retrieved_shards, ['a_type.second_value_of_a'])
+        # retrieved shards are not added to the (caller-owned) raw dict
+        self.assertNotIn('a_type', deserialised.raw)
+
+        with self.assertRaises(KeyError):
+            deserialised._cfg_element('a_type', 'ignored_value_of_a')
+
+    def test_serialise_snapshot(self):
+        import tempfile
+        examinee = CSS(cfg_sets={self.set_with_two_of_a_kind}, cfg_factory=self.factory)
+
+        with tempfile.NamedTemporaryFile() as snapshot_file:
+            snapshot_file.write(examinee.serialise(output_format='snapshot'))
+            snapshot_file.flush()
+
+            deserialised = ConfigFactory.from_snapshot(snapshot_file.name)
+
+            self.assertEqual(deserialised._cfg_types_raw(), self.factory._cfg_types_raw())
+            two_of_a_kind_set = deserialised.cfg_set('set_with_two_of_a_kind')
+            self.assertEqual(two_of_a_kind_set.raw, self.set_with_two_of_a_kind.raw)
+            self.assertEqual(two_of_a_kind_set._cfg_element('a_type').raw['some_value'], 42)
+            self.assertEqual(
+                deserialised._cfg_element('a_type', 'first_value_of_a').raw['some_value'],
+                123,
+            )
+            with self.assertRaises(KeyError):
+                deserialised._cfg_element('a_type', 'ignored_value_of_a')
+
+    def test_snapshot_version_is_checked(self):
+        import tempfile
+        from model import snapshot
+        data = bytearray(snapshot.serialise(cfg_types={}, elements={}))
+        data[len(snapshot.MAGIC) + 1] += 1 # increment version
+
+        with tempfile.NamedTemporaryFile() as snapshot_file:
+            snapshot_file.write(data)
+            snapshot_file.flush()
+
+            with self.assertRaises(ValueError):
+                snapshot.Snapshot(snapshot_file.name)
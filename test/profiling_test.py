@@ -0,0 +1,69 @@
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import builtins
+import cProfile
+import os
+import pstats
+import sys
+import unittest
+
+from tempfile import TemporaryDirectory
+
+import profiling as examinee
+
+
+def _inner():
+    return sum(range(10000))
+
+def _outer():
+    return [_inner() for _ in range(10)]
+
+
+class ImportTimerTest(unittest.TestCase):
+    def test_import_tree(self):
+        original_import = builtins.__import__
+        sys.modules.pop('colorsys', None)
+
+        timer = examinee.ImportTimer()
+        timer.install()
+        try:
+            import colorsys
+        finally:
+            timer.uninstall()
+
+        self.assertIs(builtins.__import__, original_import)
+        self.assertEqual([c.name for c in timer.root.children], ['colorsys'])
+
+        with TemporaryDirectory() as tmpdir:
+            out_file = os.path.join(tmpdir, 'imports')
+            timer.write_tree(out_file)
+            with open(out_file) as f:
+                lines = f.read().strip().split('\n')
+        self.assertTrue(lines[1].endswith('| colorsys'))
+        self.assertTrue(lines[-1].startswith('total:'))
+
+
+class CollapsedStacksTest(unittest.TestCase):
+    def test_collapsed_stacks(self):
+        profiler = cProfile.Profile()
+        profiler.runcall(_outer)
+
+        stacks = examinee.collapsed_stacks(pstats.Stats(profiler))
+
+        inner_stacks = [s for s in stacks if s.split(';')[-1].endswith('(_inner)')]
+        self.assertEqual(len(inner_stacks), 1)
+        # _inner is called from _outer (through the list comprehension)
+        self.assertIn('(_outer)', inner_stacks[0])
+        self.assertTrue(all(t > 0 for t in stacks.values()))
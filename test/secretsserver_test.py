@@ -0,0 +1,146 @@
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+import requests
+
+from test.model_serialisation_test import simple_cfg_dict
+
+import config
+import secretsserver as examinee
+
+
+class SecretsServerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.secrets_dir = self.tmpdir.name
+        self.write_file('concourse-secrets/concourse_cfg', json.dumps(simple_cfg_dict()))
+        self.write_file('serviceaccount/token', 'a_token')
+        self.write_file('..data/hidden', 'hidden')
+
+        self.server = examinee.SecretsServer(
+            ('127.0.0.1', 0),
+            secrets_dir=self.secrets_dir,
+            check_interval=0,
+        )
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{p}/'.format(p=self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+    def write_file(self, path, content):
+        path = os.path.join(self.secrets_dir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def test_files_are_served(self):
+        response = requests.get(self.url + 'serviceaccount/token')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.text, 'a_token')
+
+        self.assertEqual(requests.get(self.url + 'absent').status_code, 404)
+        self.assertEqual(requests.get(self.url + '..data/hidden').status_code, 404)
+        self.assertEqual(requests.get(self.url + '../etc/passwd').status_code, 404)
+
+    def test_conditional_requests(self):
+        response = requests.get(self.url + 'serviceaccount/token')
+        etag = response.headers['ETag']
+
+        response = requests.get(self.url + 'serviceaccount/token', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        response = requests.get(
+            self.url + 'serviceaccount/token',
+            headers={'If-Modified-Since': response.headers['Last-Modified']},
+        )
+        self.assertEqual(response.status_code, 304)
+
+        response = requests.get(self.url + 'serviceaccount/token', headers={'If-None-Match': '"x"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_gzip(self):
+        path = 'concourse-secrets/concourse_cfg'
+        response = requests.get(self.url + path, headers={'Accept-Encoding': 'gzip'}, stream=True)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.raw.read())), simple_cfg_dict())
+
+        # the gzip variant's etag is accepted as well
+        response = requests.get(
+            self.url + path,
+            headers={'If-None-Match': response.headers['ETag'], 'Accept-Encoding': 'identity'},
+        )
+        self.assertEqual(response.status_code, 304)
+
+        response = requests.get(self.url + path, headers={'Accept-Encoding': 'identity'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.json(), simple_cfg_dict())
+
+    def test_cfg_set_endpoints(self):
+        response = requests.get(self.url + 'concourse-secrets/concourse_cfg/first_set')
+        self.assertEqual(response.status_code, 200)
+        cfg_set = response.json()
+        self.assertEqual(set(cfg_set['cfg_set'].keys()), {'first_set'})
+        self.assertEqual(set(cfg_set['a_type'].keys()), {'first_value_of_a'})
+
+        response = requests.get(self.url + 'concourse-secrets/concourse_cfg/first_set/a_type.first_value_of_a')
+        self.assertEqual(response.json(), {'some_value': 123})
+
+        # elements not referenced by the cfg_set are not served
+        response = requests.get(self.url + 'concourse-secrets/concourse_cfg/first_set/a_type.second_value_of_a')
+        self.assertEqual(response.status_code, 404)
+        response = requests.get(self.url + 'concourse-secrets/concourse_cfg/absent_set')
+        self.assertEqual(response.status_code, 404)
+        response = requests.get(self.url + 'serviceaccount/token/x')
+        self.assertEqual(response.status_code, 404)
+
+    def test_cfg_set_documents_are_bounded(self):
+        index = examinee.SecretsIndex(self.secrets_dir, max_cfg_sets=1)
+        first = index.resource('concourse-secrets/concourse_cfg/first_set')
+        self.assertIs(index.resource('concourse-secrets/concourse_cfg/first_set'), first)
+
+        self.assertIsNotNone(index.resource('concourse-secrets/concourse_cfg/second_set'))
+        self.assertEqual(len(index._cfg_set_resources), 1)
+        # evicted documents are created again upon request
+        recreated = index.resource('concourse-secrets/concourse_cfg/first_set')
+        self.assertIsNot(recreated, first)
+        self.assertEqual(recreated.content, first.content)
+
+    def test_sharded_cfg_set_retrieval(self):
+        client = config.SecretsServerClient(
+            endpoint_url=self.url,
+            concourse_secret_name='concourse-secrets/concourse_cfg/second_set/index',
+            cache_dir=os.path.join(self.tmpdir.name, '.cache'),
+        )
+        factory = config._parse_model(client.retrieve_secrets(), retrieve_shard=client.retrieve_shard)
+
+        self.assertEqual(factory.cfg_set('second_set')._cfg_element('a_type').raw['some_value'], 42)
+
+    def test_changes_are_reloaded(self):
+        self.write_file('serviceaccount/token', 'another_token')
+        response = requests.get(self.url + 'serviceaccount/token')
+        self.assertEqual(response.text, 'another_token')
+
+        os.unlink(os.path.join(self.secrets_dir, 'serviceaccount', 'token'))
+        self.assertEqual(requests.get(self.url + 'serviceaccount/token').status_code, 404)
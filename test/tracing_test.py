@@ -0,0 +1,89 @@
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import threading
+import unittest
+
+from tempfile import TemporaryDirectory
+
+import tracing as examinee
+
+
+class TracingTest(unittest.TestCase):
+    def setUp(self):
+        self.tracer = examinee.Tracer()
+        self.tracer.install()
+
+    def tearDown(self):
+        self.tracer.uninstall()
+
+    def test_nested_spans(self):
+        with examinee.span('outer', args={'pipeline': 'foo'}):
+            with examinee.span('inner', category='http'):
+                pass
+
+        outer, inner = self.tracer.trace_events()[1:]
+        self.assertEqual(outer['name'], 'outer')
+        self.assertEqual(outer['args'], {'pipeline': 'foo'})
+        self.assertEqual(inner['name'], 'inner')
+        self.assertEqual(inner['cat'], 'http')
+        self.assertLessEqual(outer['ts'], inner['ts'])
+        self.assertGreaterEqual(outer['ts'] + outer['dur'], inner['ts'] + inner['dur'])
+
+    def test_span_is_recorded_on_exception(self):
+        with self.assertRaises(ValueError):
+            with examinee.span('failing'):
+                raise ValueError()
+
+        self.assertEqual([e['name'] for e in self.tracer.events], ['failing'])
+
+    def test_traced(self):
+        @examinee.traced()
+        def function(value):
+            return value
+
+        self.assertEqual(function(42), 42)
+        self.assertEqual(self.tracer.events[0]['name'], 'TracingTest.test_traced.<locals>.function')
+
+    def test_spans_of_threads(self):
+        def run():
+            with examinee.span('threaded'):
+                pass
+        thread = threading.Thread(target=run, name='worker')
+        thread.start()
+        thread.join()
+
+        thread_names = [e['args']['name'] for e in self.tracer.trace_events() if e['ph'] == 'M']
+        self.assertEqual(thread_names, ['worker'])
+
+    def test_no_spans_if_not_installed(self):
+        self.tracer.uninstall()
+        with examinee.span('ignored'):
+            pass
+
+        self.assertEqual(self.tracer.events, [])
+
+    def test_write(self):
+        with examinee.span('written'):
+            pass
+        with TemporaryDirectory() as tmpdir:
+            out_file = os.path.join(tmpdir, 'trace.json')
+            self.tracer.write(out_file)
+            with open(out_file) as f:
+                trace = json.load(f)
+
+        self.assertEqual(trace['traceEvents'][-1]['name'], 'written')
+        self.assertEqual(trace['traceEvents'][-1]['ph'], 'X')
@@ -12,7 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
+import json
+import time
 import unittest
+import unittest.mock
 import pathlib
 
 from test._test_utils import capture_out
@@ -20,6 +24,79 @@ from test._test_utils import capture_out
 from util import Failure
 import util as examinee
 
+class _FakeTimer(object):
+    def __init__(self, interval, function):
+        self.interval = interval
+        self.function = function
+        self.cancelled = False
+
+    def start(self):
+        pass
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class LogBackendTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.timers = []
+
+        def timer_factory(interval, function):
+            timer = _FakeTimer(interval, function)
+            self.timers.append(timer)
+            return timer
+
+        self.backend = examinee.LogBackend(
+            flush_interval=0.1,
+            clock=lambda: self.now,
+            timer_factory=timer_factory,
+        )
+
+    def tearDown(self):
+        self.backend.close()
+
+    def test_buffered_log_records_are_flushed_by_timer(self):
+        class Stream(io.StringIO):
+            flushed = ''
+            def flush(self):
+                Stream.flushed = self.getvalue()
+
+        with unittest.mock.patch('sys.stdout', new_callable=Stream) as stdout:
+            # less than flush_interval elapsed since the backend was created
+            self.backend.log('info', 'first')
+            self.assertEqual(stdout.flushed, '')
+            self.assertEqual(len(self.timers), 1)
+            self.assertAlmostEqual(self.timers[0].interval, 0.1)
+
+            self.now = 0.1
+            self.timers[0].function()
+            self.assertEqual(stdout.flushed.split(), ['INFO:', 'first'])
+
+            self.now = 0.3
+            self.backend.log('info', 'second') # interval elapsed since last flush
+            self.assertEqual(stdout.flushed.split(), ['INFO:', 'first', 'INFO:', 'second'])
+
+            self.now = 0.35
+            self.backend.log('info', 'third')
+            self.assertNotIn('third', stdout.flushed)
+            self.assertEqual(len(self.timers), 2)
+            self.assertAlmostEqual(self.timers[1].interval, 0.05)
+
+            self.timers[1].function()
+            self.assertEqual(
+                stdout.flushed.split(),
+                ['INFO:', 'first', 'INFO:', 'second', 'INFO:', 'third'],
+            )
+
+    def test_errors_are_flushed_immediately(self):
+        with unittest.mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            stdout.flush = unittest.mock.Mock()
+            self.backend.log('error', 'broken')
+            stdout.flush.assert_called_once_with()
+        self.assertEqual(self.timers, [])
+
+
 class UtilTest(unittest.TestCase):
     def test_info(self):
         with capture_out() as (stdout, stderr):
@@ -40,6 +117,29 @@ class UtilTest(unittest.TestCase):
         self.assertTrue(len(stdout.getvalue()) == 0)
         self.assertTrue(len(stderr.getvalue()) == 0)
 
+    def test_info_as_json(self):
+        class Args(object): pass
+        args = Args()
+        args.quiet = False
+        args.log_format = 'json'
+        import ctx
+        ctx.args = args
+
+        try:
+            with capture_out() as (stdout, stderr):
+                examinee.info(msg='test abc')
+                examinee.warning(msg='test def')
+        finally:
+            ctx.args = None
+
+        records = [json.loads(line) for line in stdout.getvalue().strip().split('\n')]
+        self.assertEqual([r['level'] for r in records], ['info', 'warning'])
+        self.assertEqual([r['msg'] for r in records], ['test abc', 'test def'])
+        self.assertLessEqual(records[0]['monotonic'], records[1]['monotonic'])
+        self.assertLessEqual(records[0]['elapsed'], records[1]['elapsed'])
+        self.assertIn('timestamp', records[0])
+        self.assertTrue(len(stderr.getvalue()) == 0)
+
     def test_fail(self):
         with capture_out() as (stdout, stderr):
             with self.assertRaises(Failure):
@@ -97,3 +197,350 @@ class UtilTest(unittest.TestCase):
         )
 
 
+
+    def test_simple_namespace_dict_lists_are_reusable(self):
+        snd = examinee.SimpleNamespaceDict({'l': [{'a': 1}, 'b']})
+
+        self.assertEqual(list(snd.l), list(snd.l))
+        self.assertEqual(snd.l[0].a, 1)
+        self.assertEqual(snd.l[1], 'b')
+
+
+class MergeDictsTest(unittest.TestCase):
+    def setUp(self):
+        self.base = {'a': [1, 2], 'b': {'c': [{'x': 1}], 'e': {'f': 1}}, 'g': 'base'}
+        self.other = {'a': [2, 3], 'b': {'c': [{'x': 1}, {'y': 2}], 'd': 2}, 'g': {'h': 1}}
+
+    def test_merge(self):
+        merged = examinee.merge_dicts(self.base, self.other)
+
+        self.assertEqual(
+            merged,
+            {
+                'a': [1, 2, 3],
+                'b': {'c': [{'x': 1}, {'y': 2}], 'e': {'f': 1}, 'd': 2},
+                'g': {'h': 1},
+            }
+        )
+
+    def test_list_concatenation(self):
+        merged = examinee.merge_dicts(self.base, self.other, list_semantics=None)
+
+        self.assertEqual(merged['a'], [1, 2, 2, 3])
+
+    def test_arguments_remain_unmodified(self):
+        import copy
+        base, other = copy.deepcopy(self.base), copy.deepcopy(self.other)
+
+        for copy_result in (True, False):
+            examinee.merge_dicts(self.base, self.other, copy=copy_result)
+            self.assertEqual(self.base, base)
+            self.assertEqual(self.other, other)
+
+    def test_copy(self):
+        merged = examinee.merge_dicts(self.base, self.other)
+        self.assertIsNot(merged['b']['e'], self.base['b']['e'])
+
+        merged = examinee.merge_dicts(self.base, self.other, copy=False)
+        self.assertIs(merged['b']['e'], self.base['b']['e'])
+        self.assertIsNot(merged['b'], self.base['b'])
+
+
+class NamespaceViewTest(unittest.TestCase):
+    def setUp(self):
+        self.raw = {'a': {'b': {'c': 42}}, 'l': [{'x': 1}, 'y'], 's': 'str'}
+        self.examinee = examinee.NamespaceView(self.raw)
+
+    def test_attribute_and_item_access(self):
+        self.assertEqual(self.examinee.a.b.c, 42)
+        self.assertEqual(self.examinee['a']['b'].c, 42)
+        self.assertEqual(self.examinee.s, 'str')
+        self.assertIsNone(self.examinee.absent)
+        self.assertIsNone(self.examinee['absent'])
+
+    def test_children_are_memoised(self):
+        self.assertIs(self.examinee.a, self.examinee.a)
+        self.assertIs(self.examinee.a.b, self.examinee['a'].b)
+
+        # replaced elements must not be served from the memo
+        self.raw['a'] = {'b': 'replaced'}
+        self.assertEqual(self.examinee.a.b, 'replaced')
+
+    def test_lists_are_reusable(self):
+        first, second = self.examinee.l
+
+        self.assertEqual(first.x, 1)
+        self.assertEqual(second, 'y')
+        self.assertEqual(len(self.examinee.l), 2) # a second pass must not be empty
+
+    def test_dict_methods_return_raw_values(self):
+        self.assertEqual(list(self.examinee.values()), list(self.raw.values()))
+        self.assertEqual(self.examinee.get('a'), {'b': {'c': 42}})
+        self.assertIn('a', self.examinee)
+        self.assertEqual(len(self.examinee), 3)
+        self.assertEqual(self.examinee, self.raw)
+        self.assertIs(examinee.NamespaceView(self.examinee).unwrap(), self.raw)
+
+    def test_read_only(self):
+        with self.assertRaises(AttributeError):
+            self.examinee.a = 'b'
+
+
+class ParsedFileCacheTest(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.yaml_file = pathlib.Path(self.tmpdir.name, 'file.yaml')
+        self.yaml_file.write_text('a: [1, 2]\n')
+        self.parse_count = 0
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def parse(self, f):
+        self.parse_count += 1
+        return examinee.load_yaml(f)
+
+    def test_cached_documents_are_copies(self):
+        cache = examinee.ParsedFileCache()
+
+        first = cache.load(str(self.yaml_file), self.parse)
+        first['a'].append(3)
+        second = cache.load(str(self.yaml_file), self.parse)
+
+        self.assertEqual(second, {'a': [1, 2]})
+        self.assertEqual(self.parse_count, 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_modified_files_are_reparsed(self):
+        import os
+        cache = examinee.ParsedFileCache()
+        cache.load(str(self.yaml_file), self.parse)
+
+        self.yaml_file.write_text('a: changed\n')
+        stat = self.yaml_file.stat()
+        os.utime(str(self.yaml_file), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+
+        self.assertEqual(cache.load(str(self.yaml_file), self.parse), {'a': 'changed'})
+        self.assertEqual(self.parse_count, 2)
+
+    def test_lru_eviction(self):
+        cache = examinee.ParsedFileCache(max_entries=1)
+        other_file = pathlib.Path(self.tmpdir.name, 'other.yaml')
+        other_file.write_text('b: 1\n')
+
+        cache.load(str(self.yaml_file), self.parse)
+        cache.load(str(other_file), self.parse)
+        cache.load(str(self.yaml_file), self.parse)
+
+        self.assertEqual(self.parse_count, 3)
+
+    def test_cache_dir(self):
+        cache_dir = str(pathlib.Path(self.tmpdir.name, 'cache'))
+        examinee.ParsedFileCache(cache_dir=cache_dir).load(str(self.yaml_file), self.parse)
+
+        # another process (i.e. a new cache instance) should not need to parse again
+        parsed = examinee.ParsedFileCache(cache_dir=cache_dir).load(str(self.yaml_file), self.parse)
+
+        self.assertEqual(parsed, {'a': [1, 2]})
+        self.assertEqual(self.parse_count, 1)
+
+    def test_cache_dir_writable_by_other_users_is_not_used(self):
+        import os
+        cache_dir = pathlib.Path(self.tmpdir.name, 'cache')
+        cache_dir.mkdir(mode=0o777)
+        os.chmod(str(cache_dir), 0o777)
+        cache = examinee.ParsedFileCache(cache_dir=str(cache_dir))
+
+        with capture_out():
+            self.assertEqual(cache.load(str(self.yaml_file), self.parse), {'a': [1, 2]})
+
+        self.assertIsNone(cache.cache_dir)
+        self.assertEqual(list(cache_dir.iterdir()), [])
+
+    def test_parse_yaml_file(self):
+        parsed = examinee.parse_yaml_file(str(self.yaml_file))
+
+        self.assertEqual(list(parsed.a), [1, 2])
+        self.assertTrue(examinee.is_yaml_file(str(self.yaml_file)))
+
+
+class BoundedExecutorTest(unittest.TestCase):
+    def test_results_are_ordered(self):
+        import time
+
+        def delayed_square(value):
+            time.sleep((5 - value) / 100) # complete in reverse order
+            return value * value
+
+        results = examinee.BoundedExecutor(max_workers=5).map(delayed_square, range(5))
+
+        self.assertEqual(list(results), [0, 1, 4, 9, 16])
+
+    def test_max_workers_and_per_host_limit(self):
+        import threading
+        import time
+
+        lock = threading.Lock()
+        running = {}
+        max_running = {}
+
+        def process(item):
+            host, _ = item
+            with lock:
+                running[host] = running.get(host, 0) + 1
+                max_running[host] = max(max_running.get(host, 0), running[host])
+            time.sleep(0.01)
+            with lock:
+                running[host] -= 1
+
+        items = [(host, i) for i in range(10) for host in ('a', 'b')]
+        executor = examinee.BoundedExecutor(max_workers=4, per_host_limit=1)
+        list(executor.map(process, items, host=lambda item: item[0]))
+
+        self.assertEqual(max_running, {'a': 1, 'b': 1})
+
+    def test_items_limited_by_their_host_do_not_block_other_hosts(self):
+        import threading
+
+        b_done = threading.Event()
+
+        def process(item):
+            host, index = item
+            if host == 'b' and index == 3:
+                b_done.set()
+            # a's items only complete once all of b's items were processed
+            return host == 'b' or b_done.wait(timeout=1)
+
+        items = [('a', i) for i in range(4)] + [('b', i) for i in range(4)]
+        executor = examinee.BoundedExecutor(max_workers=4, per_host_limit=1)
+        results = list(executor.map(process, items, host=lambda item: item[0]))
+
+        # b's items are run by workers not occupied by host a, although queued after a's
+        self.assertEqual(results, [True] * 8)
+
+    def test_generator_input_is_consumed_with_backpressure(self):
+        import threading
+
+        consumed = []
+        release = threading.Event()
+
+        def items():
+            for i in range(100):
+                consumed.append(i)
+                yield i
+
+        def process(value):
+            release.wait(timeout=5)
+            return value
+
+        results = examinee.BoundedExecutor(max_workers=2).map(process, items())
+        consumer = threading.Thread(target=lambda: list(results))
+        consumer.start()
+        consumer.join(timeout=0.2)
+        self.assertLessEqual(len(consumed), 4)
+        release.set()
+        consumer.join(timeout=5)
+        self.assertEqual(len(consumed), 100)
+
+    def test_default_max_workers(self):
+        import os
+        import unittest.mock
+
+        with unittest.mock.patch.dict(os.environ):
+            os.environ.pop(examinee.MAX_WORKERS_ENV_VAR, None)
+            self.assertEqual(examinee.BoundedExecutor().max_workers, 1)
+        with unittest.mock.patch.dict(os.environ, {examinee.MAX_WORKERS_ENV_VAR: '3'}):
+            self.assertEqual(examinee.BoundedExecutor().max_workers, 3)
+        with unittest.mock.patch.dict(os.environ, {examinee.MAX_WORKERS_ENV_VAR: 'x'}):
+            with capture_out():
+                executor = examinee.BoundedExecutor()
+            self.assertEqual(executor.max_workers, examinee.BoundedExecutor.DEFAULT_MAX_WORKERS)
+
+    def test_fail_fast(self):
+        processed = []
+
+        def process(value):
+            if value == 1:
+                raise ValueError(value)
+            processed.append(value)
+            return value
+
+        executor = examinee.BoundedExecutor(max_workers=1)
+        with self.assertRaises(ValueError):
+            list(executor.map(process, range(100)))
+
+        self.assertTrue(executor.cancelled())
+        self.assertLess(len(processed), 99)
+
+    def test_collect_all(self):
+        def process(value):
+            if value % 2:
+                raise ValueError(value)
+            return value
+
+        results = []
+        with self.assertRaises(examinee.BulkExecutionError) as cm:
+            for result in examinee.BoundedExecutor(fail_fast=False).map(process, range(6)):
+                results.append(result)
+
+        self.assertEqual(results, [0, 2, 4])
+        self.assertEqual([item for item, _ in cm.exception.errors], [1, 3, 5])
+
+    def test_collect_all_aggregates_failures(self):
+        import unittest.mock
+
+        def process(value):
+            if value % 2:
+                examinee.fail()
+            return value
+
+        # in cli mode, util.fail raises a SystemExit
+        cli_failure = type('Failure', (SystemExit,), {})
+        with unittest.mock.patch.object(examinee, 'Failure', cli_failure):
+            with self.assertRaises(examinee.BulkExecutionError) as cm:
+                list(examinee.BoundedExecutor(fail_fast=False).map(process, range(4)))
+
+        self.assertEqual([item for item, _ in cm.exception.errors], [1, 3])
+
+    def test_cancel(self):
+        from concurrent.futures import CancelledError
+
+        executor = examinee.BoundedExecutor(max_workers=1)
+
+        def process(value):
+            if value == 2:
+                executor.cancel()
+            return value
+
+        with self.assertRaises(CancelledError):
+            list(executor.map(process, range(100)))
+
+
+class FreezeTest(unittest.TestCase):
+    def test_freeze(self):
+        import copy
+        import pickle
+        import yaml
+        raw = {'a': [1, {'b': 2}], 'c': (3,)}
+        frozen = examinee.freeze(raw)
+
+        self.assertEqual(frozen, {'a': [1, {'b': 2}], 'c': [3]})
+        for modify in (
+            lambda: frozen.update({'x': 1}),
+            lambda: frozen['a'].append(1),
+            lambda: frozen['a'][1].pop('b'),
+        ):
+            with self.assertRaises(TypeError):
+                modify()
+
+        # serialisable like plain dicts / lists
+        self.assertEqual(json.loads(json.dumps(frozen)), frozen)
+        self.assertEqual(yaml.safe_load(yaml.dump(frozen)), frozen)
+        self.assertIsInstance(pickle.loads(pickle.dumps(frozen)), examinee.FrozenDict)
+
+        # copies are mutable
+        thawed = copy.deepcopy(frozen)
+        thawed['a'][1]['b'] = 3
+        self.assertEqual(frozen['a'][1]['b'], 2)
+        self.assertIs(type(copy.copy(frozen)), dict)
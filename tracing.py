@@ -0,0 +1,139 @@
+# Copyright (c) 2018 SAP SE or an SAP affiliate company. All rights reserved. This file is licensed under the Apache Software License, v. 2 except as noted otherwise in the LICENSE file
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''
+Lightweight tracing of (nested) spans, written as Chrome trace-event JSON (viewable with
+chrome://tracing, https://ui.perfetto.dev or speedscope).
+
+Usage:
+------
+
+    import tracing
+    with tracing.span('render', args={'pipeline': name}):
+        ...
+
+    @tracing.traced('create_pipeline_definition')
+    def create_pipeline_definition(self):
+        ...
+
+Spans are only recorded while a `Tracer` is installed (cli.py installs one if the global
+--trace argument is given) - otherwise, they are (almost) free.
+'''
+
+import functools
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+class Tracer(object):
+    '''
+    Records completed spans as trace events. There is at most one installed instance per
+    process (see `install`).
+    '''
+    _installed = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self._start_ns = None
+        self._thread_names = {}
+
+    @staticmethod
+    def installed():
+        return Tracer._installed
+
+    def install(self):
+        if Tracer._installed:
+            raise RuntimeError('a tracer is already installed')
+        self._start_ns = time.perf_counter_ns()
+        Tracer._installed = self
+
+    def uninstall(self):
+        Tracer._installed = None
+
+    def _timestamp(self):
+        # microseconds since the tracer was installed
+        return (time.perf_counter_ns() - self._start_ns) / 1000
+
+    def record_span(self, name: str, category: str, start: float, end: float, args: dict=None):
+        thread = threading.current_thread()
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X', # "complete" event (with duration)
+            'ts': start,
+            'dur': end - start,
+            'pid': os.getpid(),
+            'tid': thread.ident,
+        }
+        if args:
+            event['args'] = {k: str(v) for k, v in args.items()}
+        with self.lock:
+            self.events.append(event)
+            self._thread_names.setdefault(thread.ident, thread.name)
+
+    def trace_events(self):
+        with self.lock:
+            thread_names = [
+                {
+                    'name': 'thread_name',
+                    'ph': 'M',
+                    'pid': os.getpid(),
+                    'tid': tid,
+                    'args': {'name': name},
+                }
+                for tid, name in self._thread_names.items()
+            ]
+            # sort by start (and longest first), so viewers nest spans correctly
+            return thread_names + sorted(self.events, key=lambda e: (e['ts'], -e['dur']))
+
+    def write(self, out_file: str):
+        with open(out_file, 'w') as f:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, f)
+
+
+@contextmanager
+def span(name: str, category: str='cc-utils', args: dict=None):
+    '''
+    records the enclosed block as span with the given name (if a tracer is installed)
+    '''
+    tracer = Tracer._installed
+    if not tracer:
+        yield
+        return
+    start = tracer._timestamp()
+    try:
+        yield
+    finally:
+        tracer.record_span(name, category, start, tracer._timestamp(), args)
+
+
+def traced(name: str=None, category: str='cc-utils'):
+    '''
+    decorator recording each call of the decorated function as span (named after the
+    function unless specified otherwise)
+    '''
+    def decorator(function):
+        span_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def traced_function(*args, **kwargs):
+            with span(span_name, category=category):
+                return function(*args, **kwargs)
+        return traced_function
+    return decorator
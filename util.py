@@ -12,10 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import atexit
+import copy
+import datetime
+import functools
+import json
 import shutil
 import sys
 import os
 import pathlib
+import threading
+import time
+import weakref
 import yaml
 
 class Failure(RuntimeError):
@@ -59,12 +67,177 @@ class SimpleNamespaceDict(dict):
         if isinstance(element, dict):
             return SimpleNamespaceDict(element)
         if isinstance(element, list):
-            return map(SimpleNamespaceDict, element)
+            return [SimpleNamespaceDict(e) if isinstance(e, dict) else e for e in element]
         return element
     def __getitem__(self, name):
         return self.__getattr__(name)
 
 
+class NamespaceView(object):
+    '''
+    Read-only counterpart of `SimpleNamespaceDict`: exposes the values of the given dict
+    (which is neither copied nor modified) as attributes and items. Absent keys yield `None`.
+
+    Nested dicts are returned as (memoised) views, lists as (memoised) tuples with dicts
+    wrapped into views (lists modified in place after having been accessed are not reflected).
+    All other dict methods (e.g. `get`, `values`) return the raw values.
+    '''
+    __slots__ = ('_raw', '_children')
+
+    def __init__(self, raw_dict: dict):
+        if isinstance(raw_dict, NamespaceView):
+            raw_dict = raw_dict._raw
+        object.__setattr__(self, '_raw', raw_dict)
+        object.__setattr__(self, '_children', {})
+
+    def unwrap(self):
+        '''
+        returns the underlying dict
+        '''
+        return self._raw
+
+    def __getattr__(self, name):
+        element = self._raw.get(name)
+        if not isinstance(element, (dict, list)):
+            if element is None and name[:2] == '__':
+                raise AttributeError(name) # do not pretend to implement special methods
+            return element
+
+        # re-wrap if the underlying element was replaced
+        cached = self._children.get(name)
+        if cached is not None and cached[0] is element:
+            return cached[1]
+        if isinstance(element, dict):
+            child = NamespaceView(element)
+        else:
+            child = tuple(NamespaceView(e) if isinstance(e, dict) else e for e in element)
+        self._children[name] = (element, child)
+        return child
+
+    def __getitem__(self, name):
+        return self.__getattr__(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('{c} is read-only'.format(c=type(self).__name__))
+
+    def __contains__(self, name):
+        return name in self._raw
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __bool__(self):
+        return bool(self._raw)
+
+    def __eq__(self, other):
+        if isinstance(other, NamespaceView):
+            other = other._raw
+        return self._raw == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{c}({r!r})'.format(c=type(self).__name__, r=self._raw)
+
+    def __reduce__(self):
+        # support copy / pickle (the default would set the slots via __setattr__)
+        return (NamespaceView, (self._raw,))
+
+    def get(self, name, default=None):
+        return self._raw.get(name, default)
+
+    def keys(self):
+        return self._raw.keys()
+
+    def values(self):
+        return self._raw.values()
+
+    def items(self):
+        return self._raw.items()
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError('{c} is read-only'.format(c=type(self).__name__))
+
+
+class FrozenDict(dict):
+    '''
+    Read-only dict (see `freeze`). As it is a dict, it can be passed wherever dicts are read
+    (e.g. json or yaml serialisation). Copies (`copy.copy`, `copy.deepcopy`) are mutable.
+    '''
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        # the default would restore items using __setitem__
+        return (FrozenDict, (dict(self),))
+
+
+class FrozenList(list):
+    '''
+    Read-only list (see `FrozenDict`)
+    '''
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = clear = extend = insert = pop = remove = reverse = sort = _read_only
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+
+yaml.add_representer(FrozenDict, yaml.representer.SafeRepresenter.represent_dict)
+yaml.add_representer(FrozenList, yaml.representer.SafeRepresenter.represent_list)
+yaml.add_representer(
+    FrozenDict, yaml.representer.SafeRepresenter.represent_dict, Dumper=yaml.SafeDumper
+)
+yaml.add_representer(
+    FrozenList, yaml.representer.SafeRepresenter.represent_list, Dumper=yaml.SafeDumper
+)
+
+
+def freeze(value):
+    '''
+    returns a read-only (deep) copy of the given value, replacing dicts by `FrozenDict`s and
+    lists by `FrozenList`s. Frozen values may be shared between threads without locking.
+    '''
+    if isinstance(value, (FrozenDict, FrozenList)):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return FrozenList(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    '''
+    returns a mutable (deep) copy of the given (frozen) value
+    '''
+    if isinstance(value, dict):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [thaw(v) for v in value]
+    return copy.deepcopy(value)
+
+
 class CliHint(object):
     def __init__(self, typehint=str, *args, **kwargs):
         self.argparse_args = SimpleNamespaceDict(*args, **kwargs)
@@ -88,11 +261,16 @@ class CliHints(object):
         return CliHint(typehint=str, help=help_string, type=ensure_directory_exists)
 
 
+_ctx_module = None
+
 def ctx():
     # late import because the ctx module is altered after all existing modules have
     # already been imported
-    import ctx
-    return ctx
+    global _ctx_module
+    if not _ctx_module:
+        import ctx as ctx_module
+        _ctx_module = ctx_module
+    return _ctx_module
 
 def _quiet():
     return ctx().args and ctx().args.quiet
@@ -105,9 +283,113 @@ def _cli():
     return bool(ctx().args and hasattr(ctx().args, '._cli') and ctx().args._cli)
 
 
+class LogBackend(object):
+    '''
+    Writes log records (as emitted by `info`, `warning`, `verbose` and `fail`) to stdout,
+    either as plain text (`<LEVEL>: <msg>`) or as JSON lines (global `--log-format json`)
+    containing the level, message, wall-clock and monotonic timestamps and the time elapsed
+    since process start.
+
+    Output is buffered by the stream; it is flushed at most every `flush_interval` seconds
+    (buffered records are flushed by a timer at the latest `flush_interval` seconds after they
+    were written), upon errors, at exit and by `flush_log` (to be called before spawning
+    subprocesses sharing stdout, or before blocking waits).
+
+    `clock` and `timer_factory` default to `time.monotonic` and `threading.Timer`; `close`
+    flushes and unregisters the exit handler (for backends other than the global one).
+    '''
+    def __init__(
+        self,
+        flush_interval: float=1.0,
+        clock=time.monotonic,
+        timer_factory=threading.Timer,
+    ):
+        self.flush_interval = flush_interval
+        self._clock = clock
+        self._timer_factory = timer_factory
+        self.start = clock()
+        self._last_flush = self.start
+        self._lock = threading.Lock()
+        self._timer = None
+        atexit.register(self.flush)
+        # fork handlers cannot be unregistered - do not keep closed backends alive
+        os.register_at_fork(
+            after_in_child=functools.partial(_reset_log_backend_after_fork, weakref.ref(self)),
+        )
+
+    def close(self):
+        self.flush()
+        atexit.unregister(self.flush)
+
+    def _reset_after_fork(self):
+        # the timer thread (and possibly the lock's owner) do not exist in the child
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def _format(self, level: str, msg: str, now: float):
+        args = ctx().args
+        if getattr(args, 'log_format', None) == 'json':
+            return json.dumps({
+                'level': level,
+                'msg': msg,
+                'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'monotonic': round(now, 6),
+                'elapsed': round(now - self.start, 6),
+            })
+        return '{l}: {m}'.format(l=level.upper(), m=msg)
+
+    def log(self, level: str, msg: str):
+        now = self._clock()
+        line = self._format(level, msg, now)
+        with self._lock:
+            stream = sys.stdout
+            stream.write(line + '\n')
+            if level == 'error' or now - self._last_flush >= self.flush_interval:
+                stream.flush()
+                self._last_flush = now
+            elif self._timer is None:
+                self._timer = self._timer_factory(
+                    self._last_flush + self.flush_interval - now,
+                    self._timed_flush,
+                )
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _timed_flush(self):
+        with self._lock:
+            self._timer = None
+            sys.stdout.flush()
+            self._last_flush = self._clock()
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            sys.stdout.flush()
+            self._last_flush = self._clock()
+
+
+def _reset_log_backend_after_fork(backend_ref):
+    backend = backend_ref()
+    if backend is not None:
+        backend._reset_after_fork()
+
+
+_log_backend = LogBackend()
+
+
+def flush_log():
+    '''
+    writes all buffered log records. Call before spawning subprocesses that write to the same
+    stdout, and before blocking waits.
+    '''
+    _log_backend.flush()
+
+
 def fail(msg=None):
     if msg:
-        print('ERROR: ' + msg)
+        _log_backend.log('error', msg)
     raise Failure(1)
 
 
@@ -115,24 +397,21 @@ def info(msg:str):
     if _quiet():
         return
     if msg:
-        print('INFO: ' + msg)
-        sys.stdout.flush()
+        _log_backend.log('info', msg)
 
 
 def warning(msg:str):
     if _quiet():
         return
     if msg:
-        print('WARNING: ' + msg)
-        sys.stdout.flush()
+        _log_backend.log('warning', msg)
 
 
 def verbose(msg:str):
     if not _verbose():
         return
     if msg:
-        print('VERBOSE: ' + msg)
-        sys.stdout.flush()
+        _log_backend.log('verbose', msg)
 
 
 def ensure_not_empty(value):
@@ -151,23 +430,123 @@ not_none = ensure_not_none
 not_empty = ensure_not_empty
 
 
-def is_yaml_file(path: CliHints.existing_file()):
-    with open(path) as f:
+# use libyaml (if available), which is considerably faster than the pure-python loader
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def load_yaml(stream):
+    '''
+    parses the given yaml document (passed as str, bytes or file-like object)
+    '''
+    return yaml.load(stream, Loader=_YAML_LOADER)
+
+
+class ParsedFileCache(object):
+    '''
+    LRU cache of parsed files, keyed by absolute path, mtime and size.
+
+    Documents are stored pickled, so each lookup returns a new copy (which callers may
+    modify). If `cache_dir` is given, documents are additionally stored there (using
+    `cacheutil.DiskCache`) and thus shared between processes.
+
+    Not intended to be used outside of this module (see `parse_yaml_file`).
+    '''
+    def __init__(self, max_entries: int=512, cache_dir: str=None):
+        import collections
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_cache_instance = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def load(self, path: str, parse):
+        '''
+        returns the parsed contents of the given file, calling `parse(file_obj)` on cache misses
+        '''
+        import pickle
+
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            pickled = self._entries.get(key)
+            if pickled is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if pickled is None:
+            pickled = self._load_from_dir(key)
+            if pickled is None:
+                with open(path) as f:
+                    pickled = pickle.dumps(parse(f), protocol=pickle.HIGHEST_PROTOCOL)
+                self._store_in_dir(key, pickled)
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = pickled
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return pickle.loads(pickled)
+
+    def _disk_cache(self):
+        if not self.cache_dir:
+            return None
+        if not self._disk_cache_instance:
+            from cacheutil import DiskCache
+            self._disk_cache_instance = DiskCache(namespace='parsed_yaml', cache_dir=self.cache_dir)
+        return self._disk_cache_instance
+
+    def _disable_dir(self, e: OSError):
+        # e.g. a cache dir other users may write to (see cacheutil.UnsafeCacheDirectoryError)
+        warning('not using parsed file cache dir {d}: {e}'.format(d=self.cache_dir, e=e))
+        self.cache_dir = None
+
+    def _load_from_dir(self, key):
+        disk_cache = self._disk_cache()
+        if not disk_cache:
+            return None
         try:
-            if yaml.load(f):
-                return True
-        except:
-            warning('an error occurred whilst trying to parse {f}'.format(f=path))
-            raise
+            return disk_cache.get(repr(key))
+        except PermissionError as pe:
+            self._disable_dir(pe)
+            return None
+
+    def _store_in_dir(self, key, pickled: bytes):
+        disk_cache = self._disk_cache()
+        if not disk_cache:
+            return
+        try:
+            disk_cache.put(repr(key), pickled)
+        except PermissionError as pe:
+            self._disable_dir(pe)
+        except OSError as ose:
+            verbose('failed to write parsed file cache: {e}'.format(e=ose))
+
+
+# on-disk caching is opt-in (stale entries are only evicted once the size limit is reached)
+YAML_CACHE_DIR_ENV_VAR = 'CC_YAML_CACHE_DIR'
+_parsed_yaml_files = ParsedFileCache(cache_dir=os.environ.get(YAML_CACHE_DIR_ENV_VAR))
+
+
+def is_yaml_file(path: CliHints.existing_file()):
+    try:
+        if _parsed_yaml_files.load(path, parse=load_yaml):
+            return True
+    except:
+        warning('an error occurred whilst trying to parse {f}'.format(f=path))
+        raise
     return False
 
 
 def parse_yaml_file(path: CliHints.existing_file(), as_snd=True):
-    with open(path) as f:
-        if as_snd:
-            return SimpleNamespaceDict(yaml.load(f))
-        else:
-            return yaml.load(f)
+    parsed = _parsed_yaml_files.load(path, parse=load_yaml)
+    if as_snd:
+        return SimpleNamespaceDict(parsed)
+    else:
+        return parsed
 
 
 def urljoin(*parts):
@@ -195,34 +574,262 @@ def which(cmd_name: str) -> str:
     return cmd_path
 
 
-def merge_dicts(base: dict, other: dict, list_semantics='set_merge'):
+def merge_dicts(base: dict, other: dict, list_semantics='set_merge', copy: bool=True):
     '''
-    merges copies of the given dict instances and returns the merge result.
-    The arguments remain unmodified. However, it must be possible to copy them
-    using `copy.deepcopy`.
+    merges the given dict instances and returns the merge result. The arguments remain
+    unmodified.
 
-    Merging is done using the `deepmerge` module. In case of merge conflicts, values from
-    `other` overwrite values from `base`.
+    Dicts are merged recursively. In case of merge conflicts, values from `other` overwrite
+    values from `base`.
 
-    By default, different from the original implementation, a "set-merge" will be applied to
-    lists. This results in deduplication and potential change of element order, which may be
-    undesired. In this case, set `list_semantics` to 'None'
+    By default, a "set-merge" will be applied to lists. This results in deduplication (elements
+    from `base` first, followed by new elements from `other`). Set `list_semantics` to `None`
+    to concatenate lists instead.
 
+    By default, the result is independent from the arguments (which must thus be copyable
+    using `copy.deepcopy`). If `copy` is `False`, all subtrees not modified by the merge are
+    shared with the arguments instead of being copied (which is considerably faster). In this
+    case, the result must not be modified in place.
     '''
     ensure_not_none(base)
     ensure_not_none(other)
 
-    from deepmerge import Merger
+    if list_semantics not in ('set_merge', None):
+        raise ValueError('unsupported list semantics: ' + str(list_semantics))
 
-    if list_semantics == 'set_merge':
-        # monkey-patch merge-strategy for lists
-        list_merge_strategy = Merger.PROVIDED_TYPE_STRATEGIES[list]
-        list_merge_strategy.strategy_merge = lambda c, p, base, other: list(set(base) | set(other))
+    from copy import deepcopy
+    take = deepcopy if copy else lambda value: value
+
+    return _merge(base, other, list_semantics, take)
+
+
+def _merge(base, other, list_semantics, take):
+    if isinstance(base, dict) and isinstance(other, dict):
+        import copy
+        # shallow copy (preserving dict subclasses), overwriting the entries to be merged
+        merged = copy.copy(base)
+        for key, value in base.items():
+            if key not in other:
+                merged[key] = take(value)
+        for key, value in other.items():
+            if key in base:
+                merged[key] = _merge(base[key], value, list_semantics, take)
+            else:
+                merged[key] = take(value)
+        return merged
+    if isinstance(base, list) and isinstance(other, list):
+        if list_semantics is None:
+            return [take(e) for e in base] + [take(e) for e in other]
+        merged = []
+        seen = set()
+        for element in base + other:
+            try:
+                if element in seen:
+                    continue
+                seen.add(element)
+            except TypeError:
+                # unhashable element (e.g. a dict)
+                if element in merged:
+                    continue
+            merged.append(take(element))
+        return merged
+    # conflicting types or scalar values: override
+    return take(other)
+
+
+
+class BulkExecutionError(RuntimeError):
+    '''
+    raised by `BoundedExecutor.map` in collect-all mode if any item failed. `errors` holds
+    (item, exception) pairs in item order.
+    '''
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('{n} operation(s) failed: {e}'.format(
+            n=len(errors),
+            e='; '.join(str(e) for _, e in errors),
+            )
+        )
 
-        strategy_cfg = [(list, ['merge']), (dict, ['merge'])]
-        merger = Merger(strategy_cfg, ['override'], ['override'])
 
-    from copy import deepcopy
-    # copy dicts, so they remain unmodified
-    return merger.merge(deepcopy(base), deepcopy(other))
+# default for BoundedExecutor's max_workers (overridden by the global --max-workers option)
+MAX_WORKERS_ENV_VAR = 'CC_MAX_WORKERS'
 
+
+class BoundedExecutor(object):
+    '''
+    Runs a function for many independent items (typically remote operations) in a bounded
+    thread pool. Results are streamed in item order.
+
+    @param max_workers: max. number of concurrently processed items (default: global
+        `--max-workers` option, `$CC_MAX_WORKERS` or `DEFAULT_MAX_WORKERS`)
+    @param per_host_limit: max. number of concurrently processed items per host (see `map`)
+    @param fail_fast: if `True`, the first failure cancels all items not yet started and is
+        re-raised; otherwise, all items are processed and failures are raised afterwards,
+        aggregated into a `BulkExecutionError`
+
+    Instances are intended to be used for a single bulk operation (cancellation is final).
+    '''
+    # bulk operations run sequentially unless more workers are configured
+    DEFAULT_MAX_WORKERS = 1
+    DEFAULT_PER_HOST_LIMIT = None
+
+    def __init__(
+        self,
+        max_workers: int=None,
+        per_host_limit: int=DEFAULT_PER_HOST_LIMIT,
+        fail_fast: bool=True,
+    ):
+        if max_workers is None:
+            max_workers = self._default_max_workers()
+        if max_workers < 1:
+            raise ValueError('max_workers must be at least 1')
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.fail_fast = fail_fast
+        self._cancelled = threading.Event()
+        self._failure = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _default_max_workers():
+        max_workers = getattr(ctx().args, 'max_workers', None)
+        if max_workers:
+            return max_workers
+        value = os.environ.get(MAX_WORKERS_ENV_VAR)
+        if value:
+            try:
+                if int(value) >= 1:
+                    return int(value)
+            except ValueError:
+                pass
+            warning('ignoring invalid {n}: {v}'.format(n=MAX_WORKERS_ENV_VAR, v=value))
+        return BoundedExecutor.DEFAULT_MAX_WORKERS
+
+    def cancel(self):
+        '''
+        prevents all items that were not started yet from being processed
+        '''
+        self._cancelled.set()
+
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def _process(self, function, item):
+        from concurrent.futures import CancelledError
+
+        try:
+            if self.cancelled():
+                raise CancelledError()
+            return function(item)
+        except BaseException as e: # also cancel upon util.fail in cli mode (SystemExit)
+            if self.fail_fast and not isinstance(e, CancelledError):
+                with self._lock:
+                    if not self._failure:
+                        self._failure = e
+                self.cancel()
+            raise
+
+    def map(self, function, items, host=None):
+        '''
+        calls `function` for each of the given items and yields the results in item order.
+        `items` may be a generator; it is consumed while earlier items are being processed
+        (at most twice `max_workers` items are submitted but not yet yielded).
+
+        @param host: optional callable returning the host an item is processed against
+            (used for per-host limits). Items exceeding their host's limit are queued and
+            submitted once an item of the same host completes, so they do not occupy workers.
+        '''
+        from collections import deque
+        from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+
+        errors = []
+        max_pending = 2 * self.max_workers
+        running_per_host = {}
+        queued_per_host = {}
+
+        def result_of(item, future):
+            try:
+                return True, future.result()
+            except CancelledError:
+                if self._failure:
+                    raise self._failure
+                raise
+            # Failure is rebound to a SystemExit subclass by _set_cli - still collect those
+            except (Exception, Failure) as e:
+                if self.fail_fast:
+                    raise
+                errors.append((item, e))
+                return False, None
+
+        def submit(item, future):
+            try:
+                executor_future = executor.submit(self._process, function, item)
+            except RuntimeError: # executor was shut down (consumer stopped iterating)
+                future.set_exception(CancelledError())
+                return
+            executor_future.add_done_callback(
+                lambda f: completed(host(item), future, f)
+            )
+
+        def completed(host_name, future, executor_future):
+            if executor_future.cancelled():
+                future.set_exception(CancelledError())
+            elif executor_future.exception() is not None:
+                future.set_exception(executor_future.exception())
+            else:
+                future.set_result(executor_future.result())
+            with self._lock:
+                queued = queued_per_host.get(host_name)
+                if queued:
+                    item, next_future = queued.popleft()
+                else:
+                    running_per_host[host_name] -= 1
+                    return
+            submit(item, next_future)
+
+        def schedule(item):
+            if not host or not self.per_host_limit:
+                return executor.submit(self._process, function, item)
+            future = Future()
+            host_name = host(item)
+            with self._lock:
+                if running_per_host.get(host_name, 0) >= self.per_host_limit:
+                    queued_per_host.setdefault(host_name, deque()).append((item, future))
+                    return future
+                running_per_host[host_name] = running_per_host.get(host_name, 0) + 1
+            submit(item, future)
+            return future
+
+        pending = deque()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            for item in items:
+                if self.cancelled():
+                    break
+                pending.append((item, schedule(item)))
+                while pending and (pending[0][1].done() or len(pending) >= max_pending):
+                    succeeded, result = result_of(*pending.popleft())
+                    if succeeded:
+                        yield result
+            while pending:
+                succeeded, result = result_of(*pending.popleft())
+                if succeeded:
+                    yield result
+            if self.cancelled():
+                if self._failure:
+                    raise self._failure
+                raise CancelledError()
+        finally:
+            # also reached if the consumer stops iterating early
+            if pending:
+                self.cancel()
+            executor.shutdown(wait=True)
+            # items still queued for their host are not started anymore
+            for queued in queued_per_host.values():
+                for _, future in queued:
+                    if not future.done():
+                        future.set_exception(CancelledError())
+
+        if errors:
+            raise BulkExecutionError(errors)